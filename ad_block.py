@@ -0,0 +1,172 @@
+"""
+Блокировка рекламы и трекеров: списки доменов (hosts, adblock, просто
+домены — тот же разбор, что у импорта исключений) собираются в одно
+правило, компилируются в rule-set через RuleSetCache и ведут в block
+(или action reject). Разобранные списки лежат на диске и обновляются
+в фоне — подключение их не качает, кроме самого первого раза.
+
+BlockStats считает заблокированные запросы за сеанс по логу sing-box —
+только для outbound block, он пишет их на info. Action reject пишет их
+лишь на debug, а лог на debug весь сеанс — это кратно больше строк
+через весь конвейер лога; в этом режиме счётчика нет (GUI: «н/д»).
+Сэкономленный объём — оценка по среднему рекламному запросу: средний
+объём всех соединений сеанса раздувают загрузки и видео.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from domains import domain_rule, normalize_domains
+from exclusion_import import import_exclusions
+
+BLOCK_DIR = "block_lists"
+BLOCK_REFRESH_INTERVAL = 24 * 3600
+BLOCK_RETRY_DELAY = 30 * 60
+BLOCK_RULE_SET = "vlf-block"
+DEFAULT_BLOCK_LISTS = [
+    "https://raw.githubusercontent.com/StevenBlack/hosts/master/hosts",
+]
+# средний запрос рекламы/трекера (скрипт, пиксель, баннер)
+BLOCKED_REQUEST_BYTES = 20 * 1024
+
+# outbound block: «blocked connection to …» (info)
+_BLOCK_MARKER = "blocked connection"
+
+
+def _noop(*_args):
+    pass
+
+
+class BlockLists:
+    """
+    load(sources) → правило {"domain": …, "domain_suffix": …} или None.
+    Кэш — по набору источников: поменяли список URL — собираем заново.
+    """
+
+    def __init__(self, cache_dir=BLOCK_DIR, interval=BLOCK_REFRESH_INTERVAL, log=None):
+        self.cache_dir = Path(cache_dir)
+        self.interval = interval
+        self.log = log or _noop
+        self._lock = threading.Lock()
+        self._memo = None       # (путь, mtime, правило)
+        self._failed_at = 0.0
+        self._stop = threading.Event()
+
+    def _path(self, sources):
+        key = hashlib.sha256("\n".join(sources).encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir / f"{key}.json"
+
+    def _read(self, path):
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            return None
+        memo = self._memo
+        if memo and memo[0] == path and memo[1] == mtime:
+            return memo[2]
+        try:
+            rule = json.loads(path.read_text(encoding="utf-8"))["rule"]
+        except Exception:
+            return None
+        self._memo = (path, mtime, rule)
+        return rule
+
+    def load(self, sources):
+        """Правило из кэша; нет кэша — собираем сейчас (первое подключение)."""
+        if not sources:
+            return None
+        rule = self._read(self._path(sources))
+        if rule is None and time.time() - self._failed_at > BLOCK_RETRY_DELAY:
+            self.build(sources)
+            rule = self._read(self._path(sources))
+        return rule or None
+
+    def stale(self, sources):
+        try:
+            age = time.time() - self._path(sources).stat().st_mtime
+        except OSError:
+            return True
+        return age > self.interval
+
+    def build(self, sources) -> bool:
+        """Скачать и разобрать все списки; True — правило изменилось."""
+        with self._lock:
+            t0 = time.monotonic()
+            sites = []
+            ok = 0
+            for source in sources:
+                self.log(f"Блок-лист: загружаю {source}\n")
+                try:
+                    result = import_exclusions([source], existing_sites=sites)
+                except Exception as e:
+                    self.log(f"Блок-лист {source}: не загружен ({e})\n")
+                    continue
+                ok += 1
+                sites.extend(result.sites)
+            if not ok:
+                self._failed_at = time.time()
+                return False
+            domains, suffixes, report = normalize_domains(sites)
+            rule = domain_rule(domains, suffixes)
+            path = self._path(sources)
+            old = self._read(path)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(
+                json.dumps({"sources": sources, "rule": rule}, ensure_ascii=False),
+                encoding="utf-8",
+            )
+            os.replace(tmp, path)
+            self.log(
+                f"Блок-лист: {report.describe()} за "
+                f"{time.monotonic() - t0:.1f} с\n"
+            )
+            return rule != old
+
+    def start(self, get_sources, on_update=None):
+        """
+        Фоновое обновление. get_sources() — текущий список (или пустой,
+        если блокировка выключена); on_update(теги) — правило изменилось
+        (та же подпись, что у GeoRuleSets.start).
+        """
+        on_update = on_update or _noop
+
+        def run():
+            while not self._stop.wait(60.0):
+                sources = get_sources()
+                if not sources or not self.stale(sources):
+                    continue
+                if time.time() - self._failed_at < BLOCK_RETRY_DELAY:
+                    continue
+                if self.build(sources):
+                    on_update([BLOCK_RULE_SET])
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class BlockStats:
+    """
+    Заблокированные запросы за сеанс. Строки лога приходят из потока
+    чтения sing-box — там только счётчик, без разбора всей строки.
+    """
+
+    def __init__(self):
+        self.blocked = 0
+
+    def reset(self):
+        self.blocked = 0
+
+    def add_lines(self, lines):
+        for line in lines:
+            if _BLOCK_MARKER in line:
+                self.blocked += 1
+
+    def saved_bytes(self):
+        """Оценка: запросов × BLOCKED_REQUEST_BYTES."""
+        return self.blocked * BLOCKED_REQUEST_BYTES
@@ -0,0 +1,332 @@
+"""
+Статистика туннеля через Clash API sing-box (experimental.clash_api).
+/traffic — поток JSON-строк раз в секунду (скорость), /connections —
+снимок соединений и суммарный трафик. Опрос в фоновых потоках,
+GUI по таймеру забирает последнее состояние и новые точки графика.
+Таблица соединений обновляется диффом по id соединения.
+"""
+import json
+import ntpath
+import os
+import re
+import secrets
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from array import array
+from datetime import datetime
+
+CLASH_API_PORT = 9090       # слоту TUN N — порт CLASH_API_PORT + N, если свободен
+CONNECTIONS_INTERVAL = 2.0
+RECONNECT_DELAY = 1.0
+STREAM_TIMEOUT = 5.0        # /traffic шлёт строку раз в секунду
+GRAPH_SAMPLES = 120         # точек на графике (секунд истории)
+
+
+def new_secret() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def free_port(preferred: int) -> int:
+    """
+    preferred, если он свободен на 127.0.0.1, иначе любой свободный:
+    занятый порт Clash API не даёт sing-box запуститься вовсе.
+    """
+    for port in (preferred, 0):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            # как у самого sing-box: TIME_WAIT старых соединений не мешает
+            # (на Windows SO_REUSEADDR разрешил бы занять чужой порт)
+            if os.name != "nt":
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("127.0.0.1", port))
+            return sock.getsockname()[1]
+        except OSError:
+            continue
+        finally:
+            sock.close()
+    return preferred
+
+
+def clash_api_config(port: int, secret: str) -> dict:
+    """Блок experimental.clash_api: только localhost, с секретом."""
+    return {"external_controller": f"127.0.0.1:{port}", "secret": secret}
+
+
+def format_rate(bps: float) -> str:
+    return format_bytes(bps) + "/с"
+
+
+def format_bytes(n: float) -> str:
+    for unit in ("Б", "КБ", "МБ", "ГБ"):
+        if n < 1024 or unit == "ГБ":
+            return f"{n:.0f} {unit}" if unit == "Б" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} ТБ"
+
+
+class TrafficSamples:
+    """
+    Кольцевой буфер точек (up, down) фиксированного размера.
+    seq — сквозной номер последней точки: по нему GUI дорисовывает
+    только новые точки, а не весь график.
+    """
+
+    def __init__(self, capacity=GRAPH_SAMPLES):
+        self.capacity = capacity
+        self.up = array("d", [0.0]) * capacity
+        self.down = array("d", [0.0]) * capacity
+        self.seq = 0
+
+    def append(self, up, down):
+        i = self.seq % self.capacity
+        self.up[i] = up
+        self.down[i] = down
+        self.seq += 1
+
+    def since(self, seq):
+        """Точки с номерами (seq, self.seq] — не больше capacity штук."""
+        first = max(seq, self.seq - self.capacity)
+        cap = self.capacity
+        return [
+            (self.up[n % cap], self.down[n % cap]) for n in range(first, self.seq)
+        ]
+
+
+def format_duration(seconds: float) -> str:
+    # грубо для старых соединений — строка не меняется каждую секунду,
+    # и дифф таблицы не трогает такие ряды
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds} с"
+    if seconds < 3600:
+        return f"{seconds // 60} мин"
+    return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+
+
+_FRACTION = re.compile(r"(\.\d{6})\d+")
+
+
+def parse_clash_time(value: str) -> float:
+    """RFC 3339 из Go (наносекунды, Z) → unix time; 0.0 если не разобрали."""
+    if not value:
+        return 0.0
+    value = _FRACTION.sub(r"\1", value.replace("Z", "+00:00"))
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return 0.0
+
+
+CONNECTION_COLUMNS = ("process", "host", "rule", "outbound", "up", "down", "duration")
+
+
+def connection_row(conn: dict, started: float, now: float) -> tuple:
+    """Соединение из /connections → значения колонок таблицы."""
+    meta = conn.get("metadata") or {}
+    process = ntpath.basename(meta.get("processPath") or "") or "-"
+    host = meta.get("host") or meta.get("destinationIP") or "?"
+    port = meta.get("destinationPort")
+    if port:
+        host = f"{host}:{port}"
+    network = meta.get("network")
+    if network:
+        host = f"{host} ({network})"
+    rule = conn.get("rule") or ""
+    payload = conn.get("rulePayload")
+    if payload:
+        rule = f"{rule} {payload}"
+    chains = conn.get("chains") or []
+    return (
+        process,
+        host,
+        rule or "final",
+        " ← ".join(chains) or "-",
+        format_bytes(conn.get("upload", 0)),
+        format_bytes(conn.get("download", 0)),
+        format_duration(now - started) if started else "-",
+    )
+
+
+class ConnectionTable:
+    """
+    Последнее отображённое состояние таблицы: id → значения колонок.
+    update() возвращает только разницу — что вставить, изменить, удалить.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self._started = {}      # id → время начала (разбираем один раз)
+        self._marks = {}        # id → (upload, download, длительность)
+
+    def update(self, connections, now=None):
+        now = time.time() if now is None else now
+        rows = self.rows
+        started = self._started
+        marks = self._marks
+        added = []
+        changed = []
+        seen = set()
+        for conn in connections:
+            cid = conn.get("id")
+            if not cid:
+                continue
+            seen.add(cid)
+            start = started.get(cid)
+            if start is None:
+                start = started[cid] = parse_clash_time(conn.get("start", ""))
+            # хост/правило/цепочка у живого соединения не меняются —
+            # ряд пересобираем, только если сдвинулись байты или время
+            mark = (
+                conn.get("upload", 0),
+                conn.get("download", 0),
+                format_duration(now - start) if start else "-",
+            )
+            if marks.get(cid) == mark:
+                continue
+            marks[cid] = mark
+            values = connection_row(conn, start, now)
+            if cid in rows:
+                changed.append((cid, values))
+            else:
+                added.append((cid, values))
+            rows[cid] = values
+        removed = [cid for cid in rows if cid not in seen]
+        for cid in removed:
+            del rows[cid]
+            started.pop(cid, None)
+            marks.pop(cid, None)
+        return added, changed, removed
+
+
+class TrafficStats:
+    __slots__ = ("up", "down", "up_total", "down_total", "connections",
+                 "updated_at", "error")
+
+    def __init__(self):
+        self.up = 0.0
+        self.down = 0.0
+        self.up_total = 0
+        self.down_total = 0
+        self.connections = []
+        self.updated_at = 0.0
+        self.error = ""
+
+    def describe(self):
+        return (
+            f"↑ {format_rate(self.up)}  ↓ {format_rate(self.down)}   "
+            f"всего ↑ {format_bytes(self.up_total)} ↓ {format_bytes(self.down_total)}   "
+            f"соединений {len(self.connections)}"
+        )
+
+
+class ClashApiPoller:
+    """
+    Два потока: чтение потока /traffic и опрос /connections.
+    При ошибке ждём RECONNECT_DELAY и пробуем снова, пока не stop().
+    """
+
+    def __init__(self, controller, secret, samples=GRAPH_SAMPLES,
+                 interval=CONNECTIONS_INTERVAL):
+        self.controller = controller
+        self.secret = secret
+        self.interval = interval
+        self.stats = TrafficStats()
+        self.samples = TrafficSamples(samples)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stream = None
+        self._threads = [
+            threading.Thread(target=self._traffic_loop, daemon=True),
+            threading.Thread(target=self._connections_loop, daemon=True),
+        ]
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        self._close_stream()
+
+    def retarget(self, controller):
+        """sing-box переехал (горячая замена на другом слоте)."""
+        self.controller = controller
+        self._close_stream()
+
+    def snapshot(self, seq=0):
+        """(копия статистики, новые точки после seq, текущий seq)."""
+        with self._lock:
+            stats = TrafficStats()
+            for name in TrafficStats.__slots__:
+                setattr(stats, name, getattr(self.stats, name))
+            return stats, self.samples.since(seq), self.samples.seq
+
+    # ---------- внутреннее ----------
+
+    def _request(self, path, timeout):
+        req = urllib.request.Request(
+            f"http://{self.controller}{path}",
+            headers={"Authorization": f"Bearer {self.secret}"},
+        )
+        return urllib.request.urlopen(req, timeout=timeout)
+
+    def close_connection(self, conn_id):
+        """DELETE /connections/{id}; зовём из рабочего потока."""
+        req = urllib.request.Request(
+            f"http://{self.controller}/connections/{urllib.parse.quote(conn_id)}",
+            method="DELETE",
+            headers={"Authorization": f"Bearer {self.secret}"},
+        )
+        with urllib.request.urlopen(req, timeout=STREAM_TIMEOUT):
+            pass
+
+    def _close_stream(self):
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _set_error(self, e):
+        with self._lock:
+            self.stats.error = str(e) or e.__class__.__name__
+
+    def _traffic_loop(self):
+        while not self._stop.is_set():
+            try:
+                with self._request("/traffic", STREAM_TIMEOUT) as resp:
+                    self._stream = resp
+                    for raw in resp:
+                        if self._stop.is_set():
+                            break
+                        data = json.loads(raw)
+                        with self._lock:
+                            self.stats.up = float(data.get("up", 0))
+                            self.stats.down = float(data.get("down", 0))
+                            self.stats.updated_at = time.time()
+                            self.stats.error = ""
+                            self.samples.append(self.stats.up, self.stats.down)
+            except (OSError, ValueError, urllib.error.URLError) as e:
+                if not self._stop.is_set():
+                    self._set_error(e)
+            finally:
+                self._stream = None
+            self._stop.wait(RECONNECT_DELAY)
+
+    def _connections_loop(self):
+        while not self._stop.is_set():
+            try:
+                with self._request("/connections", STREAM_TIMEOUT) as resp:
+                    data = json.loads(resp.read())
+                with self._lock:
+                    self.stats.up_total = int(data.get("uploadTotal", 0))
+                    self.stats.down_total = int(data.get("downloadTotal", 0))
+                    self.stats.connections = data.get("connections") or []
+            except (OSError, ValueError, urllib.error.URLError) as e:
+                self._set_error(e)
+            self._stop.wait(self.interval)
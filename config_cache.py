@@ -0,0 +1,156 @@
+"""
+Кэш сгенерированных конфигов sing-box по хэшу содержимого.
+Одинаковый конфиг не переписываем на диск, а `sing-box check`
+запускаем один раз на каждый новый конфиг и запоминаем вердикт.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+CONFIG_CACHE_DIR = "singbox_configs"
+CONFIG_CACHE_KEEP = 20          # сколько последних конфигов держим на диске
+CHECK_TIMEOUT = 15.0
+
+# переменные окружения, без которых sing-box ругается на старый формат
+SINGBOX_ENV = {
+    "ENABLE_DEPRECATED_TUN_ADDRESS_X": "true",
+    "ENABLE_DEPRECATED_DNS_SERVER_FORMAT": "true",
+    "ENABLE_DEPRECATED_SPECIAL_OUTBOUNDS": "true",
+}
+
+
+def singbox_env():
+    env = os.environ.copy()
+    env.update(SINGBOX_ENV)
+    return env
+
+
+def popen_window_flags():
+    """(creationflags, startupinfo) — чтобы на Windows не мигала консоль."""
+    if os.name != "nt":
+        return 0, None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return subprocess.CREATE_NO_WINDOW, startupinfo
+
+
+class ConfigError(ValueError):
+    """sing-box check отверг конфиг."""
+
+
+class CachedConfig:
+    __slots__ = ("path", "digest", "reused", "checked")
+
+    def __init__(self, path, digest, reused, checked):
+        self.path = path
+        self.digest = digest
+        self.reused = reused      # файл уже был, ничего не писали
+        self.checked = checked    # вердикт есть (новый или из кэша)
+
+
+def config_digest(config: dict) -> tuple:
+    """Канонический компактный JSON и его sha256."""
+    data = json.dumps(
+        config, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    ).encode("utf-8")
+    return data, hashlib.sha256(data).hexdigest()[:24]
+
+
+class ConfigCache:
+    def __init__(self, cache_dir=CONFIG_CACHE_DIR, keep=CONFIG_CACHE_KEEP):
+        self.cache_dir = Path(cache_dir)
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def _binary_id(self, sing_box_exe):
+        # вердикт зависит от версии sing-box — привязываемся к самому файлу
+        try:
+            st = Path(sing_box_exe).stat()
+            return f"{st.st_size}:{int(st.st_mtime)}"
+        except OSError:
+            return None
+
+    def _check(self, sing_box_exe, path):
+        creationflags, startupinfo = popen_window_flags()
+        try:
+            res = subprocess.run(
+                [str(sing_box_exe), "check", "-c", str(path)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                env=singbox_env(),
+                timeout=CHECK_TIMEOUT,
+                creationflags=creationflags,
+                startupinfo=startupinfo,
+            )
+        except subprocess.TimeoutExpired:
+            return None   # не знаем — решит sing-box run
+        return {"ok": res.returncode == 0, "error": res.stdout.strip()}
+
+    def prepare(self, config: dict, sing_box_exe=None) -> CachedConfig:
+        """
+        Кладём конфиг в кэш (если такого ещё нет) и проверяем его.
+        Плохой конфиг → ConfigError сразу, без запуска sing-box.
+        """
+        data, digest = config_digest(config)
+        path = self.cache_dir / f"{digest}.json"
+        verdict_path = self.cache_dir / f"{digest}.check.json"
+
+        with self._lock:
+            reused = path.exists()
+            if reused:
+                try:
+                    os.utime(path)   # для очистки по давности
+                except OSError:
+                    pass
+            else:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(path.name + ".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+                self._prune()
+
+        binary = self._binary_id(sing_box_exe) if sing_box_exe else None
+        if binary is None:
+            return CachedConfig(path, digest, reused, False)
+
+        verdict = None
+        try:
+            verdict = json.loads(verdict_path.read_text(encoding="utf-8"))
+            if verdict.get("binary") != binary:
+                verdict = None
+        except Exception:
+            pass
+
+        if verdict is None:
+            verdict = self._check(sing_box_exe, path)
+            if verdict is None:
+                return CachedConfig(path, digest, reused, False)
+            verdict["binary"] = binary
+            try:
+                verdict_path.write_text(
+                    json.dumps(verdict, ensure_ascii=False), encoding="utf-8"
+                )
+            except OSError:
+                pass
+
+        if not verdict.get("ok"):
+            raise ConfigError(verdict.get("error") or "sing-box check failed")
+        return CachedConfig(path, digest, reused, True)
+
+    def _prune(self):
+        configs = sorted(
+            (p for p in self.cache_dir.glob("*.json")
+             if not p.name.endswith(".check.json")),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True,
+        )
+        for old in configs[self.keep:]:
+            for p in (old, old.with_name(old.stem + ".check.json")):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
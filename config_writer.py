@@ -0,0 +1,164 @@
+"""
+Запись настроек в фоне (write-behind).
+save() только помечает конфиг изменённым; когда правки стихли на
+WRITE_DELAY секунд, снимок делается в потоке, который правит настройки
+(GUI — по таймеру after), а на диск его пишет отдельный поток — пачка
+правок даёт одну запись. Файл пишется во временный рядом и подменяется
+os.replace: обрыв посреди записи оставляет прежний vlf_gui_config.json
+целым.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+WRITE_DELAY = 0.5
+RETRY_DELAY_MAX = 30.0
+
+
+def write_text_atomic(path, text):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def dump_config(data, indent=2):
+    return json.dumps(data, ensure_ascii=False, indent=indent)
+
+
+def write_json_atomic(path, data, indent=2):
+    write_text_atomic(path, dump_config(data, indent))
+
+
+def _noop(*_args):
+    pass
+
+
+class ConfigWriter:
+    """
+    data правится в потоке GUI без блокировок, поэтому json.dumps идёт
+    там же: schedule(мс, функция) — таймер этого потока (Tk.after), по нему
+    снимаем текст целиком, а поток записи делает только файловый ввод-вывод.
+    Без schedule снимок делается прямо в save().
+    on_error(текст) — из потока записи или из снимка, один раз на серию неудач.
+    """
+
+    def __init__(self, data: dict, path, delay=WRITE_DELAY, on_error=None,
+                 schedule=None):
+        self.data = data
+        self.path = path
+        self.delay = delay
+        self.on_error = on_error or _noop
+        self.schedule = schedule
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._generation = 0        # номер последней правки
+        self._snapshot_gen = 0      # поколение, с которого снят текст
+        self._written = 0           # поколение, которое уже на диске
+        self._text = None           # последний снимок, ещё не записанный
+        self._due = 0.0             # monotonic, раньше которого не снимаем
+        self._timer = False         # таймер снимка уже стоит
+        self._retry_at = 0.0        # после неудачной записи
+        self._failures = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def dirty(self):
+        return self._written != self._generation
+
+    def save(self):
+        """Правка настроек; зовём из потока, который их меняет."""
+        self._generation += 1
+        self._due = time.monotonic() + self.delay
+        if self.schedule is None:
+            self._snapshot()
+        elif not self._timer:
+            self._timer = True
+            self.schedule(int(self.delay * 1000), self._on_timer)
+
+    def flush(self):
+        """Снять и записать немедленно в текущем потоке (при выходе)."""
+        if self._snapshot_gen != self._generation:
+            self._take_snapshot()
+        self._write()
+        return not self.dirty
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=2)
+        return self.flush()
+
+    # ---------- внутреннее ----------
+
+    def _on_timer(self):
+        # правки ещё идут — ждём, пока стихнут (без отмены таймера)
+        wait = self._due - time.monotonic()
+        if wait > 0:
+            self.schedule(int(wait * 1000) + 1, self._on_timer)
+            return
+        self._timer = False
+        self._snapshot()
+
+    def _snapshot(self):
+        if not self._closed:
+            self._take_snapshot()
+
+    def _take_snapshot(self):
+        generation = self._generation
+        try:
+            text = dump_config(self.data)
+        except (TypeError, ValueError) as e:
+            self.on_error(f"Не удалось сохранить настройки: {e}")
+            return
+        with self._cond:
+            self._text = text
+            self._snapshot_gen = generation
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._text is None:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                wait = self._retry_at - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+            self._write()
+
+    def _write(self):
+        with self._write_lock:
+            with self._cond:
+                text, generation = self._text, self._snapshot_gen
+            if text is None:
+                return
+            try:
+                write_text_atomic(self.path, text)
+            except OSError as e:
+                self._failures += 1
+                if self._failures == 1:
+                    self.on_error(f"Не удалось сохранить настройки: {e}")
+                with self._cond:
+                    self._retry_at = time.monotonic() + min(
+                        RETRY_DELAY_MAX, self.delay * 2 ** self._failures
+                    )
+                return
+            if self._failures:
+                self.on_error("Настройки снова сохраняются.")
+                self._failures = 0
+            with self._cond:
+                # пока писали, мог прийти снимок новее — его оставляем
+                if self._text is text:
+                    self._text = None
+                self._written = max(self._written, generation)
@@ -0,0 +1,103 @@
+"""
+Окно со списком активных соединений туннеля (Clash API /connections).
+Каждое обновление — дифф по id: вставляем новые ряды, правим только
+изменившиеся, удаляем закрытые. Тысячи соединений не перерисовываются
+целиком раз в пару секунд.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+from clash_api import CONNECTION_COLUMNS, ConnectionTable
+
+COLUMN_TITLES = {
+    "process": ("Процесс", 120),
+    "host": ("Хост", 220),
+    "rule": ("Правило", 150),
+    "outbound": ("Outbound", 120),
+    "up": ("↑", 70),
+    "down": ("↓", 70),
+    "duration": ("Время", 70),
+}
+
+
+class ConnectionsWindow(tk.Toplevel):
+    """
+    on_close_connections(ids) — закрыть выбранные соединения
+    (вызывается из GUI-потока, сеть — на стороне вызывающего).
+    """
+
+    def __init__(self, master, on_close_connections, bg, panel, fg):
+        super().__init__(master)
+        self.title("Соединения")
+        self.configure(bg=bg)
+        self.geometry("900x420")
+        self.on_close_connections = on_close_connections
+        self.table = ConnectionTable()
+
+        style = ttk.Style(self)
+        style.configure(
+            "Conn.Treeview",
+            background=panel,
+            fieldbackground=panel,
+            foreground=fg,
+            borderwidth=0,
+        )
+        style.configure("Conn.Treeview.Heading", background=bg, foreground=fg)
+
+        self.summary_var = tk.StringVar(value="")
+        top = tk.Frame(self, bg=bg)
+        top.pack(fill="x", padx=8, pady=(8, 4))
+        tk.Label(
+            top, textvariable=self.summary_var, bg=bg, fg=fg, anchor="w"
+        ).pack(side="left", fill="x", expand=True)
+        ttk.Button(
+            top,
+            text="Закрыть соединение",
+            style="Accent.TButton",
+            command=self._close_selected,
+        ).pack(side="right")
+
+        wrap = tk.Frame(self, bg=bg)
+        wrap.pack(fill="both", expand=True, padx=8, pady=(0, 8))
+        self.tree = ttk.Treeview(
+            wrap,
+            columns=CONNECTION_COLUMNS,
+            show="headings",
+            style="Conn.Treeview",
+            selectmode="extended",
+        )
+        for col in CONNECTION_COLUMNS:
+            title, width = COLUMN_TITLES[col]
+            anchor = "e" if col in ("up", "down", "duration") else "w"
+            self.tree.heading(col, text=title)
+            self.tree.column(col, width=width, anchor=anchor, stretch=col == "host")
+        scroll = ttk.Scrollbar(wrap, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scroll.pack(side="right", fill="y")
+        self.tree.bind("<Delete>", lambda _e: self._close_selected())
+
+        self._source = None     # список из последнего снимка — не диффаем повторно
+
+    def update_connections(self, connections):
+        # поллер заменяет список целиком, так что тот же объект = без изменений
+        if connections is self._source:
+            return
+        self._source = connections
+        added, changed, removed = self.table.update(connections)
+        tree = self.tree
+        if removed:
+            tree.delete(*removed)
+        for cid, values in changed:
+            tree.item(cid, values=values)
+        for cid, values in added:
+            tree.insert("", "end", iid=cid, values=values)
+        self.summary_var.set(
+            f"Активных: {len(self.table.rows)}   "
+            f"+{len(added)} ~{len(changed)} -{len(removed)} за обновление"
+        )
+
+    def _close_selected(self):
+        ids = list(self.tree.selection())
+        if ids:
+            self.on_close_connections(ids)
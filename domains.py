@@ -0,0 +1,188 @@
+"""
+Нормализация исключений по доменам перед сборкой правил sing-box.
+
+    example.com, .example.com, *.example.com, domain:example.com
+        → domain_suffix example.com (сам домен и все поддомены)
+    full:example.com, =example.com
+        → domain example.com (только он)
+
+Всё приводится к нижнему регистру и IDNA (xn--…): sing-box сравнивает
+с SNI/Host, а там всегда ASCII. Схема, путь и порт из вставленного URL
+отбрасываются (только у записи со схемой: «a.com/x» без неё — опечатка,
+а не URL). IP-адреса — не домены, им место в ip_exclusions. Записи, уже покрытые более широким суффиксом (в том
+числе RU-режимом), выкидываются — проверка по trie из меток домена
+в обратном порядке (com → example → www), O(число меток) на запись.
+"""
+import re
+
+# RU-режим: суффиксы, которые и так идут напрямую
+RU_SUFFIXES = ("ru", "su", "xn--p1ai")   # xn--p1ai — .рф
+
+_LABEL = re.compile(r"^(?!-)[a-z0-9_-]{1,63}(?<!-)$")
+# уже нормальный хост без префиксов — самый частый случай, одной проверкой
+_PLAIN = re.compile(r"(?:(?!-)[a-z0-9_-]{1,63}(?<!-)\.)+(?!-)[a-z0-9_-]{1,63}(?<!-)")
+_SUFFIX_PREFIXES = ("domain:", "*.", ".")
+_EXACT_PREFIXES = ("full:", "=")
+_END = ""                   # ключ-метка «здесь кончается суффикс» в узле trie
+
+
+def _idna(host):
+    if host.isascii():
+        return host
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+
+
+def normalize_domain(entry):
+    """
+    Запись из списка → (домен, суффикс?) или None, если это не домен
+    (в том числе IPv4-адрес: числовой домен верхнего уровня не бывает).
+    """
+    value = entry.strip().lower()
+    if _PLAIN.fullmatch(value) and len(value) <= 253:
+        if value.rpartition(".")[2].isdigit():
+            return None
+        return value, True
+    suffix = True
+    for prefix in _EXACT_PREFIXES:
+        if value.startswith(prefix):
+            value = value[len(prefix):]
+            suffix = False
+            break
+    else:
+        for prefix in _SUFFIX_PREFIXES:
+            if value.startswith(prefix):
+                value = value[len(prefix):]
+                break
+    # вставили URL — нужен только хост; без схемы путь и порт не режем
+    if "://" in value:
+        value = value.split("://", 1)[1]
+        value = value.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0]
+        if value.count(":") == 1:
+            value = value.split(":", 1)[0]
+    value = value.strip(".")
+    if not value or len(value) > 253:
+        return None
+    value = _idna(value)
+    if value is None:
+        return None
+    labels = value.split(".")
+    if not all(_LABEL.match(label) for label in labels) or labels[-1].isdigit():
+        return None
+    # голая метка (localhost, com) — только суффиксом, как у RU-режима
+    if len(labels) == 1 and not suffix:
+        return None
+    return value, suffix
+
+
+class DomainTrie:
+    """Суффиксы по меткам в обратном порядке: {"com": {"example": {"": True}}}."""
+
+    def __init__(self, suffixes=()):
+        self.root = {}
+        for s in suffixes:
+            self.add(s)
+
+    def add(self, suffix) -> bool:
+        """False — суффикс уже покрыт более широким (или таким же)."""
+        node = self.root
+        for label in reversed(suffix.split(".")):
+            if _END in node:
+                return False
+            node = node.setdefault(label, {})
+        if _END in node:
+            return False
+        node.clear()        # всё глубже теперь покрыто этим суффиксом
+        node[_END] = True
+        return True
+
+    def covers(self, domain) -> bool:
+        node = self.root
+        for label in reversed(domain.split(".")):
+            if _END in node:
+                return True
+            node = node.get(label)
+            if node is None:
+                return False
+        return _END in node
+
+
+class DomainReport:
+    __slots__ = ("total", "duplicates", "covered", "invalid")
+
+    def __init__(self):
+        self.total = 0
+        self.duplicates = 0
+        self.covered = 0        # уже покрыты более широким суффиксом
+        self.invalid = []       # записи, в которых не нашли домена
+
+    @property
+    def removed(self):
+        return self.duplicates + self.covered + len(self.invalid)
+
+    def describe(self):
+        parts = []
+        if self.duplicates:
+            parts.append(f"повторов {self.duplicates}")
+        if self.covered:
+            parts.append(f"покрыто суффиксами {self.covered}")
+        if self.invalid:
+            parts.append(f"не домены {len(self.invalid)}")
+        kept = self.total - self.removed
+        if not parts:
+            return f"{kept} без изменений"
+        return f"{self.total} → {kept} ({', '.join(parts)})"
+
+
+def normalize_domains(entries, covered_by=()):
+    """
+    Список исключений → (domain, domain_suffix, отчёт) — минимальные
+    наборы в порядке первого появления. covered_by — суффиксы, которые
+    уже идут напрямую другим правилом (RU_SUFFIXES в RU-режиме).
+    """
+    report = DomainReport()
+    exact = {}
+    suffixes = {}
+    for entry in entries:
+        report.total += 1
+        parsed = normalize_domain(entry)
+        if parsed is None:
+            report.invalid.append(entry)
+            continue
+        domain, is_suffix = parsed
+        target = suffixes if is_suffix else exact
+        if domain in target:
+            report.duplicates += 1
+            continue
+        target[domain] = True
+
+    # короткие суффиксы первыми: тогда каждая вставка сразу видит,
+    # покрыта ли она, и trie не приходится чистить
+    trie = DomainTrie(covered_by)
+    kept = set()
+    for s in sorted(suffixes, key=lambda d: d.count(".")):
+        if trie.add(s):
+            kept.add(s)
+        else:
+            report.covered += 1
+    suffix_list = [s for s in suffixes if s in kept]
+
+    domain_list = []
+    for d in exact:
+        if trie.covers(d):
+            report.covered += 1
+        else:
+            domain_list.append(d)
+    return domain_list, suffix_list, report
+
+
+def domain_rule(domains, suffixes):
+    """Поля headless/route-правила; пустые наборы не пишем."""
+    rule = {}
+    if domains:
+        rule["domain"] = domains
+    if suffixes:
+        rule["domain_suffix"] = suffixes
+    return rule
@@ -0,0 +1,171 @@
+"""
+Массовый импорт исключений из файлов и по URL.
+Понимает построчно, вперемешку:
+
+    example.com                 — домен (с поддоменами)
+    0.0.0.0 a.com b.com         — hosts: только эти имена (full:)
+    ||ads.example.com^$third-party
+                                — adblock: домен с поддоменами
+    10.0.0.0/8, 192.168.1.5     — сети и адреса (ip_exclusions)
+    # … / ! …                   — комментарии
+
+Файл читается потоком (большие — через mmap), URL — по мере загрузки;
+разбор, проверка и отсев повторов — за один проход, в памяти только
+новые записи. Результат применяется одной правкой конфига.
+"""
+import ipaddress
+import mmap
+import os
+import urllib.request
+from functools import lru_cache
+
+from domains import normalize_domain
+from networks import parse_network
+
+MMAP_THRESHOLD = 4 * 1024 * 1024    # файлы больше — через mmap
+FETCH_TIMEOUT = 15.0
+USER_AGENT = "vlf-client/exclusions"
+
+# имена из hosts-файлов, которые не про сайты
+_HOSTS_SKIP = {
+    "localhost", "localhost.localdomain", "local", "broadcasthost",
+    "ip6-localhost", "ip6-loopback", "ip6-localnet", "ip6-mcastprefix",
+    "ip6-allnodes", "ip6-allrouters", "ip6-allhosts", "0.0.0.0",
+}
+
+
+class ImportResult:
+    __slots__ = ("sites", "ips", "lines", "duplicates", "invalid", "skipped")
+
+    def __init__(self):
+        self.sites = []         # новые записи site_exclusions
+        self.ips = []           # новые записи ip_exclusions
+        self.lines = 0
+        self.duplicates = 0     # уже есть в списках или встречались выше
+        self.invalid = 0        # не разобрали
+        self.skipped = 0        # комментарии, исключения adblock, служебные имена
+
+    @property
+    def added(self):
+        return len(self.sites) + len(self.ips)
+
+    def describe(self):
+        return (
+            f"строк {self.lines}: добавлено сайтов {len(self.sites)}, "
+            f"сетей {len(self.ips)}; повторов {self.duplicates}, "
+            f"не разобрано {self.invalid}, пропущено {self.skipped}"
+        )
+
+
+def _site_key(entry):
+    """Ключ для отсева повторов: нормальная форма записи."""
+    parsed = normalize_domain(entry)
+    if parsed is None:
+        return entry
+    domain, suffix = parsed
+    return domain if suffix else "full:" + domain
+
+
+def _ip_key(entry):
+    return parse_network(entry) or entry
+
+
+@lru_cache(maxsize=64)
+def _is_address(text):
+    # в hosts-файле адресов обычно два-три (0.0.0.0, 127.0.0.1) — разбираем один раз
+    try:
+        ipaddress.ip_address(text)
+    except ValueError:
+        return False
+    return True
+
+
+def iter_lines(source):
+    """Строки файла или URL в bytes, без загрузки целиком."""
+    if "://" in source:
+        req = urllib.request.Request(source, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(req, timeout=FETCH_TIMEOUT) as resp:
+            yield from resp
+        return
+    with open(source, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            yield from f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter(mm.readline, b"")
+
+
+def parse_line(line):
+    """
+    Одна строка → [(вид, запись)], вид — "site" или "ip";
+    None — не разобрали, [] — пропускаем (комментарий и т.п.).
+    """
+    line = line.strip()
+    if not line or line[0] in "#!;[":
+        return []
+    if line.startswith("@@"):
+        return []               # исключение adblock — не «обход», а «не блокировать»
+    if line.startswith("||"):
+        host = line[2:].split("^", 1)[0].split("$", 1)[0]
+        if not host or "*" in host or "/" in host:
+            return None
+        parsed = normalize_domain(host)
+        return [("site", parsed[0])] if parsed else None
+    line = line.split("#", 1)[0].strip()
+
+    fields = line.split()
+    if len(fields) > 1:
+        # hosts: адрес и имена
+        if not _is_address(fields[0]):
+            return None
+        entries = []
+        for name in fields[1:]:
+            if name.lower() in _HOSTS_SKIP:
+                continue
+            parsed = normalize_domain(name)
+            if parsed is None:
+                return None
+            entries.append(("site", "full:" + parsed[0]))
+        return entries
+
+    value = fields[0]
+    if value[0].isdigit() or ":" in value:
+        net = parse_network(value)
+        if net is not None:
+            return [("ip", net)]
+    parsed = normalize_domain(value)
+    if parsed is None:
+        return None
+    domain, suffix = parsed
+    return [("site", domain if suffix else "full:" + domain)]
+
+
+def import_exclusions(sources, existing_sites=(), existing_ips=()):
+    """
+    Все источники за один проход → ImportResult с новыми записями.
+    Ошибка чтения источника (нет файла, сеть) — исключение, ничего не меняем.
+    """
+    result = ImportResult()
+    seen = {
+        "site": {_site_key(e) for e in existing_sites},
+        "ip": {_ip_key(e) for e in existing_ips},
+    }
+    out = {"site": result.sites, "ip": result.ips}
+    for source in sources:
+        for raw in iter_lines(source):
+            result.lines += 1
+            entries = parse_line(raw.decode("utf-8", "replace"))
+            if entries is None:
+                result.invalid += 1
+                continue
+            if not entries:
+                result.skipped += 1
+                continue
+            for kind, value in entries:
+                if value in seen[kind]:
+                    result.duplicates += 1
+                    continue
+                seen[kind].add(value)
+                out[kind].append(value)
+    return result
@@ -0,0 +1,230 @@
+"""
+geoip-ru и geosite-category-ru для RU-режима: готовые .srs из
+SagerNet, кэш на диске и обновление в фоне.
+Файлы лежат под именем с хэшем содержимого — новая версия меняет путь
+в route.rule_set, и горячая замена подхватывает её, как любую правку.
+Нет файла (первый запуск без сети) — RU-режим работает по суффиксам.
+"""
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+GEO_DIR = "geo_rulesets"            # рядом с EXE, как singbox_configs
+GEO_REFRESH_INTERVAL = 24 * 3600
+GEO_RETRY_DELAY = 15 * 60           # после неудачной загрузки
+GEO_TIMEOUT = 20.0
+GEO_CONNECT_TIMEOUT = 5.0           # загрузка прямо перед подключением
+GEO_MAX_SIZE = 64 * 1024 * 1024
+GEO_IDLE_CHECK = 60.0               # RU-режим выключен — проверяем, не включили ли
+SRS_MAGIC = b"SRS"
+
+GEO_SOURCES = {
+    "geosite-category-ru":
+        "https://raw.githubusercontent.com/SagerNet/sing-geosite/rule-set/geosite-category-ru.srs",
+    "geoip-ru":
+        "https://raw.githubusercontent.com/SagerNet/sing-geoip/rule-set/geoip-ru.srs",
+}
+
+
+def _noop(*_args):
+    pass
+
+
+class GeoRuleSets:
+    """
+    entries() — элементы route.rule_set для скачанных файлов;
+    refresh() — условная загрузка (ETag/Last-Modified), 304 не качаем.
+    Состояние (имя файла, ETag, время проверки) — в state.json рядом;
+    его читают и правят фон и поток подключения — только под _lock.
+    """
+
+    def __init__(self, cache_dir=GEO_DIR, sources=None,
+                 interval=GEO_REFRESH_INTERVAL, log=None):
+        self.cache_dir = Path(cache_dir)
+        self.sources = dict(sources or GEO_SOURCES)
+        self.interval = interval
+        self.log = log or _noop
+        self.state_path = self.cache_dir / "state.json"
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            self._state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except Exception:
+            self._state = {}
+
+    # ---------- чтение ----------
+
+    def _meta(self, tag):
+        with self._lock:
+            return dict(self._state.get(tag, {}))
+
+    def _set_meta(self, tag, meta):
+        with self._lock:
+            self._state[tag] = meta
+
+    def _path(self, tag):
+        name = self._meta(tag).get("file")
+        if not name:
+            return None
+        path = self.cache_dir / name
+        return path if path.exists() else None
+
+    def entries(self):
+        out = []
+        for tag in self.sources:
+            path = self._path(tag)
+            if path is not None:
+                out.append({
+                    "type": "local",
+                    "tag": tag,
+                    "format": "binary",
+                    "path": str(path.resolve()),
+                })
+        return out
+
+    def missing(self, skip_failed=False):
+        """Теги без файла; skip_failed — кроме тех, что недавно не скачались."""
+        now = time.time()
+        return [
+            tag for tag in self.sources
+            if self._path(tag) is None
+            and not (skip_failed
+                     and now - self._meta(tag).get("failed_at", 0) < GEO_RETRY_DELAY)
+        ]
+
+    # ---------- загрузка ----------
+
+    def refresh(self, tags=None, force=False, timeout=GEO_TIMEOUT):
+        """Проверить и скачать; возвращает теги, у которых сменился файл."""
+        changed = []
+        now = time.time()
+        for tag in tags or list(self.sources):
+            meta = self._meta(tag)
+            if not force and self._path(tag) and now - meta.get("checked_at", 0) < self.interval:
+                continue
+            try:
+                if self._download(tag, meta, timeout):
+                    changed.append(tag)
+            except (OSError, ValueError, urllib.error.URLError,
+                    http.client.HTTPException) as e:
+                # в т.ч. IncompleteRead на оборванном ответе — загрузка необязательна
+                meta = self._meta(tag)
+                meta["failed_at"] = now
+                self._set_meta(tag, meta)
+                self.log(f"{tag}: не обновлён ({e})\n")
+        self._save_state()
+        return changed
+
+    def _download(self, tag, meta, timeout):
+        headers = {}
+        if self._path(tag) is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("modified"):
+                headers["If-Modified-Since"] = meta["modified"]
+        req = urllib.request.Request(self.sources[tag], headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                body = resp.read(GEO_MAX_SIZE + 1)
+                # read(n) на оборванном ответе молча отдаёт сколько есть
+                if resp.length and len(body) <= GEO_MAX_SIZE:
+                    raise http.client.IncompleteRead(body, resp.length)
+                etag = resp.headers.get("ETag", "")
+                modified = resp.headers.get("Last-Modified", "")
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            meta["checked_at"] = time.time()
+            meta.pop("failed_at", None)
+            self._set_meta(tag, meta)
+            return False
+        if len(body) > GEO_MAX_SIZE or not body.startswith(SRS_MAGIC):
+            raise ValueError("ответ не похож на .srs")
+
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        name = f"{tag}-{digest}.srs"
+        with self._lock:
+            old = self._state.get(tag, {}).get("file")
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self.cache_dir / name
+            if not path.exists():
+                tmp = path.with_name(name + ".tmp")
+                tmp.write_bytes(body)
+                os.replace(tmp, path)
+            self._state[tag] = {
+                "file": name,
+                "etag": etag,
+                "modified": modified,
+                "checked_at": time.time(),
+            }
+        if old == name:
+            return False
+        # прежний файл не трогаем сразу — его ещё читает работающий sing-box
+        self._prune(tag, keep=(name, old))
+        self.log(f"{tag}: {len(body) // 1024} КБ, обновлён\n")
+        return True
+
+    def _prune(self, tag, keep):
+        for p in self.cache_dir.glob(f"{tag}-*.srs"):
+            if p.name not in keep:
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+
+    def _save_state(self):
+        with self._lock:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+                tmp.write_text(json.dumps(self._state, ensure_ascii=False), encoding="utf-8")
+                os.replace(tmp, self.state_path)
+            except OSError:
+                pass
+
+    # ---------- фон ----------
+
+    def _next_delay(self):
+        now = time.time()
+        delays = []
+        for tag in self.sources:
+            meta = self._meta(tag)
+            if self._path(tag) is None and not meta.get("failed_at"):
+                return 0.0
+            due = meta.get("checked_at", 0) + self.interval
+            if meta.get("failed_at", 0) > meta.get("checked_at", 0):
+                due = meta["failed_at"] + GEO_RETRY_DELAY
+            delays.append(due - now)
+        return max(0.0, min(delays, default=self.interval))
+
+    def start(self, on_update=None, enabled=None):
+        """
+        Фоновое обновление; on_update(теги) — из потока, когда сменился файл.
+        enabled() — нужны ли файлы сейчас (RU-режим включён); нет — не качаем.
+        """
+        on_update = on_update or _noop
+        enabled = enabled or (lambda: True)
+
+        def run():
+            delay = self._next_delay()
+            while not self._stop.wait(delay):
+                if not enabled():
+                    delay = GEO_IDLE_CHECK
+                    continue
+                changed = self.refresh()
+                if changed:
+                    on_update(changed)
+                delay = self._next_delay()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
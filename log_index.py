@@ -0,0 +1,465 @@
+"""
+Разбор строк лога sing-box в структурированные события и индекс по ним.
+Колонки — компактные array, строки (теги, хосты, классы ошибок) интернированы,
+по каждому полю — постинг-листы номеров событий. Время монотонно растёт
+вместе с номером события, поэтому фильтр по времени — бинарный поиск.
+"""
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from calendar import timegm
+from collections import deque
+
+from log_pipeline import LOG_CAPACITY
+
+INDEX_CAPACITY = LOG_CAPACITY       # событий не больше, чем строк в LogRing
+SEGMENT_SIZE = 8192
+_WIDE_IDS = 64      # фильтр шире — проверка по колонке, а не постинг-листы
+
+LEVELS = ("TRACE", "DEBUG", "INFO", "WARN", "ERROR", "FATAL", "PANIC")
+_LEVEL_CODE = {name: i for i, name in enumerate(LEVELS)}
+
+_ANSI = re.compile(r"\x1b\[[0-9;]*m")
+_LINE = re.compile(
+    r"^(?:(?P<tz>[+-]\d{4}) )?"
+    r"(?:(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) )?"
+    r"(?P<level>TRACE|DEBUG|INFO|WARN|ERROR|FATAL|PANIC)\s+"
+    r"(?:\[(?P<conn>\d+)(?: [^\]]*)?\] )?"
+    r"(?P<msg>.*)$"
+)
+# inbound/tun[tun-in]: ...   outbound/vless[proxy-out]: ...
+_TAGGED = re.compile(r"^(?P<kind>inbound|outbound)/[\w-]+\[(?P<tag>[^\]]+)\]: (?P<rest>.*)$")
+_DEST = re.compile(r"connection (?:to|from) (?P<dest>\S+)")
+_ROUTE_TO = re.compile(r"=> (?:route\()?(?P<tag>[^\s)]+)")
+
+ERROR_CLASSES = (
+    ("timeout", ("i/o timeout", "deadline exceeded", "timed out")),
+    ("refused", ("connection refused",)),
+    ("reset", ("connection reset", "forcibly closed")),
+    ("dns", ("no such host", "lookup ", "dns")),
+    ("tls", ("tls", "handshake", "reality")),
+    ("eof", ("eof",)),
+    ("unreachable", ("unreachable", "no route")),
+)
+
+
+def classify_error(text: str) -> str:
+    low = text.lower()
+    for name, needles in ERROR_CLASSES:
+        if any(n in low for n in needles):
+            return name
+    return "other"
+
+
+def _split_host(dest: str) -> str:
+    """example.com:443 / [::1]:443 → хост без порта."""
+    if dest.startswith("["):
+        return dest[1:dest.find("]")] if "]" in dest else dest
+    host, sep, port = dest.rpartition(":")
+    return host if sep and port.isdigit() else dest
+
+
+class LogEvent:
+    __slots__ = ("ts", "level", "conn", "inbound", "outbound", "host", "error", "text")
+
+    def __init__(self, ts, level, conn=0, inbound="", outbound="", host="",
+                 error="", text=""):
+        self.ts = ts
+        self.level = level
+        self.conn = conn
+        self.inbound = inbound
+        self.outbound = outbound
+        self.host = host
+        self.error = error
+        self.text = text
+
+
+_ts_cache = {}
+
+
+def _parse_ts(ts: str, tz: str | None) -> float:
+    # подряд идущие строки почти всегда в одной секунде — кэшируем
+    key = (ts, tz)
+    val = _ts_cache.get(key)
+    if val is None:
+        if len(_ts_cache) > 4096:
+            _ts_cache.clear()
+        t = time.strptime(ts, "%Y-%m-%d %H:%M:%S")
+        val = float(timegm(t))
+        if tz:
+            sign = -1 if tz[0] == "+" else 1
+            val += sign * (int(tz[1:3]) * 3600 + int(tz[3:5]) * 60)
+        else:
+            val = time.mktime(t)
+        _ts_cache[key] = val
+    return val
+
+
+def parse_line(line: str) -> LogEvent | None:
+    line = _ANSI.sub("", line).strip()
+    m = _LINE.match(line)
+    if not m:
+        return None
+    ts = _parse_ts(m["ts"], m["tz"]) if m["ts"] else time.time()
+    msg = m["msg"]
+    ev = LogEvent(ts, m["level"], int(m["conn"] or 0), text=line)
+
+    t = _TAGGED.match(msg)
+    if t:
+        if t["kind"] == "inbound":
+            ev.inbound = t["tag"]
+        else:
+            ev.outbound = t["tag"]
+        d = _DEST.search(t["rest"])
+        if d:
+            ev.host = _split_host(d["dest"])
+    elif msg.startswith("router:"):
+        r = _ROUTE_TO.search(msg)
+        if r:
+            ev.outbound = r["tag"]
+
+    if _LEVEL_CODE[ev.level] >= _LEVEL_CODE["ERROR"]:
+        ev.error = classify_error(msg)
+    return ev
+
+
+class _Interner:
+    """Строка → id. fold — рядом хранить и нижний регистр (поиск подстроки)."""
+
+    __slots__ = ("ids", "values", "lower")
+
+    def __init__(self, fold=False):
+        self.ids = {"": 0}
+        self.values = [""]
+        self.lower = [""] if fold else None
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, value):
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.values)
+            self.values.append(value)
+            if self.lower is not None:
+                self.lower.append(value.lower())
+        return i
+
+
+class _Segment:
+    """
+    Кусок индекса на SEGMENT_SIZE событий: колонки и постинг-листы позиций
+    внутри куска. Интернированные строки общие для всех кусков (LogIndex),
+    старые события уходят целыми кусками — без перестройки остального.
+    """
+
+    __slots__ = ("ts", "seq", "conn", "cols", "strings", "postings")
+
+    def __init__(self, strings):
+        self.ts = array("d")
+        self.seq = array("Q")               # номера строк в LogRing
+        self.conn = array("Q")
+        self.cols = {f: array("I") for f in strings}
+        self.strings = strings
+        self.postings = {f: {} for f in strings}
+
+    def __len__(self):
+        return len(self.ts)
+
+    def append(self, ts, seq, conn, values):
+        pos = len(self.ts)
+        self.ts.append(ts)
+        self.seq.append(seq)
+        self.conn.append(conn)
+        for field, value in values.items():
+            sid = self.strings[field].get(value)
+            self.cols[field].append(sid)
+            if sid:
+                plist = self.postings[field].get(sid)
+                if plist is None:
+                    plist = self.postings[field][sid] = array("I")
+                plist.append(pos)
+
+    def query(self, filters, since, until, min_seq, limit):
+        """
+        filters — [(поле, множество подходящих id)].
+        → (сколько совпало в куске, номера строк последних `limit`).
+        """
+        n = len(self.ts)
+        lo = bisect_left(self.ts, since) if since is not None else 0
+        hi = bisect_right(self.ts, until) if until is not None else n
+        if min_seq:
+            lo = max(lo, bisect_left(self.seq, min_seq))
+        if lo >= hi:
+            return 0, []
+
+        checks = []
+        wide = []
+        whole = lo == 0 and hi == n
+        for field, allowed in filters:
+            postings = self.postings[field]
+            if (len(allowed) > _WIDE_IDS and len(filters) > 1) or len(allowed) > len(postings):
+                # подстрока хоста подошла к сотням строк — списки не собираем,
+                # пока есть другой фильтр: такой проверяем по колонке
+                wide.append((field, allowed))
+                continue
+            lists = [postings[sid] for sid in allowed if sid in postings]
+            if not lists:
+                return 0, []
+            checks.append((_window_size(lists, lo, hi, whole), field, allowed, lists))
+        if wide and not checks:
+            for field, allowed in wide:
+                postings = self.postings[field]
+                lists = [pl for sid, pl in postings.items() if sid in allowed]
+                if not lists:
+                    return 0, []
+                checks.append((_window_size(lists, lo, hi, whole), field, allowed, lists))
+            wide = []
+
+        if not checks:
+            return hi - lo, list(self.seq[max(lo, hi - limit):hi])
+
+        # самый узкий фильтр даёт кандидатов, остальные — проверка по колонкам
+        checks.sort(key=lambda f: f[0])
+        size, _, _, lists = checks[0]
+        if len(checks) == 1 and not wide:
+            # только подсчёт бинарным поиском + хвост из каждого списка
+            tail = []
+            for plist in lists:
+                b = bisect_left(plist, hi)
+                a = bisect_left(plist, lo)
+                tail.extend(plist[max(a, b - limit):b])
+            tail.sort()
+            return size, [self.seq[i] for i in tail[max(0, len(tail) - limit):]]
+
+        matched = []
+        for plist in lists:
+            matched.extend(plist[bisect_left(plist, lo):bisect_left(plist, hi)])
+        if len(lists) > 1:
+            matched.sort()
+        for _, field, allowed, _ in checks[1:]:
+            col = self.cols[field]
+            matched = [i for i in matched if col[i] in allowed]
+        for field, allowed in wide:
+            col = self.cols[field]
+            matched = [i for i in matched if col[i] in allowed]
+        return len(matched), [self.seq[i] for i in matched[max(0, len(matched) - limit):]]
+
+
+def _window_size(lists, lo, hi, whole):
+    """Сколько позиций из постинг-листов попадает в [lo, hi)."""
+    if whole:
+        return sum(map(len, lists))
+    return sum(bisect_left(pl, hi) - bisect_left(pl, lo) for pl in lists)
+
+
+class LogIndex:
+    """
+    Поиск по событиям: уровень, inbound/outbound-тег, хост (подстрока),
+    класс ошибки, окно по времени. Хранит не текст, а номера строк
+    в LogRing, и не больше событий, чем помещается в сам буфер.
+    Разбор строк (parse_line) — в потоке-читателе, запись и поиск —
+    в потоке GUI, там же, где LogRing.
+    """
+
+    FIELDS = ("level", "inbound", "outbound", "host", "error")
+
+    def __init__(self, capacity=INDEX_CAPACITY, segment_size=SEGMENT_SIZE):
+        self.capacity = capacity
+        self.segment_size = segment_size
+        self._segments = deque()
+        self._strings = {f: _Interner(fold=f == "host") for f in self.FIELDS}
+        self._count = 0
+        self._last_ts = 0.0
+        self._conn_host = {}                # последние соединения: id → host
+
+    def __len__(self):
+        return self._count
+
+    # ---------- запись ----------
+
+    def add_events(self, events, first_seq, oldest_seq=0):
+        """
+        events[i] — событие строки first_seq + i (None — не строка sing-box).
+        oldest_seq — самая старая строка, что ещё есть в буфере.
+        """
+        segments = self._segments
+        last_ts = self._last_ts
+        for i, ev in enumerate(events):
+            if ev is None:
+                continue
+            # время не должно идти назад, иначе бинарный поиск врёт
+            ts = ev.ts if ev.ts >= last_ts else last_ts
+            last_ts = ts
+            host = ev.host
+            if ev.conn:
+                if host:
+                    self._conn_host[ev.conn] = host
+                    if len(self._conn_host) > 50000:
+                        self._conn_host.clear()
+                elif ev.outbound:
+                    # outbound-строка без хоста: берём хост из inbound того же соединения
+                    host = self._conn_host.get(ev.conn, "")
+            if not segments or len(segments[-1]) >= self.segment_size:
+                segments.append(_Segment(self._strings))
+            segments[-1].append(ts, first_seq + i, ev.conn, {
+                "level": ev.level,
+                "inbound": ev.inbound,
+                "outbound": ev.outbound,
+                "host": host,
+                "error": ev.error,
+            })
+            self._count += 1
+        self._last_ts = last_ts
+        self._trim(oldest_seq)
+
+    def _trim(self, oldest_seq):
+        """Старые куски — целиком: вышли из буфера или сверх ёмкости."""
+        segments = self._segments
+        while len(segments) > 1 and (
+            segments[0].seq[-1] < oldest_seq
+            or self._count - len(segments[0]) >= self.capacity
+        ):
+            self._count -= len(segments.popleft())
+        # строки ушедших кусков остаются в общих словарях — изредка чистим
+        for field, interner in self._strings.items():
+            if len(interner) > 2 * self.capacity:
+                self._compact(field)
+
+    def _compact(self, field):
+        """Пересобрать словарь поля только из живых кусков (новые id)."""
+        old = self._strings[field]
+        new = _Interner(fold=old.lower is not None)
+        for segment in self._segments:
+            remap = {0: 0}
+            for sid in segment.postings[field]:
+                remap[sid] = new.get(old.values[sid])
+            segment.cols[field] = array("I", map(remap.__getitem__, segment.cols[field]))
+            segment.postings[field] = {
+                remap[sid]: plist for sid, plist in segment.postings[field].items()
+            }
+        # куски держат ссылку на общий словарь полей — меняем запись в нём
+        self._strings[field] = new
+
+    def _allowed(self, field, value):
+        """Множество id строк поля, подходящих под фильтр (один раз на запрос)."""
+        interner = self._strings[field]
+        if field == "level":
+            code = _LEVEL_CODE.get(value.upper())
+            if code is None:
+                return set()            # неизвестный уровень — ничего
+            return {sid for sid in map(interner.ids.get, LEVELS[code:]) if sid}
+        if field == "host":
+            value = value.lower()
+            return {sid for sid, s in enumerate(interner.lower) if sid and value in s}
+        sid = interner.ids.get(value)
+        return {sid} if sid else set()
+
+    # ---------- поиск ----------
+
+    def query(self, level=None, inbound=None, outbound=None, host=None,
+              error=None, since=None, until=None, min_seq=0, limit=200):
+        """
+        → (сколько всего совпало, номера строк последних `limit` в LogRing).
+        host — подстрока, остальное — точное совпадение.
+        level — минимальный уровень ("ERROR" = ERROR и выше).
+        min_seq — строки старше уже вытеснены из буфера, их не считаем.
+        """
+        filters = [
+            (field, self._allowed(field, value))
+            for field, value in (("level", level), ("inbound", inbound),
+                                 ("outbound", outbound), ("host", host),
+                                 ("error", error))
+            if value
+        ]
+        if any(not allowed for _, allowed in filters):
+            return 0, []
+        total = 0
+        seqs = []
+        # с конца: хвост из `limit` строк набирается из последних кусков
+        for segment in reversed(self._segments):
+            if since is not None and segment.ts[-1] < since:
+                break
+            count, tail = segment.query(
+                filters, since, until, min_seq, limit - len(seqs)
+            )
+            total += count
+            if tail:
+                seqs[:0] = tail
+        return total, seqs
+
+
+def parse_query(text: str, now=None) -> dict:
+    """
+    Строка поиска → аргументы query():
+      level:error  in:tun-in  out:proxy-out  err:timeout  last:1h / 30m / 10s
+      всё остальное — подстрока хоста.
+    """
+    now = time.time() if now is None else now
+    keys = {"level": "level", "in": "inbound", "out": "outbound", "err": "error",
+            "host": "host"}
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    args = {}
+    free = []
+    for token in text.split():
+        key, sep, value = token.partition(":")
+        if sep and key == "last" and value[:-1].isdigit() and value[-1] in units:
+            args["since"] = now - int(value[:-1]) * units[value[-1]]
+        elif sep and key in keys and value:
+            args[keys[key]] = value
+        else:
+            free.append(token)
+    if free:
+        args["host"] = " ".join(free)
+    return args
+
+
+def _bench(count=1_000_000):
+    """python log_index.py [событий] — наполнение и поиск по индексу."""
+    import random
+
+    hosts = [f"site{i}.example.com" for i in range(20000)]
+    levels = ["INFO"] * 90 + ["WARN"] * 5 + ["ERROR"] * 5
+    errors = ["i/o timeout", "connection refused", "EOF", "tls handshake failure"]
+    base = time.time() - count * 0.01
+    idx = LogIndex(capacity=count + 1)
+    t0 = time.perf_counter()
+    batch = []
+    for i in range(count):
+        lvl = random.choice(levels)
+        ev = LogEvent(base + i * 0.01, lvl, conn=i // 2 + 1)
+        if i % 2 == 0:
+            ev.inbound = "tun-in"
+            ev.host = random.choice(hosts)
+        else:
+            ev.outbound = random.choice(("proxy-out", "direct"))
+        if lvl == "ERROR":
+            ev.error = classify_error(random.choice(errors))
+        batch.append(ev)
+        if len(batch) == 10000:
+            idx.add_events(batch, i + 1 - len(batch))
+            batch = []
+    idx.add_events(batch, count - len(batch))
+    print(f"наполнение: {count} событий за {time.perf_counter() - t0:.1f} с")
+
+    now = base + count * 0.01
+    queries = [
+        "level:error last:1h",
+        "err:timeout",
+        "out:direct",
+        "site123.",
+        "site1 out:proxy-out",
+        "level:error err:tls site7",
+    ]
+    for q in queries:
+        args = parse_query(q, now=now)
+        t0 = time.perf_counter()
+        total, _ = idx.query(**args)
+        print(f"{q!r:32} {total:8d} совпадений  {(time.perf_counter() - t0) * 1000:7.2f} мс")
+
+
+if __name__ == "__main__":
+    import sys
+
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
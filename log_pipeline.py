@@ -0,0 +1,354 @@
+"""
+Лог sing-box: чтение stdout кусками, инкрементальное декодирование,
+потокобезопасная очередь строк. GUI забирает очередь по таймеру
+пачкой — один insert на тик вместо after(0, ...) на каждую строку.
+История хранится в кольцевом буфере фиксированной ёмкости, а в Text
+лежит только окно из неё. На диск пишет отдельный поток с ротацией
+по размеру/времени и фоновым gzip старых файлов.
+"""
+import codecs
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+READ_CHUNK = 64 * 1024
+LOG_TICK_MS = 75
+QUEUE_LIMIT = 50000     # если GUI не успевает — старое выкидываем, считаем
+
+
+def iter_line_batches(stream, chunk_size=READ_CHUNK):
+    """
+    Читаем бинарный поток кусками и отдаём списки целых строк (с \\n).
+    Незаконченная строка ждёт следующего куска; хвост отдаём в конце.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    read = getattr(stream, "read1", stream.read)
+    tail = ""
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        text = tail + decoder.decode(chunk)
+        cut = text.rfind("\n") + 1
+        if not cut:
+            tail = text
+            continue
+        tail = text[cut:]
+        yield text[:cut].splitlines(keepends=True)
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield [tail + "\n"]
+
+
+def split_lines(text):
+    """Сообщение → строки лога, каждая с \n (в буфере одна строка — одна запись)."""
+    lines = text.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    return lines
+
+
+class LogQueue:
+    """
+    Очередь строк между потоком-читателем и GUI + счётчики.
+    К строке sing-box может прилагаться разобранное событие (LogIndex):
+    разбор — в потоке-читателе, индекс пополняет GUI вместе с буфером.
+    """
+
+    def __init__(self, limit=QUEUE_LIMIT):
+        self.limit = limit
+        self._lines = deque()
+        self._events = deque()      # параллельно _lines; None — без события
+        self._lock = threading.Lock()
+        self.total_in = 0
+        self.total_out = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._rate_mark = (time.monotonic(), 0)
+        self.lines_per_sec = 0.0
+
+    def put_many(self, lines, events=None):
+        with self._lock:
+            self._lines.extend(lines)
+            self._events.extend(events if events is not None else [None] * len(lines))
+            self.total_in += len(lines)
+            overflow = len(self._lines) - self.limit
+            if overflow > 0:
+                for _ in range(overflow):
+                    self._lines.popleft()
+                    self._events.popleft()
+                self.dropped += overflow
+            if len(self._lines) > self.max_depth:
+                self.max_depth = len(self._lines)
+
+    def put(self, text):
+        """Сообщение из любого потока; многострочное — построчно."""
+        self.put_many(split_lines(text))
+
+    def drain(self):
+        """→ (строки, события к ним)."""
+        with self._lock:
+            if not self._lines:
+                return [], []
+            lines = list(self._lines)
+            events = list(self._events)
+            self._lines.clear()
+            self._events.clear()
+            self.total_out += len(lines)
+            return lines, events
+
+    @property
+    def depth(self):
+        return len(self._lines)
+
+    def update_rate(self):
+        """Пересчёт строк/сек; зовём раз в секунду-другую."""
+        now = time.monotonic()
+        t0, n0 = self._rate_mark
+        if now - t0 > 0:
+            self.lines_per_sec = (self.total_in - n0) / (now - t0)
+        self._rate_mark = (now, self.total_in)
+        return self.lines_per_sec
+
+    def describe(self):
+        text = f"{self.lines_per_sec:.0f} строк/с, очередь {self.depth}"
+        if self.dropped:
+            text += f", пропущено {self.dropped}"
+        return text
+
+
+LOG_CAPACITY = 100000   # строк в памяти
+LOG_VIEW_LINES = 2000   # строк в Text одновременно
+LOG_PAGE_LINES = 500    # сколько подгружаем за раз при прокрутке
+
+
+class LogRing:
+    """
+    Кольцевой буфер строк фиксированной ёмкости.
+    У каждой строки сквозной номер; start..end — что ещё хранится.
+    """
+
+    def __init__(self, capacity=LOG_CAPACITY):
+        self.capacity = max(1, int(capacity))
+        self._buf = [None] * self.capacity
+        self._head = 0      # индекс самой старой строки в _buf
+        self._count = 0
+        self.start = 0      # номер самой старой строки
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def end(self):
+        return self.start + self._count
+
+    def extend(self, lines):
+        cap = self.capacity
+        if len(lines) >= cap:
+            self.start += self._count + len(lines) - cap
+            self._buf = list(lines[-cap:])
+            self._head = 0
+            self._count = cap
+            return
+        for line in lines:
+            if self._count < cap:
+                self._buf[(self._head + self._count) % cap] = line
+                self._count += 1
+            else:
+                self._buf[self._head] = line
+                self._head = (self._head + 1) % cap
+                self.start += 1
+
+    def get(self, seq):
+        """Строка с номером seq (должна быть в start..end)."""
+        return self._buf[(self._head + seq - self.start) % self.capacity]
+
+    def slice(self, first, last):
+        """Строки с номерами [first, last), обрезанные по тому, что есть."""
+        first = max(first, self.start)
+        last = min(last, self.end)
+        if first >= last:
+            return []
+        cap = self.capacity
+        a = (self._head + first - self.start) % cap
+        n = last - first
+        if a + n <= cap:
+            return self._buf[a:a + n]
+        return self._buf[a:] + self._buf[:a + n - cap]
+
+
+LOG_DIR = "logs"
+LOG_FILE_NAME = "sing-box.log"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_SECONDS = 24 * 3600
+LOG_RETENTION = 10          # сколько сжатых старых файлов храним
+LOG_FLUSH_SECONDS = 1.0
+LOG_ROTATE_RETRY_SECONDS = 60.0   # файл занят (антивирус, просмотрщик)
+
+
+class LogFileSink:
+    """
+    Запись лога на диск из отдельного потока.
+    Читатель stdout только кладёт пачку в очередь и не ждёт диска.
+    """
+
+    def __init__(self, log_dir=LOG_DIR, max_bytes=LOG_MAX_BYTES,
+                 rotate_seconds=LOG_ROTATE_SECONDS, retention=LOG_RETENTION):
+        self.log_dir = Path(log_dir)
+        self.path = self.log_dir / LOG_FILE_NAME
+        # время открытия текущего файла: ctime на Linux меняет каждая запись
+        self.opened_path = self.log_dir / (LOG_FILE_NAME + ".opened")
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.retention = retention
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._rotate_retry_at = 0.0
+        self._compress_lock = threading.Lock()
+        self.written_lines = 0
+        self.rotations = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write_lines(self, lines):
+        if lines:
+            self._queue.put(lines)
+
+    def close(self, timeout=3.0):
+        """Дописать всё из очереди и закрыть файл (зовём при выходе)."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ---------- поток записи ----------
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._queue.get(timeout=LOG_FLUSH_SECONDS)
+            except queue.Empty:
+                self._flush()
+                continue
+            # забираем всё, что успело накопиться; flush — раз в секунду
+            batches = [batch]
+            while True:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batches
+            for b in batches:
+                # поток записи не должен умереть ни от чего: иначе очередь
+                # растёт без предела
+                try:
+                    self._write(b)
+                except Exception:
+                    pass
+            if stop:
+                self._flush()
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _open(self):
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8", newline="")
+        self._size = self._file.tell()
+        opened_at = None
+        if self._size:
+            try:
+                opened_at = float(self.opened_path.read_text(encoding="ascii"))
+            except (OSError, ValueError):
+                pass
+        if opened_at is None:
+            # новый файл (или метка потерялась) — отсчёт с этого момента
+            opened_at = time.time()
+            try:
+                self.opened_path.write_text(f"{opened_at:.0f}", encoding="ascii")
+            except OSError:
+                pass
+        self._opened_at = opened_at
+
+    def _write(self, lines):
+        if not lines:
+            return
+        if self._file is None:
+            self._open()
+        if (
+            self._size >= self.max_bytes
+            or time.time() - self._opened_at >= self.rotate_seconds
+        ) and self._size and time.monotonic() >= self._rotate_retry_at:
+            self._rotate()
+        data = "".join(lines)
+        self._file.write(data)
+        self._size += len(data) if data.isascii() else len(data.encode("utf-8"))
+        self.written_lines += len(lines)
+
+    def _flush(self):
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except OSError:
+                pass
+
+    def _rotate(self):
+        # закрыт — значит None: не открылся заново, откроет следующая запись
+        self._file.close()
+        self._file = None
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = self.log_dir / f"sing-box-{stamp}.log"
+        n = 1
+        while rotated.exists() or rotated.with_suffix(".log.gz").exists():
+            rotated = self.log_dir / f"sing-box-{stamp}-{n}.log"
+            n += 1
+        try:
+            os.replace(self.path, rotated)
+        except OSError:
+            # файл держат — пишем дальше в него же, повторим позже
+            self._rotate_retry_at = time.monotonic() + LOG_ROTATE_RETRY_SECONDS
+            self._open()
+            return
+        self.rotations += 1
+        try:
+            self.opened_path.unlink()
+        except OSError:
+            pass
+        self._open()
+        threading.Thread(
+            target=self._compress, args=(rotated,), daemon=True
+        ).start()
+
+    def _compress(self, path: Path):
+        """gzip ротированного файла и чистка по retention — в фоне."""
+        with self._compress_lock:
+            gz_path = path.with_suffix(".log.gz")
+            try:
+                with open(path, "rb") as src, gzip.open(gz_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, READ_CHUNK)
+                path.unlink()
+            except OSError:
+                # не сжался — остаётся .log, недописанный .gz убираем
+                try:
+                    gz_path.unlink()
+                except OSError:
+                    pass
+            # несжатые старые файлы тоже в счёт retention
+            old = []
+            for p in self.log_dir.glob("sing-box-*.log*"):
+                try:
+                    old.append((p.stat().st_mtime, p))
+                except OSError:
+                    pass
+            old.sort(reverse=True)
+            for _mtime, p in old[self.retention:]:
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
@@ -0,0 +1,118 @@
+"""
+Исключения по сетям (ip_exclusions): адреса и CIDR, затем схлопывание
+в минимальный набор покрывающих префиксов — отдельно для IPv4 и IPv6.
+10.0.0.0/24 + 10.0.1.0/24 → 10.0.0.0/23, адрес внутри уже добавленной
+сети просто исчезает.
+
+Результат тот же, что у ipaddress.collapse_addresses, но на целых
+числах: объекты ipaddress на десятках тысяч импортированных сетей
+разбираются в разы дольше самого схлопывания.
+"""
+import socket
+
+_FAMILIES = (
+    (4, socket.AF_INET, 32),
+    (6, socket.AF_INET6, 128),
+)
+
+
+class NetworkReport:
+    __slots__ = ("total", "invalid", "before", "after")
+
+    def __init__(self):
+        self.total = 0
+        self.invalid = []       # записи, которые не адрес и не сеть
+        self.before = 0         # разобранных записей
+        self.after = 0          # префиксов после схлопывания
+
+    def describe(self):
+        text = f"{self.before} → {self.after} префиксов"
+        if self.invalid:
+            text += f", не сети {len(self.invalid)}"
+        return text
+
+
+def _parse(entry):
+    """Запись → (версия, начало сети числом, длина префикса) или None."""
+    addr, _, plen = entry.strip().partition("/")
+    for version, family, bits in _FAMILIES:
+        try:
+            packed = socket.inet_pton(family, addr)
+        except (OSError, ValueError):
+            continue
+        if not plen:
+            prefix = bits
+        elif plen.isdigit() and int(plen) <= bits:
+            prefix = int(plen)
+        else:
+            return None
+        value = int.from_bytes(packed, "big")
+        host_bits = bits - prefix
+        return version, value >> host_bits << host_bits, prefix
+    return None
+
+
+def _collapse(nets, bits):
+    """[(начало, префикс)] → минимальный набор (как collapse_addresses)."""
+    out = []
+    end = -1
+    for start, prefix in sorted(nets):
+        # выровненные сети либо вложены, либо не пересекаются
+        if start <= end:
+            continue
+        end = start + (1 << (bits - prefix)) - 1
+        out.append((start, prefix))
+        # две соседние половины одной сети → сама сеть (как перенос в счётчике)
+        while len(out) > 1:
+            (a, pa), (b, pb) = out[-2], out[-1]
+            if pa != pb or pa == 0:
+                break
+            size = 1 << (bits - pa)
+            if a + size != b or a & (size << 1) - 1:
+                break
+            out[-2:] = [(a, pa - 1)]
+    return out
+
+
+def _format(start, prefix, family, bits):
+    packed = start.to_bytes(bits // 8, "big")
+    return f"{socket.inet_ntop(family, packed)}/{prefix}"
+
+
+def parse_network(entry):
+    """
+    Адрес или сеть (хостовые биты обнуляем) → "адрес/префикс"; None — не
+    разобрали. Тот же разбор, что при сборке route: что прошло проверку
+    в диалоге или импорте, не пропадёт из правила (fe80::1%eth0 — нет).
+    """
+    parsed = _parse(entry)
+    if parsed is None:
+        return None
+    version, start, prefix = parsed
+    for v, family, bits in _FAMILIES:
+        if v == version:
+            return _format(start, prefix, family, bits)
+    return None
+
+
+def normalize_networks(entries):
+    """Список исключений → (префиксы строками: сначала IPv4, потом IPv6, отчёт)."""
+    report = NetworkReport()
+    by_version = {4: [], 6: []}
+    for entry in entries:
+        report.total += 1
+        parsed = _parse(entry)
+        if parsed is None:
+            report.invalid.append(entry)
+            continue
+        version, start, prefix = parsed
+        by_version[version].append((start, prefix))
+    report.before = len(by_version[4]) + len(by_version[6])
+    prefixes = []
+    for version, family, bits in _FAMILIES:
+        prefixes.extend(
+            _format(start, prefix, family, bits)
+            for start, prefix in _collapse(by_version[version], bits)
+        )
+    report.after = len(prefixes)
+    return prefixes, report
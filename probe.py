@@ -0,0 +1,171 @@
+"""
+Замер задержки до узлов подписки перед подключением.
+TCP-connect (и при желании TLS/REALITY-рукопожатие) ко всем узлам сразу,
+с ограничением параллельности и дедлайном на каждый узел.
+"""
+import asyncio
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import Executor, Future
+
+PROBE_CONCURRENCY = 32
+PROBE_TIMEOUT = 3.0
+
+
+class ProbeResult:
+    __slots__ = ("node", "tcp_ms", "tls_ms", "error")
+
+    def __init__(self, node, tcp_ms=None, tls_ms=None, error=""):
+        self.node = node
+        self.tcp_ms = tcp_ms
+        self.tls_ms = tls_ms
+        self.error = error
+
+    @property
+    def ok(self):
+        return not self.error and self.tcp_ms is not None
+
+    @property
+    def latency_ms(self):
+        """Чем ранжируем: рукопожатие, если мерили, иначе TCP."""
+        if not self.ok:
+            return None
+        if self.tls_ms is not None:
+            return self.tcp_ms + self.tls_ms
+        return self.tcp_ms
+
+    def describe(self):
+        if not self.ok:
+            return f"недоступен ({self.error})"
+        text = f"{self.latency_ms:.0f} мс"
+        if self.tls_ms is not None:
+            text += f" (tcp {self.tcp_ms:.0f} + tls {self.tls_ms:.0f})"
+        return text
+
+
+class _DaemonExecutor(Executor):
+    """
+    Поток-демон на вызов. Пул по умолчанию asyncio.run ждёт при выходе,
+    так что зависший системный DNS держал бы замер дольше таймаута;
+    этот поток никто не ждёт — досчитает и умрёт сам.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+
+_DNS_EXECUTOR = _DaemonExecutor()
+
+
+async def getaddrinfo(host, port, **kwargs):
+    """loop.getaddrinfo, но вне пула по умолчанию (см. _DaemonExecutor)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _DNS_EXECUTOR, lambda: socket.getaddrinfo(host, port, **kwargs)
+    )
+
+
+def _tls_context():
+    # у REALITY сертификат «чужой» — проверяем только время рукопожатия
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+async def _close(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+
+async def _probe_endpoint(server, port, sni, handshake, ctx):
+    infos = await getaddrinfo(server, port, type=socket.SOCK_STREAM)
+    if not infos:
+        raise OSError("no address")
+    host = infos[0][4][0]
+
+    t0 = time.perf_counter()
+    _, writer = await asyncio.open_connection(host, port)
+    tcp_ms = (time.perf_counter() - t0) * 1000
+    await _close(writer)
+
+    tls_ms = None
+    if handshake:
+        t0 = time.perf_counter()
+        _, writer = await asyncio.open_connection(
+            host, port, ssl=ctx, server_hostname=sni or server
+        )
+        # второе соединение включает и TCP, вычитаем уже измеренное
+        tls_ms = max(0.0, (time.perf_counter() - t0) * 1000 - tcp_ms)
+        await _close(writer)
+    return tcp_ms, tls_ms
+
+
+async def probe_nodes_async(nodes, concurrency=PROBE_CONCURRENCY,
+                            timeout=PROBE_TIMEOUT, handshake=False):
+    """
+    Замеряем все узлы, возвращаем ProbeResult'ы от лучшего к худшему.
+    Узлы с одинаковым server:port/sni проверяем один раз.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+    ctx = _tls_context() if handshake else None
+
+    async def one(server, port, sni):
+        async with sem:
+            try:
+                return await asyncio.wait_for(
+                    _probe_endpoint(server, port, sni, handshake, ctx),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                return "таймаут"
+            except Exception as e:
+                return str(e) or e.__class__.__name__
+
+    endpoints = {}
+    for node in nodes:
+        endpoints.setdefault((node.server, node.port, node.sni), None)
+    keys = list(endpoints)
+    measured = await asyncio.gather(*(one(*k) for k in keys))
+    endpoints = dict(zip(keys, measured))
+
+    results = []
+    for node in nodes:
+        m = endpoints[(node.server, node.port, node.sni)]
+        if isinstance(m, str):
+            results.append(ProbeResult(node, error=m))
+        else:
+            results.append(ProbeResult(node, m[0], m[1]))
+    return rank(results)
+
+
+def rank(results):
+    """Доступные по возрастанию задержки, недоступные — в конце (порядок подписки)."""
+    return sorted(
+        results,
+        key=lambda r: (not r.ok, r.latency_ms if r.ok else 0.0),
+    )
+
+
+def probe_nodes(nodes, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT,
+                handshake=False):
+    """Синхронная обёртка для рабочих потоков GUI."""
+    return asyncio.run(
+        probe_nodes_async(nodes, concurrency, timeout, handshake)
+    )
@@ -0,0 +1,146 @@
+"""
+Профили и узлы подписок в памяти.
+Список профилей в порядке UI плюс индексы по имени и URL; правка
+профиля меняет одну запись и один dict в config_data["profiles"],
+без пересборки всего списка. Подписчики получают (событие, индекс,
+профиль) и обновляют только свою строку.
+"""
+from vlf_core import Profile
+
+ADDED = "added"
+UPDATED = "updated"
+REMOVED = "removed"
+
+
+class ProfileStore:
+    """
+    config_data["profiles"] — сериализованная копия, store держит её
+    в синхронизации. Все вызовы — из одного потока (GUI или CLI).
+    """
+
+    def __init__(self, config_data: dict):
+        self.config_data = config_data
+        self._items = [Profile.from_dict(d) for d in config_data.get("profiles", [])]
+        self.config_data["profiles"] = [p.to_dict() for p in self._items]
+        self._by_name = {}      # имя → профили с этим именем (по порядку)
+        self._by_url = {}       # url → профили с этой подпиской
+        for p in self._items:
+            self._index(p)
+        self._nodes = {}        # url → {node.key: узел} из последней подписки
+        self._listeners = []
+
+    # ---------- чтение ----------
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def get(self, idx) -> Profile | None:
+        if idx is None or not 0 <= idx < len(self._items):
+            return None
+        return self._items[idx]
+
+    def find(self, name) -> Profile | None:
+        found = self._by_name.get(name)
+        return found[0] if found else None
+
+    def by_url(self, url) -> list:
+        return list(self._by_url.get(url.strip(), ()))
+
+    def names(self):
+        return [p.name for p in self._items]
+
+    def urls(self):
+        return list(self._by_url)
+
+    # ---------- изменения ----------
+
+    def subscribe(self, callback):
+        """callback(событие, индекс, профиль); событие — ADDED/UPDATED/REMOVED."""
+        self._listeners.append(callback)
+
+    def add(self, profile: Profile) -> int:
+        idx = len(self._items)
+        self._items.append(profile)
+        self.config_data["profiles"].append(profile.to_dict())
+        self._index(profile)
+        self._notify(ADDED, idx, profile)
+        return idx
+
+    def replace(self, idx, profile: Profile):
+        old = self._items[idx]
+        self._unindex(old)
+        self._items[idx] = profile
+        self._index(profile)
+        self._prune_nodes(old.url)
+        self.config_data["profiles"][idx] = profile.to_dict()
+        self._notify(UPDATED, idx, profile)
+
+    def update(self, idx, **fields) -> bool:
+        """Меняет поля профиля; False — если менять нечего (и ничего не пишем)."""
+        p = self._items[idx]
+        changed = {k: v for k, v in fields.items() if getattr(p, k) != v}
+        if not changed:
+            return False
+        reindex = "name" in changed or "url" in changed
+        old_url = p.url
+        if reindex:
+            self._unindex(p)
+        for k, v in changed.items():
+            setattr(p, k, v)
+        if reindex:
+            self._index(p)
+            self._prune_nodes(old_url)
+        self.config_data["profiles"][idx].update(changed)
+        self._notify(UPDATED, idx, p)
+        return True
+
+    def remove(self, idx) -> Profile:
+        p = self._items.pop(idx)
+        del self.config_data["profiles"][idx]
+        self._unindex(p)
+        self._prune_nodes(p.url)
+        self._notify(REMOVED, idx, p)
+        return p
+
+    # ---------- узлы подписок ----------
+
+    def set_nodes(self, url, nodes):
+        self._nodes[url.strip()] = {n.key: n for n in nodes or ()}
+
+    def nodes(self, url) -> list:
+        return list(self._nodes.get(url.strip(), {}).values())
+
+    def node(self, url, key):
+        return self._nodes.get(url.strip(), {}).get(key)
+
+    def node_count(self, url):
+        return len(self._nodes.get(url.strip(), ()))
+
+    # ---------- внутреннее ----------
+
+    def _index(self, p):
+        self._by_name.setdefault(p.name, []).append(p)
+        self._by_url.setdefault(p.url.strip(), []).append(p)
+
+    def _unindex(self, p):
+        for index, key in ((self._by_name, p.name), (self._by_url, p.url.strip())):
+            bucket = index.get(key)
+            if bucket is None:
+                continue
+            # профили с одним именем/URL — единицы, список короткий
+            bucket[:] = [q for q in bucket if q is not p]
+            if not bucket:
+                del index[key]
+
+    def _prune_nodes(self, url):
+        # узлы держим, пока подписка нужна хоть одному профилю;
+        # зовём после переиндексации — правка самого профиля их не теряет
+        if url.strip() not in self._by_url:
+            self._nodes.pop(url.strip(), None)
+
+    def _notify(self, event, idx, profile):
+        for callback in list(self._listeners):
+            callback(event, idx, profile)
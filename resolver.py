@@ -0,0 +1,274 @@
+"""
+Разрешение адресов серверов для bypass-правила.
+A и AAAA параллельно, гонка системного DNS с заданными резолверами
+(простые UDP-запросы), TTL-кэш и счётчики попаданий/промахов/задержки.
+"""
+import asyncio
+import ipaddress
+import random
+import socket
+import struct
+import threading
+import time
+
+from probe import getaddrinfo
+
+DNS_TIMEOUT = 2.0
+DEFAULT_TTL = 300.0
+MIN_TTL = 30.0
+MAX_TTL = 3600.0
+NEGATIVE_TTL = 30.0
+
+QTYPE_A = 1
+QTYPE_AAAA = 28
+_FAMILY_QTYPE = {socket.AF_INET: QTYPE_A, socket.AF_INET6: QTYPE_AAAA}
+
+
+# ---------- DNS по UDP ----------
+
+def _build_query(host: str, qtype: int) -> tuple:
+    qid = random.getrandbits(16)
+    header = struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(
+        bytes([len(p)]) + p for p in host.encode("idna").split(b".") if p
+    ) + b"\x00"
+    return qid, header + qname + struct.pack("!HH", qtype, 1)
+
+
+def _skip_name(data: bytes, pos: int) -> int:
+    while True:
+        length = data[pos]
+        if length == 0:
+            return pos + 1
+        if length & 0xC0 == 0xC0:   # указатель сжатия
+            return pos + 2
+        pos += 1 + length
+
+
+def _parse_response(data: bytes, qid: int, qtype: int) -> tuple:
+    """(адреса, минимальный TTL) из ответа; CNAME-цепочку пропускаем."""
+    rid, flags, qd, an, _, _ = struct.unpack_from("!HHHHHH", data, 0)
+    if rid != qid:
+        raise ValueError("DNS id mismatch")
+    rcode = flags & 0x000F
+    if rcode == 3:
+        return [], NEGATIVE_TTL     # NXDOMAIN
+    if rcode != 0:
+        raise ValueError(f"DNS rcode {rcode}")
+    pos = 12
+    for _ in range(qd):
+        pos = _skip_name(data, pos) + 4
+    addrs = []
+    ttl = MAX_TTL
+    for _ in range(an):
+        pos = _skip_name(data, pos)
+        rtype, _, rttl, rdlen = struct.unpack_from("!HHIH", data, pos)
+        pos += 10
+        rdata = data[pos:pos + rdlen]
+        pos += rdlen
+        if rtype != qtype:
+            continue
+        family = socket.AF_INET if rtype == QTYPE_A else socket.AF_INET6
+        addrs.append(socket.inet_ntop(family, rdata))
+        ttl = min(ttl, rttl)
+    return addrs, ttl
+
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, qid, qtype, future):
+        self.qid = qid
+        self.qtype = qtype
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if self.future.done():
+            return
+        try:
+            self.future.set_result(_parse_response(data, self.qid, self.qtype))
+        except ValueError as e:
+            if "id mismatch" not in str(e):
+                self.future.set_exception(e)
+        except Exception as e:
+            self.future.set_exception(e)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+async def _udp_query(server: str, host: str, qtype: int):
+    loop = asyncio.get_running_loop()
+    qid, packet = _build_query(host, qtype)
+    future = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _DnsProtocol(qid, qtype, future),
+        remote_addr=(server, 53),
+    )
+    try:
+        transport.sendto(packet)
+        return await future
+    finally:
+        transport.close()
+
+
+async def _system_query(host: str, family: int):
+    # не в пуле по умолчанию: его asyncio.run ждёт при выходе, и зависший
+    # системный DNS держал бы resolve_many после победы UDP-ответа
+    infos = await getaddrinfo(host, None, family=family, type=socket.SOCK_STREAM)
+    addrs = list(dict.fromkeys(info[4][0] for info in infos))
+    return addrs, DEFAULT_TTL
+
+
+# ---------- резолвер ----------
+
+class ResolverStats:
+    __slots__ = ("hits", "misses", "failures", "lookups", "total_ms", "last_ms",
+                 "wins")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.lookups = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self.wins = {}      # кто из резолверов ответил первым
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.lookups if self.lookups else 0.0
+
+    def describe(self):
+        return (
+            f"DNS: кэш {self.hits}/{self.hits + self.misses}, "
+            f"ошибок {self.failures}, "
+            f"в среднем {self.avg_ms:.0f} мс (последний {self.last_ms:.0f} мс)"
+        )
+
+
+class Resolver:
+    """
+    resolve_many(hosts) → {host: [адреса]}; пустой список — не разрешилось.
+    Потокобезопасный: вызывается из рабочих потоков GUI.
+    """
+
+    def __init__(self, nameservers=(), timeout=DNS_TIMEOUT, use_system=True):
+        self.nameservers = list(nameservers)
+        self.timeout = timeout
+        self.use_system = use_system or not self.nameservers
+        self.stats = ResolverStats()
+        self._cache = {}    # host -> (адреса, истекает)
+        self._lock = threading.Lock()
+
+    def cached(self, host):
+        with self._lock:
+            entry = self._cache.get(host)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def resolve_many(self, hosts) -> dict:
+        hosts = list(dict.fromkeys(h for h in hosts if h))
+        result = {}
+        missing = []
+        for host in hosts:
+            try:
+                result[host] = [str(ipaddress.ip_address(host))]
+                continue
+            except ValueError:
+                pass
+            addrs = self.cached(host)
+            if addrs is not None:
+                result[host] = addrs
+                with self._lock:
+                    self.stats.hits += 1
+            else:
+                missing.append(host)
+
+        if missing:
+            resolved = asyncio.run(self._resolve_all(missing))
+            result.update(resolved)
+        return result
+
+    def resolve(self, host) -> list:
+        return self.resolve_many([host]).get(host, [])
+
+    def prefetch(self, hosts):
+        """Прогреть кэш в фоне (например, после обновления подписки)."""
+        hosts = list(hosts)
+        if hosts:
+            threading.Thread(
+                target=self.resolve_many, args=(hosts,), daemon=True
+            ).start()
+
+    async def _resolve_all(self, hosts):
+        found = await asyncio.gather(*(self._resolve_host(h) for h in hosts))
+        return dict(zip(hosts, found))
+
+    async def _resolve_host(self, host):
+        t0 = time.perf_counter()
+        per_family = await asyncio.gather(
+            self._race(host, socket.AF_INET),
+            self._race(host, socket.AF_INET6),
+        )
+        addrs = []
+        ttl = MAX_TTL
+        for fam_addrs, fam_ttl in per_family:
+            addrs.extend(fam_addrs)
+            if fam_addrs:
+                ttl = min(ttl, fam_ttl)
+        ms = (time.perf_counter() - t0) * 1000
+
+        ttl = max(MIN_TTL, ttl) if addrs else NEGATIVE_TTL
+        with self._lock:
+            self._cache[host] = (addrs, time.monotonic() + ttl)
+            self.stats.misses += 1
+            self.stats.lookups += 1
+            self.stats.total_ms += ms
+            self.stats.last_ms = ms
+            if not addrs:
+                self.stats.failures += 1
+        return addrs
+
+    async def _race(self, host, family):
+        """Первый непустой ответ среди системного DNS и заданных серверов."""
+        qtype = _FAMILY_QTYPE[family]
+        tasks = {}
+        if self.use_system:
+            tasks[asyncio.ensure_future(_system_query(host, family))] = "system"
+        for ns in self.nameservers:
+            tasks[asyncio.ensure_future(_udp_query(ns, host, qtype))] = ns
+
+        pending = set(tasks)
+        best = ([], NEGATIVE_TTL)
+        deadline = time.monotonic() + self.timeout
+        try:
+            while pending:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=left, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        continue
+                    addrs, ttl = task.result()
+                    if addrs:
+                        with self._lock:
+                            name = tasks[task]
+                            self.stats.wins[name] = self.stats.wins.get(name, 0) + 1
+                        return addrs, ttl
+        finally:
+            for task in pending:
+                task.cancel()
+        return best
+
+
+def bypass_cidrs(addresses) -> list:
+    """/32 для IPv4 и /128 для IPv6."""
+    cidrs = []
+    for addr in addresses:
+        ip = ipaddress.ip_address(addr)
+        cidrs.append(f"{ip}/{ip.max_prefixlen}")
+    return list(dict.fromkeys(cidrs))
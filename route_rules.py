@@ -0,0 +1,206 @@
+"""
+Сборка списка route.rules: слияние и порядок.
+
+sing-box проверяет правила по очереди до первого совпадения, поэтому
+    {"process_name": ["a.exe"], "outbound": "direct"}
+    {"process_name": ["b.exe"], "outbound": "direct"}
+— два прохода там, где хватит одного списка. emit_rules() сливает
+правила с одним outbound/action и одним видом матчера, убирая повторы
+значений. Сливаем только внутри серии подряд идущих правил с одной
+целью: между сериями порядок значим, внутри серии — нет (все ведут
+туда же), поэтому её можно ещё и упорядочить по частоте срабатываний.
+
+    python route_rules.py [путь к sing-box] — правил и запуск sing-box до/после
+"""
+
+# поля действия правила; всё остальное — матчеры
+TARGET_KEYS = ("outbound", "action", "method", "no_drop")
+# домены внутри одного правила sing-box объединяет по ИЛИ
+DOMAIN_KEYS = ("domain", "domain_suffix", "domain_keyword", "domain_regex")
+
+
+def rule_target(rule):
+    return tuple(rule.get(k) for k in TARGET_KEYS)
+
+
+def rule_kind(rule):
+    """
+    Вид матчера, по которому правила сливаются; None — правило
+    из нескольких условий (И), такое не трогаем.
+    """
+    keys = [k for k in rule if k not in TARGET_KEYS]
+    if not keys or not all(isinstance(rule[k], list) for k in keys):
+        return None
+    if all(k in DOMAIN_KEYS for k in keys):
+        return "domain"
+    if len(keys) == 1:
+        return keys[0]
+    return None
+
+
+def _merge(into, rule):
+    for key, values in rule.items():
+        if key in TARGET_KEYS:
+            continue
+        # dict сохраняет порядок первого появления и отсекает повторы
+        into.setdefault(key, {}).update(dict.fromkeys(values))
+
+
+def emit_rules(rules, hits=None):
+    """
+    Слитые правила в исходном порядке серий. hits — {вид: срабатываний}
+    (RuleHits.counts): частые виды внутри серии идут первыми.
+    """
+    out = []
+    i = 0
+    while i < len(rules):
+        target = rule_target(rules[i])
+        run = []
+        merged = {}     # вид → {ключ: значения} для слитого правила
+        while i < len(rules) and rule_target(rules[i]) == target:
+            rule = rules[i]
+            kind = rule_kind(rule)
+            if kind is None:
+                run.append(rule)
+            elif kind in merged:
+                _merge(merged[kind], rule)
+            else:
+                merged[kind] = {}
+                _merge(merged[kind], rule)
+                run.append(kind)
+            i += 1
+
+        emitted = []
+        for item in run:
+            if isinstance(item, str):
+                rule = {key: list(values) for key, values in merged[item].items()}
+                for key, value in zip(TARGET_KEYS, target):
+                    if value is not None:
+                        rule[key] = value
+                emitted.append((item, rule))
+            else:
+                emitted.append((rule_kind(item), item))
+        if hits:
+            emitted.sort(key=lambda pair: -hits.get(pair[0], 0))
+        out.extend(rule for _kind, rule in emitted)
+    return out
+
+
+def hit_kind(rule_text):
+    """
+    Строка rule из Clash API («process_name=[a.exe] => direct») → вид
+    матчера в терминах rule_kind; None — final и прочее без правила.
+    """
+    head = rule_text.split("=", 1)[0].strip().lstrip("!(")
+    if not head or head == rule_text.strip():
+        return None
+    return "domain" if head in DOMAIN_KEYS else head
+
+
+class RuleHits:
+    """
+    Сколько новых соединений пришлось на каждый вид правила.
+    observe() получает список из /connections; считаем только id,
+    которых не было в прошлом снимке.
+    """
+
+    def __init__(self, counts=None):
+        self.counts = dict(counts or {})
+        self.changed = False
+        self._seen = set()
+
+    def observe(self, connections):
+        current = set()
+        for conn in connections:
+            cid = conn.get("id")
+            if not cid:
+                continue
+            current.add(cid)
+            if cid in self._seen:
+                continue
+            kind = hit_kind(conn.get("rule") or "")
+            if kind is not None:
+                self.counts[kind] = self.counts.get(kind, 0) + 1
+                self.changed = True
+        self._seen = current
+
+
+def _startup_ms(sing_box_exe, path, timeout=30.0):
+    """`sing-box run` до строки «sing-box started», мс; None — не поднялся."""
+    import subprocess
+    import threading
+    import time
+
+    from config_cache import singbox_env
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sing_box_exe, "run", "-c", str(path)],
+        env=singbox_env(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+    )
+    # завис без вывода — убиваем, чтение stdout тогда закончится само
+    watchdog = threading.Timer(timeout, proc.kill)
+    watchdog.start()
+    took = None
+    try:
+        for line in proc.stdout:
+            if "sing-box started" in line:
+                took = (time.perf_counter() - t0) * 1000
+                break
+    finally:
+        watchdog.cancel()
+        proc.terminate()
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return took
+
+
+def _bench(sing_box_exe=None, apps=500, sites=2000, nets=300, runs=5):
+    """Правил и время запуска sing-box с одним route до и после слияния."""
+    import json
+    import tempfile
+    from pathlib import Path
+
+    rules = [{"protocol": "dns", "outbound": "dns-out"}]
+    rules.append({"ip_cidr": ["203.0.113.7/32"], "outbound": "direct"})
+    rules.append({"domain_suffix": ["ru", "su", "xn--p1ai"], "outbound": "direct"})
+    rules.append({"domain": [f"s{i}.example.com" for i in range(sites)], "outbound": "direct"})
+    rules.append({"ip_cidr": [f"10.{i // 256}.{i % 256}.0/24" for i in range(nets)], "outbound": "direct"})
+    # как раньше собирал build_route: по правилу на каждую программу
+    rules.extend({"process_name": [f"app{i}.exe"], "outbound": "direct"} for i in range(apps))
+    before = rules
+    after = emit_rules(before)
+    print(f"правил: {len(before)} → {len(after)}")
+
+    if not sing_box_exe:
+        return
+    for name, variant in (("до", before), ("после", after)):
+        config = {
+            # info — ради строки «sing-box started»; без inbound'ов, TUN не нужен
+            "log": {"level": "info"},
+            "outbounds": [
+                {"type": "direct", "tag": "direct"},
+                {"type": "dns", "tag": "dns-out"},
+            ],
+            "route": {"rules": variant, "final": "direct"},
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "config.json"
+            path.write_text(json.dumps(config), encoding="utf-8")
+            times = [t for t in (_startup_ms(sing_box_exe, path) for _ in range(runs)) if t]
+        if not times:
+            print(f"sing-box {name}: не запустился")
+            continue
+        print(f"запуск sing-box {name}: {min(times):.0f} мс (лучшее из {runs})")
+
+
+if __name__ == "__main__":
+    import sys
+
+    _bench(sys.argv[1] if len(sys.argv) > 1 else None)
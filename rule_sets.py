@@ -0,0 +1,139 @@
+"""
+Локальные rule-set'ы sing-box для больших списков исключений.
+Список компилируется в .srs (`sing-box rule-set compile`) один раз на
+каждое новое содержимое; в config.json остаётся только ссылка в
+route.rule_set, так что размер конфига и разбор на старте не растут
+вместе со списком. Не вышло скомпилировать — тот же список в
+source-формате (JSON рядом), конфиг всё равно маленький.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+from config_cache import popen_window_flags, singbox_env
+
+RULE_SET_DIR = "singbox_rulesets"
+RULE_SET_KEEP = 40          # файлов каждого вида (.srs/.json) на тег держим на диске
+RULE_SET_VERSION = 1        # формат source: 1 понимают все sing-box с rule-set
+COMPILE_TIMEOUT = 30.0
+
+
+def rule_set_digest(rules, binary=""):
+    """Канонический source-JSON и хэш (содержимое + версия sing-box)."""
+    data = json.dumps(
+        {"version": RULE_SET_VERSION, "rules": rules},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    digest = hashlib.sha256(data + binary.encode()).hexdigest()[:24]
+    return data, digest
+
+
+class RuleSetCache:
+    """
+    prepare() → элемент route.rule_set для списка правил.
+    Кэш — по хэшу, поэтому правка списка даёт новый путь, а тот же
+    список (в т.ч. после перезапуска) берётся с диска без компиляции.
+    """
+
+    def __init__(self, cache_dir=RULE_SET_DIR, keep=RULE_SET_KEEP, log=None):
+        self.cache_dir = Path(cache_dir)
+        self.keep = keep
+        self.log = log or (lambda _text: None)
+        self._lock = threading.Lock()
+
+    def _binary_id(self, sing_box_exe):
+        # .srs зависит от версии sing-box — как и вердикт check в ConfigCache
+        try:
+            st = Path(sing_box_exe).stat()
+            return f"{st.st_size}:{int(st.st_mtime)}"
+        except (OSError, TypeError):
+            return ""
+
+    def prepare(self, tag, rules, sing_box_exe=None) -> dict:
+        binary = self._binary_id(sing_box_exe) if sing_box_exe else ""
+        data, digest = rule_set_digest(rules, binary)
+        source = self.cache_dir / f"{tag}-{digest}.json"
+        binary_path = source.with_suffix(".srs")
+
+        with self._lock:
+            if binary and binary_path.exists():
+                self._touch(binary_path)
+                return self._entry(tag, binary_path, "binary")
+            if not source.exists():
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp = source.with_name(source.name + ".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, source)
+            else:
+                self._touch(source)
+            if binary and self._compile(sing_box_exe, source, binary_path):
+                self._prune(tag)
+                return self._entry(tag, binary_path, "binary")
+            self._prune(tag)
+            return self._entry(tag, source, "source")
+
+    # ---------- внутреннее ----------
+
+    @staticmethod
+    def _entry(tag, path, fmt):
+        # sing-box ищет относительные пути от своего cwd — даём абсолютный
+        return {"type": "local", "tag": tag, "format": fmt, "path": str(path.resolve())}
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)   # для очистки по давности
+        except OSError:
+            pass
+
+    def _compile(self, sing_box_exe, source, output):
+        creationflags, startupinfo = popen_window_flags()
+        tmp = output.with_name(output.name + ".tmp")
+        try:
+            res = subprocess.run(
+                [str(sing_box_exe), "rule-set", "compile",
+                 "--output", str(tmp), str(source)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                env=singbox_env(),
+                timeout=COMPILE_TIMEOUT,
+                creationflags=creationflags,
+                startupinfo=startupinfo,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.log(f"rule-set {source.stem}: не скомпилирован ({e}), беру JSON\n")
+            return False
+        if res.returncode != 0 or not tmp.exists():
+            error = res.stdout.strip().splitlines()
+            self.log(
+                f"rule-set {source.stem}: не скомпилирован "
+                f"({error[-1] if error else res.returncode}), беру JSON\n"
+            )
+            return False
+        os.replace(tmp, output)
+        return True
+
+    def _prune(self, tag):
+        """Старые версии этого тега; у других тегов — свой счёт."""
+        for suffix in (".srs", ".json"):
+            files = []
+            for p in self.cache_dir.glob(f"{tag}-*{suffix}"):
+                # vlf-ips-<хэш>, а не другой тег с тем же началом
+                if p.stem.rpartition("-")[0] != tag:
+                    continue
+                try:
+                    files.append((p.stat().st_mtime, p))
+                except OSError:
+                    pass
+            files.sort(reverse=True)
+            for _mtime, old in files[self.keep:]:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
@@ -0,0 +1,36 @@
+"""
+Замер холодного старта GUI: отметки по фазам от первой строки vlf_gui
+до окна, готового к вводу.
+
+    python vlf_gui.py --startup-report                # фазы, код 1 при превышении бюджета
+    python -X importtime vlf_gui.py --startup-report  # + какие импорты съели время
+"""
+import time
+
+STARTUP_BUDGET_MS = 400.0   # до окна, готового к вводу
+
+
+class StartupClock:
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.marks = []     # (фаза, мс от t0)
+
+    def mark(self, phase):
+        self.marks.append((phase, (time.perf_counter() - self.t0) * 1000))
+
+    @property
+    def total_ms(self):
+        return self.marks[-1][1] if self.marks else 0.0
+
+    def over_budget(self, budget_ms=STARTUP_BUDGET_MS):
+        return self.total_ms > budget_ms
+
+    def report(self, budget_ms=STARTUP_BUDGET_MS):
+        lines = []
+        prev = 0.0
+        for phase, at in self.marks:
+            lines.append(f"{phase:<28} {at - prev:8.1f} мс   (итого {at:7.1f})")
+            prev = at
+        verdict = "превышен" if self.over_budget(budget_ms) else "в норме"
+        lines.append(f"бюджет {budget_ms:.0f} мс — {verdict}")
+        return "\n".join(lines)
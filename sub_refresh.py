@@ -0,0 +1,214 @@
+"""
+Фоновое обновление подписок всех профилей.
+Интервалы с джиттером, ограниченная параллельность, backoff при ошибках.
+Для каждого профиля храним разобранные узлы и дифф с прошлой загрузкой,
+чтобы «Подключить» мог взять уже свежие данные без сети.
+"""
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from subscription import parse_subscription
+
+REFRESH_INTERVAL = 1800.0   # сек
+REFRESH_JITTER = 0.2        # ±20% к интервалу
+REFRESH_CONCURRENCY = 2
+BACKOFF_BASE = 60.0
+BACKOFF_MAX = 3600.0
+STARTUP_SPREAD = 5.0        # первые загрузки размазываем по N секундам
+
+
+class NodeDiff:
+    __slots__ = ("added", "removed", "changed")
+
+    def __init__(self, added=(), removed=(), changed=()):
+        self.added = list(added)
+        self.removed = list(removed)
+        self.changed = list(changed)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def describe(self):
+        if not self:
+            return "без изменений"
+        return (
+            f"+{len(self.added)} / -{len(self.removed)} "
+            f"/ ~{len(self.changed)} узлов"
+        )
+
+
+def diff_nodes(old, new) -> NodeDiff:
+    """Сравниваем наборы узлов по (server, port, uuid)."""
+    old_map = {n.key: n for n in old or ()}
+    new_map = {n.key: n for n in new}
+    added = [n for k, n in new_map.items() if k not in old_map]
+    removed = [n for k, n in old_map.items() if k not in new_map]
+    changed = [
+        n for k, n in new_map.items()
+        if k in old_map and old_map[k].astuple() != n.astuple()
+    ]
+    return NodeDiff(added, removed, changed)
+
+
+class SubscriptionState:
+    __slots__ = ("url", "nodes", "fetched_at", "diff", "error", "failures")
+
+    def __init__(self, url):
+        self.url = url
+        self.nodes = None
+        self.fetched_at = 0.0
+        self.diff = None
+        self.error = ""
+        self.failures = 0
+
+    def age(self):
+        return time.time() - self.fetched_at if self.nodes else None
+
+
+class RefreshScheduler:
+    """
+    Один поток-планировщик + пул на REFRESH_CONCURRENCY загрузок.
+    on_update(state) вызывается из рабочего потока после каждой попытки.
+    """
+
+    def __init__(self, fetcher, interval=REFRESH_INTERVAL,
+                 jitter=REFRESH_JITTER, concurrency=REFRESH_CONCURRENCY,
+                 on_update=None):
+        self.fetcher = fetcher
+        self.interval = interval
+        self.jitter = jitter
+        self.on_update = on_update
+        self._states = {}
+        self._heap = []         # (когда, url)
+        self._due = {}          # url -> актуальное время (устаревшие записи в куче пропускаем)
+        self._inflight = set()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, concurrency), thread_name_prefix="sub-refresh"
+        )
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    # ---------- управление ----------
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def set_urls(self, urls):
+        """Синхронизируем список подписок с профилями."""
+        urls = {u.strip() for u in urls if u and u.strip()}
+        now = time.time()
+        with self._cond:
+            for url in list(self._states):
+                if url not in urls:
+                    del self._states[url]
+                    self._due.pop(url, None)
+            for url in urls:
+                if url not in self._states:
+                    self._states[url] = SubscriptionState(url)
+                    self._schedule(url, now + random.uniform(0, STARTUP_SPREAD))
+            self._cond.notify()
+
+    def refresh_now(self, url):
+        with self._cond:
+            if url in self._states:
+                self._schedule(url, time.time())
+                self._cond.notify()
+
+    def get(self, url) -> SubscriptionState | None:
+        with self._cond:
+            return self._states.get(url.strip())
+
+    def fresh_nodes(self, url, max_age=None):
+        """Узлы из фонового обновления, если они не старше max_age (сек)."""
+        state = self.get(url)
+        if state is None or not state.nodes:
+            return None
+        max_age = self.interval if max_age is None else max_age
+        if state.age() > max_age:
+            return None
+        return state.nodes
+
+    # ---------- внутреннее ----------
+
+    def _schedule(self, url, when):
+        self._due[url] = when
+        heapq.heappush(self._heap, (when, url))
+
+    def _next_delay(self, state):
+        if state.failures:
+            base = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (state.failures - 1))
+        else:
+            base = self.interval
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap:
+                        when, url = self._heap[0]
+                        if self._due.get(url) != when or url in self._inflight:
+                            heapq.heappop(self._heap)   # устаревшая запись
+                            continue
+                        delay = when - time.time()
+                        if delay <= 0:
+                            heapq.heappop(self._heap)
+                            del self._due[url]
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                self._inflight.add(url)
+            try:
+                self._pool.submit(self._refresh, url)
+            except RuntimeError:
+                return  # пул уже остановлен
+
+    def _refresh(self, url):
+        nodes = error = None
+        try:
+            fetched = self.fetcher.fetch(url, force=True)
+            if fetched.source == "stale":
+                error = "сервер недоступен"
+            else:
+                nodes = parse_subscription(fetched.body)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+
+        with self._cond:
+            self._inflight.discard(url)
+            state = self._states.get(url)
+            if state is None:
+                return  # профиль удалили, пока качали
+            if nodes is not None:
+                state.diff = diff_nodes(state.nodes, nodes)
+                state.nodes = nodes
+                state.fetched_at = time.time()
+            if error:
+                state.error = error
+                state.failures += 1
+            else:
+                state.error = ""
+                state.failures = 0
+            if self._stopped:
+                return
+            self._schedule(url, time.time() + self._next_delay(state))
+            self._cond.notify()
+
+        if self.on_update is not None:
+            try:
+                self.on_update(state)
+            except Exception:
+                pass
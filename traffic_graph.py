@@ -0,0 +1,91 @@
+"""
+График скорости туннеля на Canvas.
+Перерисовывается по кусочку: на каждую новую точку — сдвиг уже
+нарисованного влево и два новых отрезка; масштаб меняется через
+canvas.scale без пересоздания линий.
+"""
+import tkinter as tk
+from collections import deque
+
+from clash_api import GRAPH_SAMPLES
+
+UP_COLOR = "#e0a030"
+DOWN_COLOR = "#289eb0"
+MIN_PEAK = 64 * 1024        # шкала не меньше 64 КБ/с, чтобы шум не был «горой»
+
+
+class TrafficGraph(tk.Canvas):
+    def __init__(self, master, samples=GRAPH_SAMPLES, height=48, **kw):
+        kw.setdefault("bg", "#1a1717")
+        kw.setdefault("highlightthickness", 0)
+        super().__init__(master, height=height, **kw)
+        self.samples = samples
+        self.peak = MIN_PEAK
+        self._values = deque(maxlen=samples)    # (up, down) на экране
+        self._last = None                       # (y_up, y_down) последней точки
+        self._width = 0
+        self.bind("<Configure>", self._on_resize)
+
+    @property
+    def _dx(self):
+        return self._width / max(1, self.samples - 1)
+
+    def _y(self, value):
+        h = int(self["height"])
+        return h - 2 - (h - 4) * min(value, self.peak) / self.peak
+
+    def add_points(self, points):
+        for up, down in points:
+            self._values.append((up, down))
+            top = max(up, down)
+            if top > self.peak:
+                self._rescale(top * 1.25)
+            self._add_point(up, down)
+        # шкала сама возвращается вниз, когда пики уехали с экрана
+        visible = max((max(u, d) for u, d in self._values), default=0)
+        if self.peak > MIN_PEAK and visible * 4 < self.peak:
+            self._rescale(max(MIN_PEAK, visible * 1.25))
+
+    def clear(self):
+        self.delete("sample")
+        self._values.clear()
+        self._last = None
+        self.peak = MIN_PEAK
+
+    def _add_point(self, up, down):
+        if not self._width:
+            return
+        dx = self._dx
+        x = self._width
+        y_up, y_down = self._y(up), self._y(down)
+        self.move("sample", -dx, 0)
+        if self._last is not None:
+            prev_up, prev_down = self._last
+            self.create_line(x - dx, prev_down, x, y_down,
+                             fill=DOWN_COLOR, width=2, tags="sample")
+            self.create_line(x - dx, prev_up, x, y_up,
+                             fill=UP_COLOR, width=1, tags="sample")
+        self._last = (y_up, y_down)
+        # отрезки, целиком ушедшие за левый край
+        for item in self.find_overlapping(-2 * dx, -1, -1, int(self["height"]) + 1):
+            if self.coords(item)[2] < 0:
+                self.delete(item)
+
+    def _rescale(self, peak):
+        h = int(self["height"]) - 2
+        factor = self.peak / peak
+        self.scale("sample", 0, h, 1, factor)
+        if self._last is not None:
+            self._last = tuple(h - (h - y) * factor for y in self._last)
+        self.peak = peak
+
+    def _on_resize(self, event):
+        if event.width == self._width:
+            return
+        # ширина меняется редко — тут можно и целиком перерисовать
+        self._width = event.width
+        values = list(self._values)
+        self.delete("sample")
+        self._last = None
+        for up, down in values:
+            self._add_point(up, down)
@@ -0,0 +1,397 @@
+"""
+Клиент без GUI: тот же путь подключения, что у VlfGui, через TunnelCore.
+
+    python vlf.py connect [профиль] [--detach] [--no-restart]
+    python vlf.py disconnect
+    python vlf.py status [--json]
+
+connect держит sing-box и перезапускает его при падении; состояние
+(pid раннера и sing-box, Clash API) лежит в vlf_state.json. Тяжёлые
+модули грузятся только в connect — status/disconnect стартуют мгновенно.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+CONFIG_FILE = "vlf_gui_config.json"   # как vlf_core.CONFIG_FILE, без его импорта
+STATE_FILE = "vlf_state.json"
+# вывод фонового раннера (ошибки подключения, трейсбеки); sing-box — отдельно
+RUNNER_LOG = Path("logs") / "vlf-runner.log"
+RESTART_DELAY = 2.0
+RESTART_DELAY_MAX = 60.0
+DETACH_TIMEOUT = 90.0
+DISCONNECT_TIMEOUT = 10.0
+
+
+# ---------- состояние раннера ----------
+
+def read_state(path) -> dict | None:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+
+def write_state(path, state: dict):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def remove_state(path):
+    try:
+        Path(path).unlink()
+    except OSError:
+        pass
+
+
+def stop_flag(path) -> Path:
+    """
+    Просьба disconnect не перезапускать sing-box. Отдельный файл: состояние
+    раннер переписывает целиком и затёр бы флаг внутри него.
+    """
+    path = Path(path)
+    return path.with_name(path.name + ".stop")
+
+
+def pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    if os.name == "nt":
+        # os.kill(pid, 0) на Windows убивает процесс — спрашиваем через WinAPI
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, int(pid))  # QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        ok = kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return bool(ok) and code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def live_state(path) -> dict | None:
+    """Состояние работающего раннера; протухший файл убираем."""
+    state = read_state(path)
+    if state and pid_alive(state.get("pid")):
+        return state
+    if state:
+        remove_state(path)
+    return None
+
+
+# ---------- connect ----------
+
+def pick_profile(config, wanted):
+    from profile_store import ProfileStore
+
+    profiles = ProfileStore(config)
+    if not profiles:
+        raise SystemExit("Нет профилей: добавь подписку в GUI или в vlf_gui_config.json.")
+    if not wanted:
+        return profiles.get(0)
+    found = profiles.find(wanted)
+    if found is not None:
+        return found
+    if wanted.isdigit() and 1 <= int(wanted) <= len(profiles):
+        return profiles.get(int(wanted) - 1)
+    names = ", ".join(profiles.names())
+    raise SystemExit(f"Нет профиля «{wanted}». Есть: {names}")
+
+
+def cmd_connect(args):
+    if live_state(args.state):
+        print("Уже подключен (vlf status).")
+        return 1
+    if args.detach:
+        return spawn_detached(args)
+
+    from log_pipeline import LogFileSink
+    from vlf_core import (
+        TunnelCore,
+        ensure_clash_secret,
+        find_sing_box,
+        load_config,
+        save_config,
+    )
+
+    config = load_config(args.config)
+    if ensure_clash_secret(config):
+        try:
+            save_config(config, args.config)
+        except OSError as e:
+            print(f"Не удалось сохранить секрет Clash API: {e}")
+    profile = pick_profile(config, args.profile)
+    sing_box_exe = find_sing_box()
+    if sing_box_exe is None:
+        print("Не найден sing-box: положи его рядом с программой или в PATH.")
+        return 1
+
+    sink = None
+    if config.get("log_to_file", True):
+        sink = LogFileSink(
+            max_bytes=int(config.get("log_max_mb", 10) * 1024 * 1024),
+            rotate_seconds=float(config.get("log_rotate_hours", 24)) * 3600,
+            retention=int(config.get("log_retention", 10)),
+        )
+
+    def on_lines(lines):
+        if not args.quiet:
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+        if sink is not None:
+            sink.write_lines(lines)
+
+    def log(text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    core = TunnelCore(config, log=log, on_lines=on_lines)
+    stopping = []
+
+    def on_signal(signum, _frame):
+        stopping.append(signum)
+        proc = core.proc
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    stop_requested = stop_flag(args.state)
+    remove_state(stop_requested)    # остался от раннера, убитого без finally
+    state = {
+        "pid": os.getpid(),
+        "profile": profile.name,
+        "config": str(Path(args.config).resolve()),
+    }
+    delay = RESTART_DELAY
+    code = 0
+    try:
+        while not stopping and not stop_requested.exists():
+            log(f"=== Подключение к профилю: {profile.name} ===\n")
+            try:
+                proc, started = core.connect(profile, sing_box_exe)
+            except Exception as e:
+                log(f"Ошибка подключения: {e}\n")
+                code = 1
+            else:
+                if stopping:
+                    break   # сигнал пришёл, пока качали подписку
+                up = core.wait_started(proc, started)
+                if up:
+                    api = core.running_ctx["config"].get("experimental", {}).get("clash_api")
+                    state.update(
+                        singbox_pid=proc.pid,
+                        started_at=time.time(),
+                        clash_api=api,
+                        restarts=state.get("restarts", -1) + 1,
+                    )
+                    write_state(args.state, state)
+                    log("Туннель поднят.\n")
+                    delay = RESTART_DELAY
+                elif proc.poll() is None:
+                    # жив, но «started» так и не написал — иначе proc.wait()
+                    # ждал бы вечно, а singbox_pid так и не попал бы в состояние
+                    log("sing-box не запустился вовремя, останавливаю.\n")
+                    core.stop_proc(proc)
+                proc.wait()
+                code = proc.returncode
+                log(f"sing-box завершился с кодом {code}\n")
+
+            # disconnect из другого процесса оставляет файл-флаг
+            if stopping or stop_requested.exists() or args.no_restart:
+                break
+            log(f"Перезапуск через {delay:.0f} с...\n")
+            deadline = time.monotonic() + delay
+            while not stopping and time.monotonic() < deadline:
+                if stop_requested.exists():
+                    break
+                time.sleep(0.2)
+            delay = min(RESTART_DELAY_MAX, delay * 2)
+    finally:
+        core.stop()
+        remove_state(args.state)
+        remove_state(stop_requested)
+        if sink is not None:
+            sink.close()
+        log("Туннель остановлен.\n")
+    return 0 if stopping or code == 0 else 1
+
+
+def spawn_detached(args):
+    """connect в фоне: ждём, пока раннер запишет, что туннель поднят."""
+    import subprocess
+
+    cmd = [sys.executable]
+    if not getattr(sys, "frozen", False):
+        cmd.append(str(Path(__file__).resolve()))
+    cmd += ["--config", args.config, "--state", args.state, "connect", "--quiet"]
+    if args.no_restart:
+        cmd.append("--no-restart")
+    if args.profile:
+        cmd.append(args.profile)
+
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = (
+            subprocess.DETACHED_PROCESS
+            | subprocess.CREATE_NEW_PROCESS_GROUP
+            | subprocess.CREATE_NO_WINDOW
+        )
+    else:
+        kwargs["start_new_session"] = True
+    RUNNER_LOG.parent.mkdir(parents=True, exist_ok=True)
+    with open(RUNNER_LOG, "ab") as out:
+        child = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=out,
+            stderr=subprocess.STDOUT,
+            env=dict(os.environ, PYTHONIOENCODING="utf-8"),
+            **kwargs,
+        )
+    deadline = time.monotonic() + DETACH_TIMEOUT
+    while time.monotonic() < deadline:
+        state = read_state(args.state)
+        if state and state.get("pid") == child.pid and state.get("singbox_pid"):
+            print(f"Подключен: {state['profile']} (pid {child.pid})")
+            return 0
+        if child.poll() is not None:
+            print(f"Не удалось подключиться — подробности в {RUNNER_LOG}.")
+            return 1
+        time.sleep(0.1)
+    print("Туннель не поднялся вовремя, раннер продолжает попытки (vlf status).")
+    return 1
+
+
+# ---------- disconnect / status ----------
+
+def cmd_disconnect(args):
+    state = live_state(args.state)
+    if state is None:
+        print("Не подключен.")
+        return 0
+    try:
+        stop_flag(args.state).touch()
+    except OSError as e:
+        print(f"Не удалось записать флаг остановки: {e}")
+    # sing-box гасим сами (на Windows сигнал раннеру не доставить);
+    # раннер увидит флаг, не станет перезапускать и уберёт файлы состояния
+    for pid in (state.get("singbox_pid"), state.get("pid")):
+        if pid_alive(pid):
+            try:
+                os.kill(int(pid), signal.SIGTERM)
+            except OSError:
+                pass
+            break
+    deadline = time.monotonic() + DISCONNECT_TIMEOUT
+    while time.monotonic() < deadline:
+        if not pid_alive(state["pid"]):
+            remove_state(args.state)
+            print("Отключен.")
+            return 0
+        time.sleep(0.1)
+    print(f"Раннер (pid {state['pid']}) не завершился за {DISCONNECT_TIMEOUT:.0f} с.")
+    return 1
+
+
+def clash_totals(api, timeout=1.0):
+    """Суммарный трафик и число соединений из Clash API, если он отвечает."""
+    import urllib.request
+
+    req = urllib.request.Request(
+        f"http://{api['external_controller']}/connections",
+        headers={"Authorization": f"Bearer {api['secret']}"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            data = json.loads(resp.read())
+    except Exception:
+        return None
+    return {
+        "upload": data.get("uploadTotal", 0),
+        "download": data.get("downloadTotal", 0),
+        "connections": len(data.get("connections") or []),
+    }
+
+
+def cmd_status(args):
+    state = live_state(args.state)
+    if state is None:
+        if args.json:
+            print(json.dumps({"connected": False}))
+        else:
+            print("Отключен.")
+        return 3
+    info = {
+        "connected": bool(state.get("singbox_pid")) and pid_alive(state.get("singbox_pid")),
+        "profile": state.get("profile"),
+        "pid": state.get("pid"),
+        "singbox_pid": state.get("singbox_pid"),
+        "uptime": int(time.time() - state["started_at"]) if state.get("started_at") else None,
+        "restarts": state.get("restarts", 0),
+    }
+    if info["connected"] and state.get("clash_api"):
+        info["traffic"] = clash_totals(state["clash_api"])
+    if args.json:
+        print(json.dumps(info, ensure_ascii=False))
+        return 0 if info["connected"] else 3
+
+    if not info["connected"]:
+        print(f"Подключение: {info['profile']} (раннер pid {info['pid']}, sing-box ещё не поднят)")
+        return 3
+    uptime = info["uptime"] or 0
+    print(f"Подключен: {info['profile']}")
+    print(f"  sing-box pid {info['singbox_pid']}, раннер pid {info['pid']}")
+    print(f"  работает {uptime // 3600} ч {uptime % 3600 // 60} мин, перезапусков {info['restarts']}")
+    traffic = info.get("traffic")
+    if traffic:
+        from clash_api import format_bytes
+
+        print(
+            f"  трафик ↑ {format_bytes(traffic['upload'])} ↓ {format_bytes(traffic['download'])}, "
+            f"соединений {traffic['connections']}"
+        )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="vlf", description="VLF VPN без GUI")
+    parser.add_argument("--config", default=CONFIG_FILE, help="настройки (как у GUI)")
+    parser.add_argument("--state", default=STATE_FILE, help="файл состояния раннера")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("connect", help="поднять туннель")
+    p.add_argument("profile", nargs="?", help="имя профиля или его номер (с 1)")
+    p.add_argument("--detach", action="store_true", help="работать в фоне")
+    p.add_argument("--no-restart", action="store_true", help="не перезапускать sing-box при падении")
+    p.add_argument("--quiet", action="store_true", help="не печатать лог sing-box")
+    p.set_defaults(func=cmd_connect)
+
+    p = sub.add_parser("disconnect", help="опустить туннель")
+    p.set_defaults(func=cmd_disconnect)
+
+    p = sub.add_parser("status", help="состояние туннеля")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_status)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,962 @@
+"""
+Ядро клиента без Tk: профили, настройки, сборка config.json для sing-box
+и весь путь подключения — подписка → узлы → замер → DNS → config →
+sing-box → наблюдение за процессом, плюс горячая замена route.
+VlfGui и CLI (vlf.py) работают через TunnelCore и получают события колбэками.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from ad_block import BLOCK_RULE_SET, DEFAULT_BLOCK_LISTS, BlockLists
+from clash_api import CLASH_API_PORT, clash_api_config, free_port, new_secret
+from config_cache import ConfigCache, popen_window_flags, singbox_env
+from config_writer import write_json_atomic
+from domains import RU_SUFFIXES, domain_rule, normalize_domains
+from geo_rules import GEO_CONNECT_TIMEOUT, GeoRuleSets
+from log_pipeline import LOG_CAPACITY, iter_line_batches
+from networks import normalize_networks
+from resolver import Resolver, bypass_cidrs
+from route_rules import emit_rules
+from rule_sets import RuleSetCache
+from sub_refresh import RefreshScheduler
+from subscription import (
+    SubscriptionFetcher,
+    VlessNode,
+    parse_subscription,
+    parse_vless_url,
+)
+
+CONFIG_FILE = "vlf_gui_config.json"
+
+# urltest-группа: проверка узлов внутри sing-box
+URLTEST_URL = "https://www.gstatic.com/generate_204"
+URLTEST_INTERVAL = "3m"
+URLTEST_TOLERANCE = 50   # мс: не прыгаем между почти равными узлами
+URLTEST_MAX_NODES = 50   # больше — лишняя нагрузка на sing-box
+
+# TUN-слоты: при горячей замене новый sing-box поднимается на соседнем
+# интерфейсе, пока старый ещё работает
+TUN_SLOTS = [
+    ("vlf_tun", "172.19.0.1/28"),
+    ("vlf_tun1", "172.19.0.17/28"),
+]
+SINGBOX_START_TIMEOUT = 10.0
+SITE_RULE_SET = "vlf-sites"     # тег rule-set'а с исключениями по доменам
+SITE_RULE_SET_MIN = 256         # доменов меньше — прямо в правило, без компиляции
+IP_RULE_SET = "vlf-ips"         # то же для сетей
+IP_RULE_SET_MIN = 256           # префиксов меньше — прямо в ip_cidr правила
+
+# системный DNS; TunnelCore подменяет своим (с резолверами из настроек)
+default_resolver = Resolver()
+
+
+class Profile:
+    __slots__ = ("name", "url", "ptype", "address", "remark", "multi_node",
+                 "urltest_interval", "urltest_tolerance")
+
+    def __init__(self, name, url, ptype="VLESS", address="", remark="",
+                 multi_node=False, urltest_interval=URLTEST_INTERVAL,
+                 urltest_tolerance=URLTEST_TOLERANCE):
+        self.name = name
+        self.url = url
+        self.ptype = ptype      # Тип (VLESS)
+        self.address = address  # host:port
+        self.remark = remark    # имя/label из #fragment
+        # все узлы подписки в urltest-группе (автовыбор внутри sing-box)
+        self.multi_node = multi_node
+        self.urltest_interval = urltest_interval
+        self.urltest_tolerance = urltest_tolerance
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "url": self.url,
+            "ptype": self.ptype,
+            "address": self.address,
+            "remark": self.remark,
+            "multi_node": self.multi_node,
+            "urltest_interval": self.urltest_interval,
+            "urltest_tolerance": self.urltest_tolerance,
+        }
+
+    @staticmethod
+    def from_dict(data: dict):
+        return Profile(
+            data.get("name", "Без имени"),
+            data.get("url", ""),
+            data.get("ptype", "VLESS"),
+            data.get("address", ""),
+            data.get("remark", ""),
+            data.get("multi_node", False),
+            data.get("urltest_interval", URLTEST_INTERVAL),
+            data.get("urltest_tolerance", URLTEST_TOLERANCE),
+        )
+
+
+def _vless_outbound(node: VlessNode, tag: str) -> dict:
+    """vless-outbound sing-box из узла подписки."""
+    tls = {
+        "enabled": True,
+        "server_name": node.sni or node.server,
+        "utls": {"enabled": True, "fingerprint": node.fp or "chrome"},
+    }
+    if node.security == "reality":
+        tls["reality"] = {
+            "enabled": True,
+            "public_key": node.pbk,
+            "short_id": node.sid,
+        }
+
+    outbound = {
+        "type": "vless",
+        "tag": tag,
+        "server": node.server,
+        "server_port": node.port,
+        "uuid": node.uuid,
+        "tls": tls,
+    }
+
+    # транспорт: tcp — как раньше, ws/grpc/http — отдельным блоком
+    params = node.transport_params()
+    if node.network in ("ws", "httpupgrade", "http"):
+        transport = {"type": node.network}
+        if params.get("path"):
+            transport["path"] = params["path"]
+        if params.get("host"):
+            if node.network == "ws":
+                transport["headers"] = {"Host": params["host"]}
+            elif node.network == "http":
+                transport["host"] = params["host"].split(",")
+            else:
+                transport["host"] = params["host"]
+        outbound["transport"] = transport
+    elif node.network == "grpc":
+        outbound["transport"] = {
+            "type": "grpc",
+            "service_name": params.get("serviceName", ""),
+        }
+    else:
+        outbound["network"] = node.network
+
+    if node.flow:
+        outbound["flow"] = node.flow
+    return outbound
+
+
+def _node_tags(nodes):
+    """Уникальные читаемые теги outbound'ов для узлов."""
+    tags = []
+    seen = set()
+    for node in nodes:
+        base = node.label()
+        tag = base
+        n = 2
+        while tag in seen or tag in ("direct", "dns-out", "block", "auto", "proxy-out"):
+            tag = f"{base} #{n}"
+            n += 1
+        seen.add(tag)
+        tags.append(tag)
+    return tags
+
+
+def _group_outbounds(nodes, interval, tolerance):
+    """
+    По outbound'у на узел + urltest "auto" (самый быстрый узел)
+    + selector "proxy-out" (по умолчанию "auto", можно выбрать вручную).
+    """
+    nodes = nodes[:URLTEST_MAX_NODES]
+    tags = _node_tags(nodes)
+    node_outbounds = [_vless_outbound(n, t) for n, t in zip(nodes, tags)]
+    urltest = {
+        "type": "urltest",
+        "tag": "auto",
+        "outbounds": tags,
+        "url": URLTEST_URL,
+        "interval": interval or URLTEST_INTERVAL,
+        "tolerance": int(tolerance or URLTEST_TOLERANCE),
+    }
+    selector = {
+        "type": "selector",
+        "tag": "proxy-out",
+        "outbounds": ["auto"] + tags,
+        "default": "auto",
+    }
+    return [selector, urltest] + node_outbounds
+
+
+def config_servers(node, nodes=None):
+    """Серверы, которые попадут в config (для bypass-правила)."""
+    if nodes and len(nodes) > 1:
+        return list(dict.fromkeys(n.server for n in nodes[:URLTEST_MAX_NODES]))
+    return [node.server]
+
+
+def build_route(servers, server_addrs, ru_mode: bool, site_excl, app_excl,
+                site_rule_set=None, ip_excl=(), ip_rule_set=None, rule_hits=None,
+                ru_rule_sets=(), block_rule_set=None, block_action="block"):
+    """
+    Секция route: обход серверов, RU-режим, исключения.
+    Отдельно — чтобы при правке исключений менять только её.
+    site_rule_set / ip_rule_set — элементы route.rule_set с теми же
+    доменами / сетями (RuleSetCache); с ними списки в config не попадают.
+    rule_hits — {вид правила: срабатываний}, частые правила идут раньше.
+    ru_rule_sets — geoip/geosite RU (GeoRuleSets.entries()) для RU-режима.
+    block_rule_set — реклама/трекеры (BlockLists) в outbound block,
+    block_action="reject" — в action reject (sing-box 1.11+).
+    """
+    # Базовые правила маршрутизации — как в рабочем варианте
+    rules = [
+        {"protocol": "dns", "outbound": "dns-out"},
+    ]
+
+    # всегда не заворачиваем сами серверы через себя же:
+    # все A/AAAA-адреса, а неразрешённые имена — хотя бы по домену
+    server_ips = []
+    unresolved = []
+    for server in servers:
+        addrs = server_addrs.get(server)
+        if addrs:
+            server_ips.extend(addrs)
+        else:
+            unresolved.append(server)
+    if server_ips:
+        rules.append({"ip_cidr": bypass_cidrs(server_ips), "outbound": "direct"})
+    if unresolved:
+        rules.append({"domain": unresolved, "outbound": "direct"})
+
+    # Реклама и трекеры — до всех обходов: рекламный поддомен .ru тоже режем
+    if block_rule_set:
+        rule = {"rule_set": [block_rule_set["tag"]]}
+        if block_action == "reject":
+            rule["action"] = "reject"
+        else:
+            rule["outbound"] = "block"
+        rules.append(rule)
+
+    # RU-режим: суффиксы всегда, geosite/geoip — если скачаны
+    if ru_mode:
+        rules.append(
+            {"domain_suffix": list(RU_SUFFIXES), "outbound": "direct"}
+        )
+    ru_rule_sets = list(ru_rule_sets) if ru_mode else []
+    if ru_rule_sets:
+        rules.append(
+            {"rule_set": [rs["tag"] for rs in ru_rule_sets], "outbound": "direct"}
+        )
+
+    # Исключения по доменам
+    if site_rule_set:
+        rules.append({"rule_set": [site_rule_set["tag"]], "outbound": "direct"})
+    elif site_excl:
+        domains, suffixes, _report = normalize_domains(
+            site_excl, RU_SUFFIXES if ru_mode else ()
+        )
+        rule = domain_rule(domains, suffixes)
+        if rule:
+            rules.append(dict(rule, outbound="direct"))
+
+    # Исключения по сетям: одно правило на минимальный набор префиксов
+    if ip_rule_set:
+        rules.append({"rule_set": [ip_rule_set["tag"]], "outbound": "direct"})
+    elif ip_excl:
+        prefixes, _report = normalize_networks(ip_excl)
+        if prefixes:
+            rules.append({"ip_cidr": prefixes, "outbound": "direct"})
+
+    # Исключения по процессам
+    for name in app_excl:
+        rules.append({"process_name": [name], "outbound": "direct"})
+
+    route = {
+        "auto_detect_interface": True,
+        # правила с одной целью и одним видом матчера — одним правилом
+        "rules": emit_rules(rules, rule_hits),
+        "final": "proxy-out",
+    }
+    rule_sets = ru_rule_sets + [
+        rs for rs in (block_rule_set, site_rule_set, ip_rule_set) if rs
+    ]
+    if rule_sets:
+        route["rule_set"] = rule_sets
+    return route
+
+
+def build_singbox_config(node, ru_mode: bool, site_excl, app_excl, nodes=None,
+                         urltest_interval=URLTEST_INTERVAL,
+                         urltest_tolerance=URLTEST_TOLERANCE,
+                         server_addrs=None, clash_api=None, site_rule_set=None,
+                         ip_excl=(), ip_rule_set=None, rule_hits=None,
+                         ru_rule_sets=(), block_rule_set=None,
+                         block_action="block"):
+    """
+    На основе одного узла подписки собираем config.json для sing-box
+    (логика из рабочего файла). node — VlessNode или vless:// строка.
+    Если передан nodes (2+ узла) — все они идут в urltest/selector группу
+    "proxy-out", и sing-box сам переключается на живой узел.
+    server_addrs — {сервер: [адреса]} заранее; иначе разрешаем сами.
+    clash_api — блок experimental.clash_api для статистики трафика.
+    site_rule_set — исключения по доменам уже в rule-set (см. build_route).
+    ip_excl — сети и адреса в обход туннеля; ip_rule_set — они же в rule-set.
+    rule_hits — порядок правил по частоте срабатываний (см. build_route).
+    ru_rule_sets — geo rule-set'ы RU-режима (см. build_route).
+    block_rule_set / block_action — блокировка рекламы (см. build_route).
+    """
+    if isinstance(node, str):
+        node = parse_vless_url(node)
+
+    if nodes and len(nodes) > 1:
+        proxy_outbounds = _group_outbounds(
+            nodes, urltest_interval, urltest_tolerance
+        )
+    else:
+        proxy_outbounds = [_vless_outbound(node, "proxy-out")]
+    servers = config_servers(node, nodes)
+    if server_addrs is None:
+        server_addrs = default_resolver.resolve_many(servers)
+
+    outbound_direct = {"type": "direct", "tag": "direct"}
+    outbound_dns = {"type": "dns", "tag": "dns-out"}
+    outbound_block = {"type": "block", "tag": "block"}
+
+    route = build_route(
+        servers, server_addrs, ru_mode, site_excl, app_excl,
+        site_rule_set, ip_excl, ip_rule_set, rule_hits, ru_rule_sets,
+        block_rule_set, block_action,
+    )
+
+    # DNS как в старом рабочем файле:
+    # 1.1.1.1, через direct, без DoH и без detour на proxy-out
+    dns = {
+        "servers": [
+            {
+                "tag": "dns-direct",
+                "address": "1.1.1.1",
+                "address_strategy": "prefer_ipv4",
+                "detour": "direct",
+            }
+        ]
+    }
+
+    # TUN в старом формате (inet4_address) + авто-маршрутизация
+    interface_name, inet4_address = TUN_SLOTS[0]
+    inbound_tun = {
+        "type": "tun",
+        "tag": "tun-in",
+        "interface_name": interface_name,
+        "mtu": 1500,
+        "inet4_address": inet4_address,
+        "auto_route": True,
+        "strict_route": True,
+        "sniff": True,
+    }
+
+    config = {
+        "log": {"level": "info", "timestamp": True},
+        "dns": dns,
+        "inbounds": [inbound_tun],
+        "outbounds": [
+            *proxy_outbounds,
+            outbound_direct,
+            outbound_dns,
+            outbound_block,
+        ],
+        "route": route,
+    }
+    if clash_api:
+        config["experimental"] = {"clash_api": clash_api}
+    return config
+
+
+# ---------- настройки ----------
+
+SING_BOX_NAME = "sing-box.exe" if os.name == "nt" else "sing-box"
+
+
+def default_config() -> dict:
+    return {
+        "profiles": [],
+        "ru_mode": True,
+        # RU-режим по geoip-ru / geosite-category-ru (кэш, обновление в фоне)
+        "ru_geo": True,
+        # реклама и трекеры по спискам (hosts / adblock / домены) в block;
+        # "reject" вместо "block" — action reject, нужен sing-box 1.11+;
+        # его блокировки sing-box пишет только на debug — счётчика нет
+        "block_ads": False,
+        "block_lists": list(DEFAULT_BLOCK_LISTS),
+        "block_action": "block",
+        "site_exclusions": [],
+        "app_exclusions": [],
+        "ip_exclusions": [],
+        # правила, на которые чаще приходятся соединения, — раньше в route;
+        # счётчики копятся по Clash API за сеансы
+        "rule_order_by_hits": False,
+        "rule_hits": {},
+        # замер узлов перед подключением (TLS/REALITY — дольше, но точнее)
+        "probe_nodes": True,
+        "probe_handshake": False,
+        # фоновое обновление подписок, сек
+        "sub_refresh_interval": 1800,
+        # с кем гоняем системный DNS при разрешении адресов серверов
+        "dns_resolvers": ["1.1.1.1", "8.8.8.8"],
+        # правки исключений применяются к работающему туннелю сразу
+        "hot_apply": True,
+        # сколько строк лога держим в памяти
+        "log_capacity": LOG_CAPACITY,
+        # копия лога sing-box на диске с ротацией
+        "log_to_file": True,
+        "log_max_mb": 10,
+        "log_rotate_hours": 24,
+        "log_retention": 10,
+        # скорость/трафик/соединения через Clash API sing-box (localhost);
+        # секрет генерируется один раз, чтобы конфиг не менялся зря
+        "clash_api": True,
+        "clash_api_port": CLASH_API_PORT,
+        "clash_api_secret": "",
+    }
+
+
+def load_config(path=CONFIG_FILE) -> dict:
+    """Настройки по умолчанию + то, что лежит в файле (если читается)."""
+    data = default_config()
+    try:
+        data.update(json.loads(Path(path).read_text(encoding="utf-8")))
+    except Exception:
+        pass
+    return data
+
+
+def save_config(data: dict, path=CONFIG_FILE):
+    """Сразу и атомарно (CLI); GUI пишет через config_writer.ConfigWriter."""
+    write_json_atomic(path, data)
+
+
+def ensure_clash_secret(data: dict) -> bool:
+    """True — секрет только что создан и настройки надо сохранить."""
+    if data.get("clash_api_secret"):
+        return False
+    data["clash_api_secret"] = new_secret()
+    return True
+
+
+def app_base_dir() -> Path:
+    """
+    База для sing-box и ресурсов:
+      - в собранном .exe → sys._MEIPASS (PyInstaller)
+      - в исходниках → папка, где лежит этот файл
+    """
+    if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
+        return Path(sys._MEIPASS)
+    return Path(__file__).resolve().parent
+
+
+def find_sing_box(base_dir=None) -> Path | None:
+    """sing-box(.exe) рядом с программой, иначе из PATH."""
+    base_dir = Path(base_dir) if base_dir else app_base_dir()
+    for path in (base_dir / SING_BOX_NAME, base_dir / "_internal" / SING_BOX_NAME):
+        if path.exists():
+            return path
+    found = shutil.which("sing-box")
+    return Path(found) if found else None
+
+
+# ---------- туннель ----------
+
+def _noop(*_args):
+    pass
+
+
+class TunnelCore:
+    """
+    Один туннель: подключение, горячая замена route, остановка.
+    connect/hot_apply/stop — блокирующие, GUI зовёт их из рабочих потоков.
+    Колбэки приходят из любых потоков:
+      log(text)          — служебные сообщения
+      on_lines(lines)    — пачка строк stdout sing-box
+      on_exit(proc)      — процесс sing-box завершился (None — туннель
+                           не поднялся после остановки при горячей замене)
+      on_ping(text)      — итог замера узлов
+      on_switch(config)  — после горячей замены работает новый конфиг
+    """
+
+    def __init__(self, config_data, log=None, on_lines=None, on_exit=None,
+                 on_ping=None, on_switch=None):
+        self.config_data = config_data
+        self.log = log or _noop
+        self.on_lines = on_lines or _noop
+        self.on_exit = on_exit or _noop
+        self.on_ping = on_ping or _noop
+        self.on_switch = on_switch or _noop
+
+        self.proc: subprocess.Popen | None = None
+        self.stop_log = threading.Event()
+        self.running_ctx = None
+        self._switch_lock = threading.Lock()
+
+        # подписки: таймауты + кэш рядом с конфигом
+        self.sub_fetcher = SubscriptionFetcher()
+        # готовые config'и sing-box по хэшу содержимого + вердикт sing-box check
+        self.config_cache = ConfigCache()
+        # большие списки исключений — в .srs по хэшу содержимого
+        self.rule_sets = RuleSetCache(log=self.log)
+        self._site_rule = None      # ((ru_mode, исключения), нормализованное правило)
+        self._ip_prefixes = None    # (исключения, схлопнутые префиксы)
+        # geoip-ru / geosite-category-ru для RU-режима
+        self.geo = GeoRuleSets(log=self.log)
+        # списки рекламы/трекеров: разобранные — на диске, обновление в фоне
+        self.block_lists = BlockLists(log=self.log)
+        self.resolver = Resolver(config_data.get("dns_resolvers", []))
+        self.sub_scheduler = None
+
+    @property
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    # ---------- фоновое обновление подписок ----------
+
+    def start_refresh(self, urls, on_update=None, on_geo=None):
+        """
+        Фоновое обновление подписок, geo rule-set'ов RU-режима и блок-листов.
+        on_geo(теги) — вышла новая версия geo-файла или блок-листа
+        (туннель её ещё не видит).
+        """
+        on_update = on_update or _noop
+
+        def updated(state):
+            # из потока планировщика: прогреваем DNS, пока подписка свежая
+            if state.nodes:
+                self.resolver.prefetch(config_servers(state.nodes[0], state.nodes))
+            on_update(state)
+
+        self.sub_scheduler = RefreshScheduler(
+            self.sub_fetcher,
+            interval=float(self.config_data.get("sub_refresh_interval", 1800)),
+            on_update=updated,
+        )
+        self.sub_scheduler.set_urls(urls)
+        self.sub_scheduler.start()
+        if self.config_data.get("ru_geo", True):
+            # RU-режим переключают на ходу — фон сам смотрит, нужен ли он
+            self.geo.start(
+                on_update=on_geo,
+                enabled=lambda: self.config_data.get("ru_mode", True),
+            )
+        self.block_lists.start(self._block_sources, on_update=on_geo)
+
+    def set_refresh_urls(self, urls):
+        if self.sub_scheduler is not None:
+            self.sub_scheduler.set_urls(urls)
+
+    def close(self):
+        if self.sub_scheduler is not None:
+            self.sub_scheduler.stop()
+        self.geo.stop()
+        self.block_lists.stop()
+
+    # ---------- подключение ----------
+
+    def clash_api_block(self, slot):
+        if not self.config_data.get("clash_api", True):
+            return None
+        port = int(self.config_data.get("clash_api_port", CLASH_API_PORT)) + slot
+        return clash_api_config(free_port(port), self.config_data["clash_api_secret"])
+
+    def site_rule_set(self, sing_box_exe):
+        """
+        Исключения по доменам → элемент route.rule_set; None — список пуст
+        или короткий (его build_route кладёт прямо в правило).
+        """
+        sites = self.config_data.get("site_exclusions", [])
+        if not sites:
+            return None
+        ru_mode = self.config_data.get("ru_mode", True)
+        key = (ru_mode, tuple(sites))
+        if self._site_rule is None or self._site_rule[0] != key:
+            domains, suffixes, report = normalize_domains(
+                sites, RU_SUFFIXES if ru_mode else ()
+            )
+            if report.removed:
+                self.log(f"Исключения по доменам: {report.describe()}\n")
+            self._site_rule = (key, domain_rule(domains, suffixes))
+        rule = self._site_rule[1]
+        size = sum(len(values) for values in rule.values())
+        if size < SITE_RULE_SET_MIN:
+            return None
+        return self.rule_sets.prepare(SITE_RULE_SET, [rule], sing_box_exe)
+
+    def ru_rule_sets(self):
+        """geoip-ru / geosite-category-ru, если RU-режим и они скачаны."""
+        if not (self.config_data.get("ru_mode", True)
+                and self.config_data.get("ru_geo", True)):
+            return []
+        # первый раз — прямо перед подключением, дальше обновляет фон;
+        # недавно не скачалось (нет сети, GitHub недоступен) — не ждём снова
+        missing = self.geo.missing(skip_failed=True)
+        if missing:
+            self.log(f"Скачиваю {', '.join(missing)}...\n")
+            self.geo.refresh(missing, timeout=GEO_CONNECT_TIMEOUT)
+        return self.geo.entries()
+
+    def _block_sources(self):
+        if not self.config_data.get("block_ads", False):
+            return []
+        return list(self.config_data.get("block_lists", DEFAULT_BLOCK_LISTS))
+
+    def block_rule_set(self, sing_box_exe):
+        """Блок-листы → элемент route.rule_set; None — блокировка выключена."""
+        rule = self.block_lists.load(self._block_sources())
+        if not rule:
+            return None
+        return self.rule_sets.prepare(BLOCK_RULE_SET, [rule], sing_box_exe)
+
+    def block_action(self):
+        return self.config_data.get("block_action", "block")
+
+    def rule_hits(self):
+        """Счётчики срабатываний для порядка правил, если он включён."""
+        if not self.config_data.get("rule_order_by_hits", False):
+            return None
+        return self.config_data.get("rule_hits") or None
+
+    def ip_rule(self, sing_box_exe):
+        """
+        Исключения по сетям → (префиксы, элемент route.rule_set или None):
+        длинный список уходит в rule-set, короткий — прямо в правило.
+        """
+        nets = self.config_data.get("ip_exclusions", [])
+        if not nets:
+            return [], None
+        key = tuple(nets)
+        if self._ip_prefixes is None or self._ip_prefixes[0] != key:
+            prefixes, report = normalize_networks(nets)
+            if report.before != report.after or report.invalid:
+                self.log(f"Исключения по сетям: {report.describe()}\n")
+            self._ip_prefixes = (key, prefixes)
+        prefixes = self._ip_prefixes[1]
+        if len(prefixes) < IP_RULE_SET_MIN:
+            return prefixes, None
+        return prefixes, self.rule_sets.prepare(
+            IP_RULE_SET, [{"ip_cidr": prefixes}], sing_box_exe
+        )
+
+    def load_nodes(self, profile: Profile):
+        nodes = None
+        if self.sub_scheduler is not None:
+            nodes = self.sub_scheduler.fresh_nodes(profile.url)
+        if nodes:
+            age = int(self.sub_scheduler.get(profile.url).age() // 60)
+            self.log(f"Подписка: обновлена в фоне {age} мин назад, без загрузки\n")
+            return nodes
+        self.log("Скачиваю подписку...\n")
+        fetched = self.sub_fetcher.fetch(profile.url)
+        self.log(f"Подписка: {fetched.describe()}\n")
+        return parse_subscription(fetched.body)
+
+    def rank_nodes(self, nodes):
+        """Замеряем все узлы; самый быстрый — первым. Без замера — как в подписке."""
+        if len(nodes) < 2 or not self.config_data.get("probe_nodes", True):
+            return nodes
+        from probe import probe_nodes
+
+        handshake = bool(self.config_data.get("probe_handshake", False))
+        self.log(
+            f"Замеряю задержку до {len(nodes)} узлов"
+            f"{' (TLS)' if handshake else ''}...\n"
+        )
+        results = probe_nodes(nodes, handshake=handshake)
+        alive = sum(1 for r in results if r.ok)
+        for r in results[:5]:
+            self.log(f"  {r.node.label()}: {r.describe()}\n")
+
+        best = results[0]
+        if not best.ok:
+            self.log("Ни один узел не ответил, беру первый из подписки.\n")
+            self.on_ping("нет ответа")
+            return nodes
+
+        self.on_ping(f"{best.latency_ms:.0f} мс, лучший из {alive}/{len(results)}")
+        return [r.node for r in results]
+
+    def connect(self, profile: Profile, sing_box_exe, on_node=None):
+        """
+        Весь путь до запущенного sing-box. Возвращает (proc, started);
+        started выставляется, когда в логе появится «sing-box started».
+        """
+        nodes = self.load_nodes(profile)
+        self.log(f"Узлов в подписке: {len(nodes)}\n")
+        ranked = self.rank_nodes(nodes)
+        node = ranked[0]
+        self.log(f"VLESS: {node.label()}\n")
+        group = ranked if profile.multi_node and len(ranked) > 1 else None
+        if group:
+            self.log(
+                f"Автовыбор: {min(len(group), URLTEST_MAX_NODES)} узлов "
+                f"в urltest-группе\n"
+            )
+        if on_node is not None:
+            on_node(node)
+
+        servers = config_servers(node, group)
+        server_addrs = self.resolver.resolve_many(servers)
+        failed = [h for h in servers if not server_addrs.get(h)]
+        if failed:
+            self.log(
+                f"Не удалось разрешить {', '.join(failed)} — "
+                f"обход только по домену.\n"
+            )
+        self.log(f"{self.resolver.stats.describe()}\n")
+
+        ip_excl, ip_rule_set = self.ip_rule(sing_box_exe)
+        cfg_dict = build_singbox_config(
+            node=node,
+            ru_mode=self.config_data.get("ru_mode", True),
+            site_excl=self.config_data.get("site_exclusions", []),
+            app_excl=self.config_data.get("app_exclusions", []),
+            nodes=group,
+            urltest_interval=profile.urltest_interval,
+            urltest_tolerance=profile.urltest_tolerance,
+            server_addrs=server_addrs,
+            clash_api=self.clash_api_block(0),
+            site_rule_set=self.site_rule_set(sing_box_exe),
+            ip_excl=ip_excl,
+            ip_rule_set=ip_rule_set,
+            rule_hits=self.rule_hits(),
+            ru_rule_sets=self.ru_rule_sets(),
+            block_rule_set=self.block_rule_set(sing_box_exe),
+            block_action=self.block_action(),
+        )
+        cached = self.config_cache.prepare(cfg_dict, sing_box_exe)
+        if cached.reused:
+            self.log(f"config: без изменений ({cached.digest}), беру готовый.\n")
+        else:
+            self.log(f"config сгенерирован ({cached.digest}).\n")
+
+        self.log("Запускаю sing-box...\n")
+        # всё, что нужно для горячей замены route без переподключения
+        self.running_ctx = {
+            "config": cfg_dict,
+            "servers": servers,
+            "server_addrs": server_addrs,
+            "sing_box_exe": sing_box_exe,
+            "slot": 0,
+        }
+        self.stop_log.clear()
+        self.proc, started = self.start_singbox(sing_box_exe, cached.path)
+        return self.proc, started
+
+    def start_singbox(self, sing_box_exe, cfg_path):
+        """Запуск sing-box + поток чтения лога. Возвращает (proc, started)."""
+        creationflags, startupinfo = popen_window_flags()
+        proc = subprocess.Popen(
+            [str(sing_box_exe), "run", "-c", str(cfg_path)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=singbox_env(),
+            creationflags=creationflags,
+            startupinfo=startupinfo,
+        )
+        started = threading.Event()
+        threading.Thread(
+            target=self._log_reader, args=(proc, started), daemon=True
+        ).start()
+        return proc, started
+
+    def _log_reader(self, proc, started):
+        for lines in iter_line_batches(proc.stdout):
+            if not started.is_set():
+                if any("sing-box started" in line for line in lines):
+                    started.set()
+            if self.stop_log.is_set():
+                break
+            self.on_lines(lines)
+        self.on_exit(proc)
+
+    def wait_started(self, proc, started, timeout=SINGBOX_START_TIMEOUT,
+                     cancel=None):
+        """
+        Ждём «sing-box started» в логе; False — упал, не успел или
+        выставлено событие cancel.
+        """
+        deadline = time.monotonic() + timeout
+        while not started.wait(0.05):
+            if proc.poll() is not None or time.monotonic() > deadline:
+                return False
+            if cancel is not None and cancel.is_set():
+                return False
+        return proc.poll() is None
+
+    # ---------- остановка ----------
+
+    @staticmethod
+    def stop_proc(proc, timeout=5):
+        try:
+            proc.terminate()
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                proc.kill()
+                proc.wait(timeout=timeout)
+            except Exception:
+                pass
+        except Exception:
+            pass
+
+    def stop(self, timeout=5):
+        """Гасим sing-box (terminate, потом kill). True — он работал."""
+        self.stop_log.set()
+        proc = self.proc
+        was_running = proc is not None and proc.poll() is None
+        if was_running:
+            self.stop_proc(proc, timeout)
+        # идущая горячая замена проверяет stop_log на каждом шаге и гасит
+        # свой экземпляр сама (см. hot_apply), так что ждём её не дольше
+        # timeout — stop зовут и из потока GUI при закрытии окна
+        if self._switch_lock.acquire(timeout=timeout):
+            try:
+                if self.proc is not None and self.proc.poll() is None:
+                    self.stop_proc(self.proc, timeout)
+            finally:
+                self._switch_lock.release()
+        return was_running
+
+    # ---------- горячее применение исключений ----------
+
+    def hot_apply(self):
+        """
+        Новый route на работающем туннеле: make-before-break на соседнем
+        TUN-слоте, если не вышло — стоп/старт. False — идёт другая замена.
+        """
+        if not self._switch_lock.acquire(blocking=False):
+            return False
+        try:
+            self._hot_apply()
+        finally:
+            # «ВЫКЛ» посреди замены: stop() мог не дождаться — добиваем сами
+            proc = self.proc
+            if self.stop_log.is_set() and proc is not None and proc.poll() is None:
+                self.stop_proc(proc)
+            self._switch_lock.release()
+        return True
+
+    def _hot_apply(self):
+        ctx = self.running_ctx
+        old = self.proc
+        if not ctx or not old or old.poll() is not None:
+            return
+
+        exe = ctx["sing_box_exe"]
+        try:
+            site_rule_set = self.site_rule_set(exe)
+            ip_excl, ip_rule_set = self.ip_rule(exe)
+            ru_rule_sets = self.ru_rule_sets()
+            block_rule_set = self.block_rule_set(exe)
+        except OSError as e:
+            self.log(f"Исключения не применены, туннель не тронут: {e}\n")
+            return
+        cfg = dict(ctx["config"])
+        cfg["route"] = build_route(
+            ctx["servers"],
+            ctx["server_addrs"],
+            self.config_data.get("ru_mode", True),
+            self.config_data.get("site_exclusions", []),
+            self.config_data.get("app_exclusions", []),
+            site_rule_set,
+            ip_excl,
+            ip_rule_set,
+            self.rule_hits(),
+            ru_rule_sets,
+            block_rule_set,
+            self.block_action(),
+        )
+        if cfg["route"] == ctx["config"]["route"]:
+            return
+
+        # новый экземпляр — на соседнем TUN-слоте
+        slot = 1 - ctx["slot"]
+        interface_name, inet4_address = TUN_SLOTS[slot]
+        cfg["inbounds"] = [
+            dict(
+                cfg["inbounds"][0],
+                interface_name=interface_name,
+                inet4_address=inet4_address,
+            )
+        ] + cfg["inbounds"][1:]
+        # и Clash API на своём порту — два экземпляра живут одновременно
+        if "experimental" in cfg:
+            cfg["experimental"] = {"clash_api": self.clash_api_block(slot)}
+
+        try:
+            cached = self.config_cache.prepare(cfg, exe)
+        except Exception as e:
+            self.log(f"Исключения не применены, туннель не тронут: {e}\n")
+            return
+
+        self.log("Применяю исключения без переподключения...\n")
+        t0 = time.monotonic()
+        new, started = self.start_singbox(exe, cached.path)
+        up = self.wait_started(new, started, cancel=self.stop_log)
+        if self.stop_log.is_set():
+            self.stop_proc(new)   # пока поднимали — нажали «ВЫКЛ»
+            return
+        if up:
+            # make-before-break: новый уже работает, гасим старый
+            ready_ms = (time.monotonic() - t0) * 1000
+            self.proc = new
+            self.on_switch(cfg)
+            # маршрут без перерыва: новый уже работает, пока гасим старый
+            t_stop = time.monotonic()
+            self.stop_proc(old)
+            stop_ms = (time.monotonic() - t_stop) * 1000
+            self.log(
+                f"Исключения применены: новый sing-box за {ready_ms:.0f} мс, "
+                f"старый остановлен за {stop_ms:.0f} мс\n"
+            )
+        else:
+            # рядом не поднялся (например, TUN занят) — стоп/старт подряд
+            if new.poll() is None:
+                self.stop_proc(new)
+            # старый слот освободится — занимаем его же
+            slot = ctx["slot"]
+            cfg["inbounds"] = ctx["config"]["inbounds"]
+            if "experimental" in cfg:
+                cfg["experimental"] = ctx["config"]["experimental"]
+            try:
+                cached = self.config_cache.prepare(cfg, exe)
+            except Exception as e:
+                self.log(f"Исключения не применены, туннель не тронут: {e}\n")
+                return
+            if self.stop_log.is_set():
+                return
+            self.proc = None
+            t_down = time.monotonic()
+            self.stop_proc(old)
+            try:
+                new, started = self.start_singbox(exe, cached.path)
+            except Exception as e:
+                # старый уже остановлен, его on_exit GUI пропустит —
+                # сообщаем об отключении сами
+                self.log(f"Новый sing-box не запустился: {e}\n")
+                self.on_exit(None)
+                return
+            self.proc = new
+            if not self.wait_started(new, started, cancel=self.stop_log):
+                if not self.stop_log.is_set():
+                    self.log("Новый sing-box не запустился.\n")
+                # завис без «started» — гасим, on_exit(new) сбросит GUI
+                if new.poll() is None:
+                    self.stop_proc(new)
+                return
+            # от начала остановки старого до «started» нового — без маршрута
+            down_ms = (time.monotonic() - t_down) * 1000
+            self.log(
+                f"Исключения применены перезапуском, туннель лежал "
+                f"{down_ms:.0f} мс\n"
+            )
+
+        ctx["config"] = cfg
+        ctx["slot"] = slot
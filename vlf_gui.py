@@ -1,18 +1,51 @@
+import time
+
+_START = time.perf_counter()   # отсчёт холодного старта (startup_report)
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox as tk_messagebox
-import json
-import subprocess
-import threading
-import os
 import sys
+import threading
 import urllib.request
-from pathlib import Path
-from urllib.parse import urlparse, parse_qs, unquote
-import base64
-import socket
 import webbrowser
 
 import dark_messagebox as messagebox  # тёмные messagebox'ы
+from ad_block import BlockStats
+from clash_api import ClashApiPoller, format_bytes
+from config_writer import ConfigWriter
+from connections_view import ConnectionsWindow
+from domains import normalize_domain
+from exclusion_import import import_exclusions
+from log_index import LogIndex, parse_line, parse_query
+from log_pipeline import (
+    LOG_CAPACITY,
+    LOG_PAGE_LINES,
+    LOG_TICK_MS,
+    LOG_VIEW_LINES,
+    LogFileSink,
+    LogQueue,
+    LogRing,
+    split_lines,
+)
+from networks import normalize_networks, parse_network
+from profile_store import ADDED, REMOVED, ProfileStore
+from route_rules import RuleHits
+from startup_report import STARTUP_BUDGET_MS, StartupClock
+from subscription import VlessNode
+from traffic_graph import TrafficGraph
+from vlf_core import (
+    CONFIG_FILE,
+    SING_BOX_NAME,
+    URLTEST_INTERVAL,
+    URLTEST_TOLERANCE,
+    Profile,
+    TunnelCore,
+    app_base_dir,
+    default_config,
+    ensure_clash_secret,
+    find_sing_box,
+    load_config,
+)
 
 # Цвета (nekobox-style)
 COLOR_BG = "#262424"
@@ -24,226 +57,42 @@ GREEN_BTN = "#16a34a"
 RED_BTN = "#b02828"
 GRAY_BTN = "#4b5563"
 
-try:
-    from PIL import Image, ImageTk
-    from pyzbar.pyzbar import decode as qr_decode
-    QR_AVAILABLE = True
-except Exception:
-    Image = None
-    ImageTk = None
-    qr_decode = None
-    QR_AVAILABLE = False
-
-APP_TITLE = "VLF VPN Tunnel client"
-CONFIG_FILE = "vlf_gui_config.json"
-
-
-class Profile:
-    def __init__(self, name, url, ptype="VLESS", address="", remark=""):
-        self.name = name
-        self.url = url
-        self.ptype = ptype      # Тип (VLESS)
-        self.address = address  # host:port
-        self.remark = remark    # имя/label из #fragment
-
-    def to_dict(self):
-        return {
-            "name": self.name,
-            "url": self.url,
-            "ptype": self.ptype,
-            "address": self.address,
-            "remark": self.remark,
-        }
-
-    @staticmethod
-    def from_dict(data: dict):
-        return Profile(
-            data.get("name", "Без имени"),
-            data.get("url", ""),
-            data.get("ptype", "VLESS"),
-            data.get("address", ""),
-            data.get("remark", ""),
-        )
-
-
-def decode_subscription_to_vless(sub_bytes: bytes) -> str:
-    """
-    Берём содержимое подписки и вытаскиваем первую vless:// ссылку.
-    Поддерживаем:
-      - текст с vless:// строкой;
-      - base64 от одной/нескольких ссылок.
-    """
-    text = sub_bytes.decode("utf-8", errors="ignore").strip()
-    if not text:
-        raise ValueError("Subscription is empty")
-
-    # 1) прямой vless в тексте
-    for line in text.splitlines():
-        s = line.strip()
-        if s.startswith("vless://"):
-            return s
-
-    # 2) base64
-    compact = "".join(text.split())
-    try:
-        decoded = base64.b64decode(compact)
-        decoded_text = decoded.decode("utf-8", errors="ignore")
-    except Exception as e:
-        raise ValueError("Cannot decode subscription as base64") from e
-
-    for line in decoded_text.splitlines():
-        s = line.strip()
-        if s.startswith("vless://"):
-            return s
-
-    raise ValueError("No vless:// URL in subscription")
-
-
-def build_singbox_config(vless_url: str, ru_mode: bool, site_excl, app_excl):
-    """На основе одной VLESS-ссылки собираем config.json для sing-box (логика из рабочего файла)."""
-    u = urlparse(vless_url)
-    if u.scheme != "vless":
-        raise ValueError("Not a vless:// URL")
-
-    uuid = u.username or ""
-    server = u.hostname or ""
-    port = u.port or 443
-
-    q = parse_qs(u.query)
-
-    def qget(key, default=""):
-        vals = q.get(key)
-        return vals[0] if vals else default
-
-    flow = qget("flow", "")
-    security = qget("security", "")
-    fp = qget("fp", "") or "chrome"
-    pbk = qget("pbk", "")
-    sid = qget("sid", "")
-    sni = qget("sni", "") or server
-    network = qget("type", "tcp")
-
-    tls = {
-        "enabled": True,
-        "server_name": sni,
-        "utls": {"enabled": True, "fingerprint": fp},
-    }
-    if security == "reality":
-        tls["reality"] = {
-            "enabled": True,
-            "public_key": pbk,
-            "short_id": sid,
-        }
-
-    outbound_proxy = {
-        "type": "vless",
-        "tag": "proxy-out",
-        "server": server,
-        "server_port": port,
-        "uuid": uuid,
-        "network": network,
-        "tls": tls,
-    }
-    if flow:
-        outbound_proxy["flow"] = flow
-
-    outbound_direct = {"type": "direct", "tag": "direct"}
-    outbound_dns = {"type": "dns", "tag": "dns-out"}
-    outbound_block = {"type": "block", "tag": "block"}
-
-    # Базовые правила маршрутизации — как в рабочем варианте
-    rules = [
-        {"protocol": "dns", "outbound": "dns-out"},
-    ]
-
-    # всегда не заворачиваем сам сервер через себя же
-    try:
-        server_ip = socket.gethostbyname(server)
-        rules.append({"ip_cidr": [f"{server_ip}/32"], "outbound": "direct"})
-    except Exception:
-        pass
-
-    # RU-режим
-    if ru_mode:
-        rules.append(
-            {"domain_suffix": ["ru", "su", "рф"], "outbound": "direct"}
-        )
-
-    # Исключения по доменам
-    if site_excl:
-        rules.append({"domain": site_excl, "outbound": "direct"})
-
-    # Исключения по процессам
-    for name in app_excl:
-        rules.append({"process_name": name, "outbound": "direct"})
-
-    route = {
-        "auto_detect_interface": True,
-        "rules": rules,
-        "final": "proxy-out",
-    }
-
-    # DNS как в старом рабочем файле:
-    # 1.1.1.1, через direct, без DoH и без detour на proxy-out
-    dns = {
-        "servers": [
-            {
-                "tag": "dns-direct",
-                "address": "1.1.1.1",
-                "address_strategy": "prefer_ipv4",
-                "detour": "direct",
-            }
-        ]
-    }
-
-    # TUN в старом формате (inet4_address) + авто-маршрутизация
-    inbound_tun = {
-        "type": "tun",
-        "tag": "tun-in",
-        "interface_name": "vlf_tun",
-        "mtu": 1500,
-        "inet4_address": "172.19.0.1/28",
-        "auto_route": True,
-        "strict_route": True,
-        "sniff": True,
-    }
-
-    config = {
-        "log": {"level": "info", "timestamp": True},
-        "dns": dns,
-        "inbounds": [inbound_tun],
-        "outbounds": [
-            outbound_proxy,
-            outbound_direct,
-            outbound_dns,
-            outbound_block,
-        ],
-        "route": route,
-    }
-    return config
-
-
-
 
+# PIL и pyzbar нужны только кнопке «Из QR» — грузим при первом нажатии
+_qr_available = None
 
 
+def qr_available():
+    """Есть ли PIL и pyzbar — без их импорта (он дорогой)."""
+    global _qr_available
+    if _qr_available is None:
+        from importlib.util import find_spec
+        _qr_available = all(find_spec(m) is not None for m in ("PIL", "pyzbar"))
+    return _qr_available
 
 
+def decode_qr(path):
+    from PIL import Image
+    from pyzbar.pyzbar import decode
 
+    with Image.open(path) as img:
+        return decode(img)
 
+APP_TITLE = "VLF VPN Tunnel client"
+HOT_APPLY_DELAY_MS = 400   # пачка правок подряд → одна замена
+TRAFFIC_TICK_MS = 1000
 
 
 class VlfGui(tk.Tk):
-    def __init__(self):
+    def __init__(self, startup_report=False):
+        self.startup = StartupClock(_START)
+        self.startup.mark("импорт модулей")
+        self._startup_report = startup_report
         super().__init__()
+        self.startup.mark("Tk")
 
-        # База для sing-box.exe и config.json:
-        #   - в собранном .exe → sys._MEIPASS (PyInstaller)
-        #   - в исходниках → папка, где лежит vlf_gui.py
-        if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
-            self.base_dir = Path(sys._MEIPASS)
-        else:
-            self.base_dir = Path(__file__).resolve().parent
+        # база для sing-box и ресурсов (рядом с программой или _MEIPASS)
+        self.base_dir = app_base_dir()
 
         icon_path = self.base_dir / "vlf.ico"
         if icon_path.exists():
@@ -253,56 +102,136 @@ class VlfGui(tk.Tk):
                 pass
 
         self.title(APP_TITLE)
-        self.geometry("820x620")
+        self.geometry("820x680")
         self.resizable(False, False)
 
-        self.config_data = {
-            "profiles": [],
-            "ru_mode": True,
-            "site_exclusions": [],
-            "app_exclusions": [],
-        }
+        self.config_data = default_config()
         self.current_profile_index = None
 
-        self.proc: subprocess.Popen | None = None
-        self.log_thread: threading.Thread | None = None
-        self.stop_log = threading.Event()
+        self.core = None
+        self._hot_apply_job = None
+        # stdout sing-box → очередь → Text пачками по таймеру
+        self.log_queue = LogQueue()
+        self._log_ticks = 0
+        self._ui_thread = threading.current_thread()
 
         # Переменные для инфо по профилю
         self.profile_type_var = tk.StringVar(value="")
         self.profile_addr_var = tk.StringVar(value="")
         self.profile_name_var = tk.StringVar(value="")
+        self.profile_nodes_var = tk.StringVar(value="")
+        self.profile_ping_var = tk.StringVar(value="")
 
         # Новый вар для IP
         self.ip_var = tk.StringVar(value="IP: -")
+        self.traffic_var = tk.StringVar(value="")
+        self.net_summary_var = tk.StringVar(value="Сети")
+        self.traffic_graph = None
+        self.traffic_poller = None
+        self.rule_hits = None
+        # заблокированная реклама за сеанс — по логу sing-box
+        self.block_stats = BlockStats()
+        self._hits_source = None
+        self._traffic_seq = 0
+        self._traffic_job = None
+        self.connections_win = None
+        self.log_sink = None
+        self._first_map = False
 
         self._build_ui()
         self._load_config()
-        self._refresh_profiles_ui()
+        # история лога: кольцевой буфер, в Text — только окно из него.
+        # Text появляется после первого кадра; что пришло раньше (ошибка
+        # записи конфига, сообщения ядра), ждёт в буфере
+        self.log_ring = LogRing(self.config_data.get("log_capacity", LOG_CAPACITY))
+        self.log_index = LogIndex(self.log_ring.capacity)
+        self.log_text = None
+        self._log_view_first = 0
+        self._log_view_last = 0
+        self._log_paging = False
+        self.config_writer = ConfigWriter(
+            self.config_data,
+            CONFIG_FILE,
+            on_error=lambda text: self.append_log(text + "\n"),
+            # снимок настроек — в потоке GUI, где их правят; поток пишет только файл
+            schedule=self.after,
+        )
+        if ensure_clash_secret(self.config_data):
+            self._save_config()
+        self.profiles = ProfileStore(self.config_data)
+        self.profiles.subscribe(self._on_profiles_changed)
+
+        # подключение без Tk: подписка → config → sing-box; события — колбэками
+        self.core = TunnelCore(
+            self.config_data,
+            log=self._log_from_core,
+            on_lines=self._on_singbox_lines,
+            on_exit=lambda proc: self.after(0, lambda: self._on_process_exit(proc)),
+            on_ping=lambda text: self.after(0, lambda: self.profile_ping_var.set(text)),
+            on_switch=self._retarget_traffic,
+        )
 
         self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.startup.mark("основной UI")
+        # лог, трафик, списки и фоновые загрузки — после первого кадра
+        self.bind("<Map>", self._on_first_map, add="+")
+
+    def _on_first_map(self, event):
+        if event.widget is not self or self._first_map:
+            return
+        self._first_map = True
+        self.after_idle(self._finish_startup)
+
+    def _finish_startup(self):
+        self.startup.mark("первый кадр")
+        self._build_deferred_ui()
+
+        if self.config_data.get("log_to_file", True):
+            self.log_sink = LogFileSink(
+                max_bytes=int(self.config_data.get("log_max_mb", 10) * 1024 * 1024),
+                rotate_seconds=float(self.config_data.get("log_rotate_hours", 24)) * 3600,
+                retention=int(self.config_data.get("log_retention", 10)),
+            )
+        self._refresh_profiles_ui()
+        self.startup.mark("отложенный UI")
+
+        self.core.start_refresh(
+            self.profiles.urls(),
+            on_update=lambda state: self.after(0, lambda: self._on_sub_refreshed(state)),
+            # новая версия geoip/geosite RU или блок-листа — в работающий
+            # туннель той же горячей заменой
+            on_geo=lambda tags: self.after(0, self._schedule_hot_apply),
+        )
+        self.after(LOG_TICK_MS, self._drain_log)
+        self.startup.mark("готов к вводу")
+
+        if self._startup_report:
+            report = self.startup.report()
+            if sys.stdout is not None:
+                print(report)
+            else:   # собранный .exe без консоли
+                with open("startup_report.txt", "w", encoding="utf-8") as f:
+                    f.write(report + "\n")
+            self.after(0, self.on_close)
+        elif self.startup.over_budget():
+            self.append_log(
+                f"Старт занял {self.startup.total_ms:.0f} мс при бюджете "
+                f"{STARTUP_BUDGET_MS:.0f} мс (vlf_gui.py --startup-report)\n"
+            )
 
     # ---------- конфиг GUI ----------
 
     def _load_config(self):
         # vlf_gui_config.json храним рядом с EXE (текущий рабочий каталог)
-        path = Path(CONFIG_FILE)
-        if not path.exists():
-            return
-        try:
-            data = json.loads(path.read_text(encoding="utf-8"))
-            self.config_data.update(data)
-        except Exception:
-            pass
+        self.config_data.update(load_config(CONFIG_FILE))
 
     def _save_config(self):
-        try:
-            Path(CONFIG_FILE).write_text(
-                json.dumps(self.config_data, ensure_ascii=False, indent=2),
-                encoding="utf-8",
-            )
-        except Exception:
-            pass
+        # запись — в потоке ConfigWriter, пачка правок сливается в одну
+        self.config_writer.save()
+
+    @property
+    def proc(self):
+        return self.core.proc if self.core is not None else None
 
     # ---------- UI helpers ----------
 
@@ -380,7 +309,7 @@ class VlfGui(tk.Tk):
             foreground=[("disabled", "#6b7280")],
         )
 
-        main = ttk.Frame(self, padding=10, style="TFrame")
+        self.main_frame = main = ttk.Frame(self, padding=10, style="TFrame")
         main.pack(fill="both", expand=True)
 
         # ---- ШАПКА ----
@@ -459,7 +388,7 @@ class VlfGui(tk.Tk):
         )
 
         # ---- Статус ----
-        status_frame = ttk.Frame(main, style="TFrame")
+        self.status_frame = status_frame = ttk.Frame(main, style="TFrame")
         status_frame.pack(fill="x", pady=(0, 4))
 
         self.status_var = tk.StringVar(value="отключен")
@@ -563,6 +492,16 @@ class VlfGui(tk.Tk):
         info_label(0, "Тип:", self.profile_type_var)
         info_label(1, "Адрес:", self.profile_addr_var)
         info_label(2, "Имя:", self.profile_name_var)
+        info_label(3, "Узлов:", self.profile_nodes_var)
+
+        # результат замера узлов — рядом с адресом
+        tk.Label(
+            info_frame,
+            textvariable=self.profile_ping_var,
+            bg=COLOR_PANEL,
+            fg=COLOR_ACCENT,
+            font=("Segoe UI", 9),
+        ).grid(row=1, column=2, sticky="w", padx=(8, 0))
 
         # ПРАВЫЙ БЛОК: исключения
         right_panel = ttk.Labelframe(
@@ -587,6 +526,12 @@ class VlfGui(tk.Tk):
             style="Accent.TButton",
             command=self.on_add_app,
         ).pack(side="left", padx=2)
+        ttk.Button(
+            exc_top,
+            text="Импорт",
+            style="Accent.TButton",
+            command=self.on_import_exclusions,
+        ).pack(side="left", padx=2)
 
         # Сайты
         sites_frame = tk.Frame(right_panel, bg=COLOR_PANEL)
@@ -654,6 +599,40 @@ class VlfGui(tk.Tk):
         self._create_icon_button(app_btns, "✎", self.on_edit_app).pack(pady=2)
         self._create_icon_button(app_btns, "✖", self.on_delete_app).pack(pady=2)
 
+        # Сети
+        nets_frame = tk.Frame(right_panel, bg=COLOR_PANEL)
+        nets_frame.pack(fill="both", expand=True, padx=8, pady=(0, 4))
+
+        nets_left = tk.Frame(nets_frame, bg=COLOR_PANEL)
+        nets_left.pack(side="left", fill="both", expand=True)
+
+        tk.Label(
+            nets_left,
+            textvariable=self.net_summary_var,
+            bg=COLOR_PANEL,
+            fg=COLOR_TEXT,
+        ).pack(anchor="w", pady=(0, 2))
+
+        self.net_list = tk.Listbox(
+            nets_left,
+            height=3,
+            bg=COLOR_PANEL,
+            fg=COLOR_TEXT,
+            selectbackground=COLOR_ACCENT,
+            selectforeground="#000000",
+            borderwidth=1,
+            relief="solid",
+            highlightthickness=0,
+            exportselection=False,
+        )
+        self.net_list.pack(fill="both", expand=True, padx=1, pady=1)
+
+        net_btns = tk.Frame(nets_frame, bg=COLOR_PANEL)
+        net_btns.pack(side="left", fill="y", padx=(4, 0))
+        self._create_icon_button(net_btns, "+", self.on_add_net).pack(pady=2)
+        self._create_icon_button(net_btns, "✎", self.on_edit_net).pack(pady=2)
+        self._create_icon_button(net_btns, "✖", self.on_delete_net).pack(pady=2)
+
         # Режим РФ
         rf_frame = tk.Frame(right_panel, bg=COLOR_PANEL)
         rf_frame.pack(fill="x", padx=8, pady=(4, 8))
@@ -675,12 +654,71 @@ class VlfGui(tk.Tk):
         )
         self.ru_toggle.pack(anchor="w")
 
+        self.block_ads_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            rf_frame,
+            text="Блокировать рекламу и трекеры",
+            variable=self.block_ads_var,
+            command=self.on_block_ads_changed,
+            bg=COLOR_PANEL,
+            fg=COLOR_TEXT,
+            activebackground=COLOR_PANEL,
+            activeforeground=COLOR_TEXT,
+            selectcolor=COLOR_PANEL,
+            highlightthickness=0,
+            bd=0,
+            anchor="w",
+        ).pack(anchor="w")
+
+        self.set_status("отключен", "red")
+
+    def _build_deferred_ui(self):
+        """Панели, без которых первый кадр обходится: трафик и лог."""
+        # скорость туннеля: цифры + график, таблица соединений по кнопке
+        traffic_row = ttk.Frame(self.status_frame, style="TFrame")
+        traffic_row.pack(fill="x")
+        ttk.Button(
+            traffic_row,
+            text="Соединения",
+            style="Accent.TButton",
+            command=self.on_show_connections,
+        ).pack(side="right")
+        ttk.Label(
+            traffic_row,
+            textvariable=self.traffic_var,
+            style="Status.TLabel",
+            anchor="center",
+        ).pack(side="left", fill="x", expand=True)
+        self.traffic_graph = TrafficGraph(self.status_frame)
+        self.traffic_graph.pack(fill="x", pady=(2, 0))
+
         # ---- ЛОГ ----
-        log_frame = ttk.Labelframe(
-            main, text="Лог sing-box", style="Panel.TLabelframe"
+        self.log_frame = log_frame = ttk.Labelframe(
+            self.main_frame, text="Лог sing-box", style="Panel.TLabelframe"
         )
         log_frame.pack(fill="both", expand=True, pady=(6, 0))
 
+        # поиск по индексу событий: "level:error out:proxy-out last:1h host"
+        search_bar = tk.Frame(log_frame, bg=COLOR_PANEL)
+        search_bar.pack(side="top", fill="x", padx=6, pady=(6, 0))
+        self.log_search_var = tk.StringVar()
+        search_entry = tk.Entry(
+            search_bar,
+            textvariable=self.log_search_var,
+            bg=COLOR_PANEL,
+            fg=COLOR_TEXT,
+            insertbackground=COLOR_TEXT,
+            relief="flat",
+        )
+        search_entry.pack(side="left", fill="x", expand=True)
+        search_entry.bind("<Return>", lambda _e: self.on_log_search())
+        ttk.Button(
+            search_bar,
+            text="Найти",
+            style="Accent.TButton",
+            command=self.on_log_search,
+        ).pack(side="left", padx=(6, 0))
+
         self.log_text = tk.Text(
             log_frame,
             wrap="none",
@@ -694,19 +732,280 @@ class VlfGui(tk.Tk):
             side="left", fill="both", expand=True, padx=(6, 0), pady=6
         )
 
-        log_scroll = ttk.Scrollbar(
+        self.log_scroll = log_scroll = ttk.Scrollbar(
             log_frame, orient="vertical", command=self.log_text.yview
         )
         log_scroll.pack(side="right", fill="y", pady=6)
-        self.log_text.configure(yscrollcommand=log_scroll.set)
-
-        self.set_status("отключен", "red")
+        # через обёртку: у краёв окна подгружаем строки из кольцевого буфера
+        self.log_text.configure(yscrollcommand=self._on_log_yscroll)
+        # накопленное до первого кадра
+        ring = self.log_ring
+        self._log_view_first = max(ring.start, ring.end - LOG_VIEW_LINES)
+        self._log_view_last = ring.end
+        lines = ring.slice(self._log_view_first, self._log_view_last)
+        if lines:
+            self.log_text.insert("end", "".join(lines))
+            self.log_text.see("end")
 
     # ---------- helpers ----------
 
     def append_log(self, text: str):
-        self.log_text.insert("end", text)
-        self.log_text.see("end")
+        # Text и кольцевой буфер трогает только поток GUI;
+        # из рабочих потоков — через ту же очередь, что и stdout sing-box
+        if threading.current_thread() is not self._ui_thread:
+            self.log_queue.put(text)
+            return
+        self._log_write(split_lines(text))
+
+    def _log_write(self, lines):
+        """
+        Строки — в кольцевой буфер; в Text — только если на экране хвост.
+        Если пользователь листает историю, новые строки подтянутся,
+        когда он докрутит до низа.
+        """
+        if not lines:
+            return
+        following = self._log_view_last == self.log_ring.end
+        self.log_ring.extend(lines)
+        if not following or self.log_text is None:
+            return
+
+        at_bottom = self.log_text.yview()[1] >= 0.999
+        if len(lines) >= LOG_VIEW_LINES:
+            self.log_text.delete("1.0", "end")
+            self.log_text.insert("end", "".join(lines[-LOG_VIEW_LINES:]))
+            self._log_view_first = self.log_ring.end - LOG_VIEW_LINES
+        else:
+            self.log_text.insert("end", "".join(lines))
+        self._log_view_last = self.log_ring.end
+        self._trim_log_view(top=True)
+        if at_bottom:
+            self.log_text.see("end")
+
+    def _trim_log_view(self, top: bool):
+        excess = (self._log_view_last - self._log_view_first) - LOG_VIEW_LINES
+        if excess <= 0:
+            return 0
+        if top:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+            self._log_view_first += excess
+        else:
+            self.log_text.delete(f"{LOG_VIEW_LINES + 1}.0", "end")
+            self._log_view_last -= excess
+        return excess
+
+    def _on_log_yscroll(self, first, last):
+        self.log_scroll.set(first, last)
+        if self._log_paging:
+            return
+        if float(first) <= 0.0 and self._log_view_first > self.log_ring.start:
+            self._log_paging = True
+            self.after_idle(self._log_page_older)
+        elif float(last) >= 1.0 and self._log_view_last < self.log_ring.end:
+            self._log_paging = True
+            self.after_idle(self._log_page_newer)
+
+    def _log_page_older(self):
+        """Докрутили до верха окна — подгружаем более старые строки из буфера."""
+        try:
+            first = max(self._log_view_first, self.log_ring.start)
+            lines = self.log_ring.slice(first - LOG_PAGE_LINES, first)
+            if not lines:
+                return
+            self.log_text.insert("1.0", "".join(lines))
+            self._log_view_first = first - len(lines)
+            self._trim_log_view(top=False)
+            self.log_text.yview(f"{len(lines) + 1}.0")
+        finally:
+            self._log_paging = False
+
+    def _log_page_newer(self):
+        """Докрутили до низа, а хвост не показан — подгружаем следующие строки."""
+        try:
+            last = self._log_view_last
+            lines = self.log_ring.slice(last, last + LOG_PAGE_LINES)
+            if not lines:
+                return
+            shown = last - self._log_view_first
+            self.log_text.insert("end", "".join(lines))
+            self._log_view_last = last + len(lines)
+            removed = self._trim_log_view(top=True)
+            self.log_text.see(f"{max(1, shown - removed)}.0")
+        finally:
+            self._log_paging = False
+
+    def _drain_log(self):
+        """Тик лога: всё накопленное из очереди — одним insert."""
+        lines, events = self.log_queue.drain()
+        if lines:
+            first = self.log_ring.end
+            self._log_write(lines)
+            self.log_index.add_events(events, first, self.log_ring.start)
+
+        self._log_ticks += 1
+        if self._log_ticks * LOG_TICK_MS >= 1000:
+            self._log_ticks = 0
+            self.log_queue.update_rate()
+            self.log_frame.configure(
+                text=f"Лог sing-box — {self.log_queue.describe()}"
+            )
+        self.after(LOG_TICK_MS, self._drain_log)
+
+    def on_log_search(self):
+        """Запрос к индексу событий лога — без прохода по Text."""
+        text = self.log_search_var.get().strip()
+        if not text:
+            return
+        t0 = time.perf_counter()
+        ring = self.log_ring
+        total, seqs = self.log_index.query(min_seq=ring.start, **parse_query(text))
+        lines = [ring.get(seq) for seq in seqs]
+        ms = (time.perf_counter() - t0) * 1000
+        header = (
+            f"{text}: найдено {total} из {len(self.log_index)} событий "
+            f"за {ms:.1f} мс"
+        )
+        if total > len(lines):
+            header += f", показаны последние {len(lines)}"
+        self._show_log_search(header, lines)
+
+    def _show_log_search(self, header, lines):
+        win = getattr(self, "_log_search_win", None)
+        if win is None or not win.winfo_exists():
+            win = self._log_search_win = tk.Toplevel(self)
+            win.title("Поиск по логу")
+            win.configure(bg=COLOR_BG)
+            win.geometry("900x400")
+            win.header_var = tk.StringVar()
+            tk.Label(
+                win,
+                textvariable=win.header_var,
+                bg=COLOR_BG,
+                fg=COLOR_TEXT,
+                anchor="w",
+            ).pack(fill="x", padx=8, pady=(8, 2))
+            win.text = tk.Text(
+                win,
+                wrap="none",
+                bg="#1a1717",
+                fg=COLOR_TEXT,
+                insertbackground=COLOR_TEXT,
+                relief="flat",
+                borderwidth=0,
+            )
+            win.text.pack(fill="both", expand=True, padx=8, pady=(0, 8))
+        win.header_var.set(header)
+        win.text.configure(state="normal")
+        win.text.delete("1.0", "end")
+        win.text.insert("end", "\n".join(lines))
+        win.text.see("end")
+        win.text.configure(state="disabled")
+        win.lift()
+
+    # ---------- статистика трафика (Clash API) ----------
+
+    def _start_traffic(self, cfg):
+        self._stop_traffic()
+        api = cfg.get("experimental", {}).get("clash_api")
+        if not api:
+            return
+        self.traffic_poller = ClashApiPoller(
+            api["external_controller"], api["secret"]
+        )
+        self.traffic_poller.start()
+        # счётчики нужны только порядку правил по частоте — выключен, не копим
+        self.rule_hits = None
+        if self.config_data.get("rule_order_by_hits", False):
+            self.rule_hits = RuleHits(self.config_data.get("rule_hits"))
+        self._hits_source = None
+        self._traffic_seq = 0
+        self._traffic_job = self.after(TRAFFIC_TICK_MS, self._traffic_tick)
+
+    def _retarget_traffic(self, cfg):
+        api = cfg.get("experimental", {}).get("clash_api")
+        if api and self.traffic_poller is not None:
+            self.traffic_poller.retarget(api["external_controller"])
+
+    def _stop_traffic(self):
+        if self.traffic_poller is not None:
+            self.traffic_poller.stop()
+            self.traffic_poller = None
+        # счётчики правил — в конфиг раз за сеанс, а не на каждом опросе
+        if self.rule_hits is not None and self.rule_hits.changed:
+            self.config_data["rule_hits"] = self.rule_hits.counts
+            self._save_config()
+        self.rule_hits = None
+        if self._traffic_job is not None:
+            self.after_cancel(self._traffic_job)
+            self._traffic_job = None
+        if self.traffic_graph is not None:
+            self.traffic_graph.clear()
+        self.traffic_var.set("")
+        if self.connections_win is not None and self.connections_win.winfo_exists():
+            self.connections_win.update_connections([])
+
+    def _traffic_tick(self):
+        """Раз в секунду: цифры в подпись, новые точки — в график."""
+        poller = self.traffic_poller
+        if poller is None:
+            self._traffic_job = None
+            return
+        stats, points, self._traffic_seq = poller.snapshot(self._traffic_seq)
+        self.traffic_graph.add_points(points)
+        if self.connections_win is not None and self.connections_win.winfo_exists():
+            self.connections_win.update_connections(stats.connections)
+        if self.rule_hits is not None and stats.connections is not self._hits_source:
+            self._hits_source = stats.connections
+            self.rule_hits.observe(stats.connections)
+        if stats.updated_at:
+            self.traffic_var.set(stats.describe() + self._block_summary())
+        elif stats.error:
+            self.traffic_var.set(f"Clash API: {stats.error}")
+        self._traffic_job = self.after(TRAFFIC_TICK_MS, self._traffic_tick)
+
+    def _block_summary(self):
+        if (
+            self.config_data.get("block_ads")
+            and self.config_data.get("block_action") == "reject"
+        ):
+            # action reject видно только в логе debug — не считаем
+            return "   заблокировано: н/д"
+        blocked = self.block_stats.blocked
+        if not blocked:
+            return ""
+        saved = self.block_stats.saved_bytes()
+        return f"   заблокировано {blocked} (~{format_bytes(saved)})"
+
+    def on_show_connections(self):
+        win = self.connections_win
+        if win is None or not win.winfo_exists():
+            win = self.connections_win = ConnectionsWindow(
+                self,
+                self._close_connections,
+                bg=COLOR_BG,
+                panel=COLOR_PANEL,
+                fg=COLOR_TEXT,
+            )
+            if self.traffic_poller is None:
+                win.summary_var.set("Туннель не подключен или Clash API выключен.")
+        win.lift()
+
+    def _close_connections(self, ids):
+        poller = self.traffic_poller
+        if poller is None:
+            return
+
+        def worker():
+            failed = 0
+            for cid in ids:
+                try:
+                    poller.close_connection(cid)
+                except Exception:
+                    failed += 1
+            if failed:
+                self.log_queue.put(f"Не удалось закрыть соединений: {failed}\n")
+
+        threading.Thread(target=worker, daemon=True).start()
 
     def set_status(self, text: str, color: str):
         self.status_var.set(text)
@@ -729,62 +1028,94 @@ class VlfGui(tk.Tk):
 
     # ---------- profiles ----------
 
-    def _get_profiles(self):
-        return [Profile.from_dict(p) for p in self.config_data.get("profiles", [])]
-
-    def _set_profiles(self, profiles):
-        self.config_data["profiles"] = [p.to_dict() for p in profiles]
+    def _on_profiles_changed(self, event, idx, profile):
+        """Правка в ProfileStore: сохраняем и трогаем только свою строку."""
         self._save_config()
-        self._refresh_profiles_ui()
+        if event == ADDED:
+            self.profile_list.insert(idx, profile.name)
+        elif event == REMOVED:
+            self.profile_list.delete(idx)
+        elif self.profile_list.get(idx) != profile.name:
+            self.profile_list.delete(idx)
+            self.profile_list.insert(idx, profile.name)
+        else:
+            # имя то же (адрес/узел) — список и combobox не трогаем
+            if idx == self.current_profile_index:
+                self._refresh_profile_info_ui()
+            self.core.set_refresh_urls(self.profiles.urls())
+            return
+        self.profile_combo["values"] = self.profiles.names()
+        self.core.set_refresh_urls(self.profiles.urls())
+        if self.current_profile_index is not None:
+            self._select_profile(self.current_profile_index)
+
+    def _on_sub_refreshed(self, state):
+        """Фоновое обновление подписки: пишем в лог только то, что важно."""
+        profiles = self.profiles.by_url(state.url)
+        if not profiles:
+            return
+        if state.nodes:
+            self.profiles.set_nodes(state.url, state.nodes)
+            current = self.profiles.get(self.current_profile_index)
+            if current is not None and current.url.strip() == state.url:
+                self._refresh_profile_info_ui()
+        if state.error:
+            self.append_log(
+                f"[фон] {profiles[0].name}: ошибка обновления ({state.error}), "
+                f"повтор через backoff\n"
+            )
+        elif state.diff:
+            self.append_log(
+                f"[фон] {profiles[0].name}: подписка обновлена, {state.diff.describe()}\n"
+            )
 
     def _refresh_profile_info_ui(self):
-        profiles = self._get_profiles()
-        if (
-            self.current_profile_index is not None
-            and 0 <= self.current_profile_index < len(profiles)
-        ):
-            p = profiles[self.current_profile_index]
+        p = self.profiles.get(self.current_profile_index)
+        if p is not None:
             self.profile_type_var.set(p.ptype or "VLESS")
             self.profile_addr_var.set(p.address or "")
             self.profile_name_var.set(p.remark or "")
+            count = self.profiles.node_count(p.url)
+            self.profile_nodes_var.set(str(count) if count else "")
         else:
             self.profile_type_var.set("")
             self.profile_addr_var.set("")
             self.profile_name_var.set("")
+            self.profile_nodes_var.set("")
+            self.profile_ping_var.set("")
+
+    def _select_profile(self, idx):
+        """Выделение в списке и combobox без их пересборки."""
+        p = self.profiles.get(idx)
+        if p is None:
+            if self.profiles:
+                idx, p = 0, self.profiles.get(0)
+            else:
+                self.current_profile_index = None
+                self.profile_combo.set("")
+                self.profile_var.set("")
+                self._refresh_profile_info_ui()
+                return
+        self.current_profile_index = idx
+        self.profile_combo.current(idx)
+        self.profile_var.set(p.name)
+        self.profile_list.selection_clear(0, "end")
+        self.profile_list.selection_set(idx)
+        self.profile_list.see(idx)
+        self._refresh_profile_info_ui()
 
     def _refresh_profiles_ui(self):
-        profiles = self._get_profiles()
-        names = [p.name for p in profiles]
-
+        """Полная пересборка — только при старте."""
+        names = self.profiles.names()
         self.profile_combo["values"] = names
-
-        if profiles:
-            if (
-                self.current_profile_index is None
-                or self.current_profile_index >= len(profiles)
-            ):
-                self.current_profile_index = 0
-            self.profile_combo.current(self.current_profile_index)
-            self.profile_var.set(profiles[self.current_profile_index].name)
-        else:
-            self.current_profile_index = None
-            self.profile_combo.set("")
-            self.profile_var.set("")
-
         self.profile_list.delete(0, "end")
-        for n in names:
-            self.profile_list.insert("end", n)
-        if self.current_profile_index is not None and profiles:
-            idx = self.current_profile_index
-            if idx < len(profiles):
-                self.profile_list.selection_clear(0, "end")
-                self.profile_list.selection_set(idx)
-                self.profile_list.see(idx)
-
+        if names:
+            self.profile_list.insert("end", *names)
+        self._select_profile(self.current_profile_index)
         self._refresh_exclusions_ui()
-        self._refresh_profile_info_ui()
 
     def on_profile_selected(self, event=None):
+        self.profile_ping_var.set("")
         idx = self.profile_combo.current()
         self.current_profile_index = idx if idx >= 0 else None
         if self.current_profile_index is not None:
@@ -797,12 +1128,14 @@ class VlfGui(tk.Tk):
         if not self.profile_list.curselection():
             return
         idx = self.profile_list.curselection()[0]
-        profiles = self._get_profiles()
-        if idx >= len(profiles):
+        p = self.profiles.get(idx)
+        if p is None:
             return
+        if idx != self.current_profile_index:
+            self.profile_ping_var.set("")
         self.current_profile_index = idx
         self.profile_combo.current(idx)
-        self.profile_var.set(profiles[idx].name)
+        self.profile_var.set(p.name)
         self._refresh_profile_info_ui()
 
     def _profile_dialog(self, title, profile: Profile | None = None):
@@ -851,6 +1184,47 @@ class VlfGui(tk.Tk):
         )
         url_entry.pack(fill="x", padx=8, pady=(0, 8))
 
+        # Все узлы подписки в urltest-группе
+        multi_var = tk.BooleanVar(value=profile.multi_node if profile else False)
+        tk.Checkbutton(
+            dialog,
+            text="Все узлы подписки (автовыбор и переключение в sing-box)",
+            variable=multi_var,
+            bg=COLOR_BG,
+            fg=COLOR_TEXT,
+            activebackground=COLOR_BG,
+            activeforeground=COLOR_TEXT,
+            selectcolor=COLOR_PANEL,
+            highlightthickness=0,
+            bd=0,
+            anchor="w",
+        ).pack(fill="x", padx=8, pady=(0, 4))
+
+        urltest_row = tk.Frame(dialog, bg=COLOR_BG)
+        urltest_row.pack(fill="x", padx=8, pady=(0, 8))
+        interval_var = tk.StringVar(
+            value=profile.urltest_interval if profile else URLTEST_INTERVAL
+        )
+        tolerance_var = tk.StringVar(
+            value=str(profile.urltest_tolerance if profile else URLTEST_TOLERANCE)
+        )
+        for text, var in (
+            ("Интервал проверки:", interval_var),
+            ("Допуск, мс:", tolerance_var),
+        ):
+            tk.Label(
+                urltest_row, text=text, bg=COLOR_BG, fg=COLOR_TEXT
+            ).pack(side="left", padx=(0, 4))
+            tk.Entry(
+                urltest_row,
+                textvariable=var,
+                width=6,
+                bg=COLOR_PANEL,
+                fg=COLOR_TEXT,
+                insertbackground=COLOR_TEXT,
+                relief="flat",
+            ).pack(side="left", padx=(0, 12))
+
         btn_row = tk.Frame(dialog, bg=COLOR_BG)
         btn_row.pack(fill="x", padx=8, pady=(0, 8))
 
@@ -865,16 +1239,25 @@ class VlfGui(tk.Tk):
             if not url:
                 messagebox.showerror(APP_TITLE, "Нужна ссылка-подписка.")
                 return
+            interval = interval_var.get().strip() or URLTEST_INTERVAL
+            try:
+                tolerance = int(tolerance_var.get().strip() or URLTEST_TOLERANCE)
+            except ValueError:
+                messagebox.showerror(APP_TITLE, "Допуск — целое число миллисекунд.")
+                return
             res["ok"] = True
             res["name"] = name
             res["url"] = url
+            res["multi_node"] = bool(multi_var.get())
+            res["urltest_interval"] = interval
+            res["urltest_tolerance"] = tolerance
             dialog.destroy()
 
         def on_cancel():
             dialog.destroy()
 
         # Кнопка QR только если библиотеки реально есть
-        if QR_AVAILABLE:
+        if qr_available():
             def load_qr():
                 path = filedialog.askopenfilename(
                     title="Выбери картинку с QR-кодом",
@@ -889,8 +1272,7 @@ class VlfGui(tk.Tk):
                 if not path:
                     return
                 try:
-                    img = Image.open(path)
-                    codes = qr_decode(img)
+                    codes = decode_qr(path)
                     if not codes:
                         messagebox.showerror(
                             APP_TITLE, "QR-код не найден на этой картинке."
@@ -926,43 +1308,37 @@ class VlfGui(tk.Tk):
 
         dialog.wait_window()
         if res["ok"]:
-            return Profile(res["name"], res["url"])
+            return Profile(
+                res["name"],
+                res["url"],
+                multi_node=res["multi_node"],
+                urltest_interval=res["urltest_interval"],
+                urltest_tolerance=res["urltest_tolerance"],
+            )
         return None
 
     def on_add_profile(self):
         p = self._profile_dialog("Новый профиль")
         if not p:
             return
-        profiles = self._get_profiles()
-        profiles.append(p)
-        self._set_profiles(profiles)
-        self.current_profile_index = len(profiles) - 1
-        self._refresh_profiles_ui()
+        self.current_profile_index = self.profiles.add(p)
+        self._select_profile(self.current_profile_index)
 
     def on_edit_profile(self):
-        profiles = self._get_profiles()
-        if (
-            self.current_profile_index is None
-            or self.current_profile_index >= len(profiles)
-        ):
+        orig = self.profiles.get(self.current_profile_index)
+        if orig is None:
             messagebox.showerror(APP_TITLE, "Сначала выбери профиль.")
             return
-        orig = profiles[self.current_profile_index]
         p = self._profile_dialog("Редактирование профиля", orig)
         if not p:
             return
         p.ptype = orig.ptype
         p.address = orig.address
         p.remark = orig.remark
-        profiles[self.current_profile_index] = p
-        self._set_profiles(profiles)
+        self.profiles.replace(self.current_profile_index, p)
 
     def on_delete_profile(self):
-        profiles = self._get_profiles()
-        if (
-            self.current_profile_index is None
-            or self.current_profile_index >= len(profiles)
-        ):
+        if self.profiles.get(self.current_profile_index) is None:
             messagebox.showerror(APP_TITLE, "Сначала выбери профиль.")
             return
 
@@ -979,26 +1355,47 @@ class VlfGui(tk.Tk):
         if not answer:
             return
 
-        del profiles[self.current_profile_index]
-        self.current_profile_index = 0 if profiles else None
-        self._set_profiles(profiles)
+        idx = self.current_profile_index
+        self.current_profile_index = 0 if len(self.profiles) > 1 else None
+        self.profiles.remove(idx)
+        self._select_profile(self.current_profile_index)
 
     # ---------- exclusions ----------
 
     def _refresh_exclusions_ui(self):
         self.ru_mode_var.set(self.config_data.get("ru_mode", True))
+        self.block_ads_var.set(self.config_data.get("block_ads", False))
 
+        # одним вызовом Tcl — после импорта в списке могут быть десятки тысяч строк
         self.site_list.delete(0, "end")
-        for d in self.config_data.get("site_exclusions", []):
-            self.site_list.insert("end", d)
+        sites = self.config_data.get("site_exclusions", [])
+        if sites:
+            self.site_list.insert("end", *sites)
 
         self.app_list.delete(0, "end")
-        for p in self.config_data.get("app_exclusions", []):
-            self.app_list.insert("end", p)
+        apps = self.config_data.get("app_exclusions", [])
+        if apps:
+            self.app_list.insert("end", *apps)
+
+        self.net_list.delete(0, "end")
+        nets = self.config_data.get("ip_exclusions", [])
+        if nets:
+            self.net_list.insert("end", *nets)
+            _prefixes, report = normalize_networks(nets)
+            self.net_summary_var.set(f"Сети ({report.describe()})")
+        else:
+            self.net_summary_var.set("Сети")
 
     def on_ru_mode_changed(self):
         self.config_data["ru_mode"] = bool(self.ru_mode_var.get())
         self._save_config()
+        self._schedule_hot_apply()
+
+    def on_block_ads_changed(self):
+        # списки при первом включении качаются в потоке горячей замены
+        self.config_data["block_ads"] = bool(self.block_ads_var.get())
+        self._save_config()
+        self._schedule_hot_apply()
 
     def on_add_site(self):
         self._edit_site_dialog()
@@ -1021,7 +1418,7 @@ class VlfGui(tk.Tk):
 
         tk.Label(
             dialog,
-            text="Домен (example.com, bank.ru и т.п.):",
+            text="Домен с поддоменами (example.com) или только он (full:example.com):",
             bg=COLOR_BG,
             fg=COLOR_TEXT,
         ).pack(anchor="w", padx=8, pady=(8, 2))
@@ -1042,6 +1439,14 @@ class VlfGui(tk.Tk):
             if not v:
                 messagebox.showerror(APP_TITLE, "Домен не может быть пустым.")
                 return
+            if normalize_domain(v) is None:
+                if parse_network(v) is not None:
+                    messagebox.showerror(
+                        APP_TITLE, f"«{v}» — IP-адрес, его добавляют в «Сети»."
+                    )
+                else:
+                    messagebox.showerror(APP_TITLE, f"«{v}» не похоже на домен.")
+                return
             res["ok"] = True
             res["value"] = v
             dialog.destroy()
@@ -1079,8 +1484,7 @@ class VlfGui(tk.Tk):
         else:
             lst[index] = res["value"]
         self.config_data["site_exclusions"] = lst
-        self._save_config()
-        self._refresh_exclusions_ui()
+        self._exclusions_changed()
 
     def on_delete_site(self):
         try:
@@ -1093,8 +1497,102 @@ class VlfGui(tk.Tk):
             return
         del lst[idx]
         self.config_data["site_exclusions"] = lst
-        self._save_config()
-        self._refresh_exclusions_ui()
+        self._exclusions_changed()
+
+    def on_import_exclusions(self):
+        source = self._import_source_dialog()
+        if not source:
+            return
+        self.append_log(f"Импорт исключений: {source}\n")
+        existing_sites = list(self.config_data.get("site_exclusions", []))
+        existing_ips = list(self.config_data.get("ip_exclusions", []))
+
+        def worker():
+            try:
+                result = import_exclusions([source], existing_sites, existing_ips)
+            except Exception as e:
+                err = f"Импорт не удался: {e}"
+                self.after(0, lambda: self.append_log(err + "\n"))
+                self.after(0, lambda: messagebox.showerror(APP_TITLE, err))
+                return
+            self.after(0, lambda: self._apply_import(result))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _apply_import(self, result):
+        """Всё найденное — одной правкой: одно сохранение, одна перерисовка."""
+        self.append_log(f"Импорт исключений: {result.describe()}\n")
+        if not result.added:
+            return
+        self.config_data.setdefault("site_exclusions", []).extend(result.sites)
+        self.config_data.setdefault("ip_exclusions", []).extend(result.ips)
+        self._exclusions_changed()
+
+    def _import_source_dialog(self):
+        dialog = tk.Toplevel(self)
+        dialog.title("Импорт исключений")
+        dialog.transient(self)
+        dialog.grab_set()
+        dialog.configure(bg=COLOR_BG)
+
+        tk.Label(
+            dialog,
+            text="Файл или URL списка (домены, hosts, adblock, сети):",
+            bg=COLOR_BG,
+            fg=COLOR_TEXT,
+        ).pack(anchor="w", padx=8, pady=(8, 2))
+        var = tk.StringVar()
+        row = tk.Frame(dialog, bg=COLOR_BG)
+        row.pack(fill="x", padx=8, pady=(0, 8))
+        tk.Entry(
+            row,
+            textvariable=var,
+            width=48,
+            bg=COLOR_PANEL,
+            fg=COLOR_TEXT,
+            insertbackground=COLOR_TEXT,
+            relief="flat",
+        ).pack(side="left", fill="x", expand=True)
+
+        def browse():
+            path = filedialog.askopenfilename(
+                parent=dialog,
+                title="Список исключений",
+                filetypes=[("Списки", "*.txt *.list *.hosts *.conf"), ("Все файлы", "*.*")],
+            )
+            if path:
+                var.set(path)
+
+        self._create_pill_button(row, "Файл...", GRAY_BTN, browse).pack(
+            side="left", padx=(4, 0)
+        )
+
+        res = {"value": None}
+
+        def on_ok():
+            v = var.get().strip()
+            if not v:
+                messagebox.showerror(APP_TITLE, "Укажи файл или URL.")
+                return
+            res["value"] = v
+            dialog.destroy()
+
+        btns = tk.Frame(dialog, bg=COLOR_BG)
+        btns.pack(fill="x", padx=8, pady=(0, 8))
+        self._create_pill_button(btns, "Импорт", GREEN_BTN, on_ok).pack(
+            side="right", padx=(4, 0)
+        )
+        self._create_pill_button(btns, "Отмена", GRAY_BTN, dialog.destroy).pack(
+            side="right"
+        )
+
+        dialog.update_idletasks()
+        x = self.winfo_rootx() + (self.winfo_width() - dialog.winfo_width()) // 2
+        y = self.winfo_rooty() + (self.winfo_height() - dialog.winfo_height()) // 2
+        dialog.geometry(f"+{x}+{y}")
+
+        dialog.wait_window()
+        return res["value"]
 
     def on_add_app(self):
         self._edit_app_dialog()
@@ -1177,8 +1675,7 @@ class VlfGui(tk.Tk):
         else:
             lst[index] = res["value"]
         self.config_data["app_exclusions"] = lst
-        self._save_config()
-        self._refresh_exclusions_ui()
+        self._exclusions_changed()
 
     def on_delete_app(self):
         try:
@@ -1191,8 +1688,90 @@ class VlfGui(tk.Tk):
             return
         del lst[idx]
         self.config_data["app_exclusions"] = lst
-        self._save_config()
-        self._refresh_exclusions_ui()
+        self._exclusions_changed()
+
+    def on_add_net(self):
+        self._edit_net_dialog()
+
+    def on_edit_net(self):
+        try:
+            idx = self.net_list.curselection()[0]
+        except IndexError:
+            messagebox.showerror(APP_TITLE, "Выбери сеть в списке.")
+            return
+        current = self.config_data.get("ip_exclusions", [])[idx]
+        self._edit_net_dialog(idx, current)
+
+    def _edit_net_dialog(self, index=None, current=""):
+        dialog = tk.Toplevel(self)
+        dialog.title("Сеть-исключение")
+        dialog.transient(self)
+        dialog.grab_set()
+        dialog.configure(bg=COLOR_BG)
+
+        tk.Label(
+            dialog,
+            text="Адрес или сеть (192.168.0.0/16, 10.1.2.3, fd00::/8):",
+            bg=COLOR_BG,
+            fg=COLOR_TEXT,
+        ).pack(anchor="w", padx=8, pady=(8, 2))
+        var = tk.StringVar(value=current)
+        tk.Entry(
+            dialog,
+            textvariable=var,
+            bg=COLOR_PANEL,
+            fg=COLOR_TEXT,
+            insertbackground=COLOR_TEXT,
+            relief="flat",
+        ).pack(fill="x", padx=8, pady=(0, 8))
+
+        res = {"ok": False}
+
+        def on_ok():
+            net = parse_network(var.get())
+            if net is None:
+                messagebox.showerror(APP_TITLE, "Это не адрес и не сеть.")
+                return
+            res["ok"] = True
+            res["value"] = net
+            dialog.destroy()
+
+        btns = tk.Frame(dialog, bg=COLOR_BG)
+        btns.pack(fill="x", padx=8, pady=(0, 8))
+        self._create_pill_button(btns, "OK", GREEN_BTN, on_ok).pack(
+            side="right", padx=(4, 0)
+        )
+        self._create_pill_button(btns, "Отмена", GRAY_BTN, dialog.destroy).pack(
+            side="right"
+        )
+
+        dialog.update_idletasks()
+        x = self.winfo_rootx() + (self.winfo_width() - dialog.winfo_width()) // 2
+        y = self.winfo_rooty() + (self.winfo_height() - dialog.winfo_height()) // 2
+        dialog.geometry(f"+{x}+{y}")
+
+        dialog.wait_window()
+        if not res["ok"]:
+            return
+
+        lst = self.config_data.setdefault("ip_exclusions", [])
+        if index is None:
+            lst.append(res["value"])
+        else:
+            lst[index] = res["value"]
+        self._exclusions_changed()
+
+    def on_delete_net(self):
+        try:
+            idx = self.net_list.curselection()[0]
+        except IndexError:
+            messagebox.showerror(APP_TITLE, "Выбери сеть в списке.")
+            return
+        lst = self.config_data.get("ip_exclusions", [])
+        if idx >= len(lst):
+            return
+        del lst[idx]
+        self._exclusions_changed()
 
     def on_manage_exclusions(self):
         messagebox.showinfo(
@@ -1211,26 +1790,22 @@ class VlfGui(tk.Tk):
             self.connect()
 
     def connect(self):
-        profiles = self._get_profiles()
-        if not profiles:
+        if not self.profiles:
             messagebox.showerror(APP_TITLE, "Сначала создай профиль с подпиской.")
             return
-        if (
-            self.current_profile_index is None
-            or self.current_profile_index >= len(profiles)
-        ):
+        profile = self.profiles.get(self.current_profile_index)
+        if profile is None:
             messagebox.showerror(APP_TITLE, "Выбери профиль.")
             return
 
-        profile = profiles[self.current_profile_index]
         if not profile.url.strip():
             messagebox.showerror(APP_TITLE, "У профиля нет URL подписки.")
             return
 
-        sing_box_exe = self.base_dir / "sing-box.exe"
-        if not sing_box_exe.exists():
+        sing_box_exe = find_sing_box(self.base_dir)
+        if sing_box_exe is None:
             messagebox.showerror(
-                APP_TITLE, "Не найден sing-box.exe рядом с программой."
+                APP_TITLE, f"Не найден {SING_BOX_NAME} рядом с программой."
             )
             return
 
@@ -1241,86 +1816,34 @@ class VlfGui(tk.Tk):
             f"\n=== Подключение к профилю: {profile.name} ===\n"
         )
         self.set_status("подключение...", "orange")
+        self.block_stats.reset()
 
         t = threading.Thread(
             target=self._connect_worker,
-            args=(profile.url, self.base_dir, sing_box_exe, self.current_profile_index),
+            args=(profile, sing_box_exe, self.current_profile_index),
             daemon=True,
         )
         t.start()
 
-    def _update_profile_info_from_vless(self, idx, vless_url):
-        try:
-            u = urlparse(vless_url)
-            server = u.hostname or ""
-            port = u.port or 443
-            remark = unquote(u.fragment) if u.fragment else ""
-            profiles = self._get_profiles()
-            if idx is None or idx < 0 or idx >= len(profiles):
-                return
-            p = profiles[idx]
-            p.ptype = "VLESS"
-            p.address = f"{server}:{port}"
-            p.remark = remark
-            self._set_profiles(profiles)
-            self._refresh_profile_info_ui()
-        except Exception:
-            pass
+    def _update_profile_info_from_node(self, idx, profile: Profile, node: VlessNode):
+        # профиль могли удалить или сдвинуть, пока шло подключение
+        if self.profiles.get(idx) is not profile:
+            return
+        # тот же узел, что в прошлый раз, — ни записи в файл, ни перерисовки
+        self.profiles.update(
+            idx, ptype="VLESS", address=node.address, remark=node.remark
+        )
 
-    def _connect_worker(self, url: str, base_dir: Path, sing_box_exe: Path, idx: int):
+    def _connect_worker(self, profile: Profile, sing_box_exe, idx: int):
         try:
-            self.append_log("Скачиваю подписку...\n")
-            with urllib.request.urlopen(url) as resp:
-                sub_bytes = resp.read()
-
-            vless = decode_subscription_to_vless(sub_bytes)
-            self.append_log(f"VLESS: {vless}\n")
-
-            # обновим инфо по профилю
-            self.after(0, lambda: self._update_profile_info_from_vless(idx, vless))
-
-            cfg_dict = build_singbox_config(
-                vless_url=vless,
-                ru_mode=self.config_data.get("ru_mode", True),
-                site_excl=self.config_data.get("site_exclusions", []),
-                app_excl=self.config_data.get("app_exclusions", []),
-            )
-            cfg_path = base_dir / "config.json"
-            cfg_path.write_text(
-                json.dumps(cfg_dict, ensure_ascii=False, indent=2),
-                encoding="utf-8",
-            )
-            self.append_log("config.json сгенерирован.\n")
-
-            self.append_log("Запускаю sing-box...\n")
-            env = os.environ.copy()
-            env["ENABLE_DEPRECATED_TUN_ADDRESS_X"] = "true"
-            env["ENABLE_DEPRECATED_DNS_SERVER_FORMAT"] = "true"
-            env["ENABLE_DEPRECATED_SPECIAL_OUTBOUNDS"] = "true"
-
-            creationflags = 0
-            startupinfo = None
-            if os.name == "nt":
-                creationflags = subprocess.CREATE_NO_WINDOW
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-            self.proc = subprocess.Popen(
-                [str(sing_box_exe), "run", "-c", str(cfg_path)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                env=env,
-                creationflags=creationflags,
-                startupinfo=startupinfo,
-            )
-
-            self.stop_log.clear()
-            self.log_thread = threading.Thread(
-                target=self._log_reader, daemon=True
+            self.core.connect(
+                profile,
+                sing_box_exe,
+                # обновим инфо по профилю
+                on_node=lambda node: self.after(
+                    0, lambda: self._update_profile_info_from_node(idx, profile, node)
+                ),
             )
-            self.log_thread.start()
-
             self.after(0, self._on_connected_ok)
 
         except Exception as e:
@@ -1344,40 +1867,50 @@ class VlfGui(tk.Tk):
         self.btn_tun_off.configure(state="normal")
         # обновляем IP при успешном подключении
         self._update_ip_async()
-
-    def _log_reader(self):
-        if not self.proc or not self.proc.stdout:
+        if self.core.running_ctx:
+            self._start_traffic(self.core.running_ctx["config"])
+
+    def _log_from_core(self, text):
+        # из рабочих потоков — через ту же очередь, что и stdout sing-box
+        self.log_queue.put(text)
+
+    def _on_singbox_lines(self, lines):
+        # строки копятся в очереди, GUI забирает их пачкой в _drain_log
+        # разбор для индекса — здесь, в потоке-читателе; GUI только раскладывает
+        self.log_queue.put_many(lines, [parse_line(line) for line in lines])
+        if self.log_sink is not None:
+            self.log_sink.write_lines(lines)
+        self.block_stats.add_lines(lines)
+
+    def _on_process_exit(self, proc=None):
+        # старый экземпляр после горячей замены — это не отключение
+        if proc is not None and proc is not self.proc:
             return
-        for line in self.proc.stdout:
-            if self.stop_log.is_set():
-                break
-            self.after(0, lambda l=line: self.append_log(l))
-        self.after(0, self._on_process_exit)
-
-    def _on_process_exit(self):
         if self.proc and self.proc.poll() is not None:
             code = self.proc.returncode
             self.append_log(f"\nsing-box завершился с кодом {code}\n")
-        self.proc = None
-        self.stop_log.set()
+        self.core.proc = None
+        self.core.stop_log.set()
         self.set_status("отключен", "red")
         self.toggle_var.set("Подключить")
         self.toggle_btn.configure(state="normal")
         self.btn_tun_on.configure(state="normal")
         self.btn_tun_off.configure(state="disabled")
         self.ip_var.set("IP: -")
+        self._stop_traffic()
 
     def disconnect(self):
         if not self.proc or self.proc.poll() is not None:
             self.append_log("\nУже отключен.\n")
-            self.proc = None
-            self.stop_log.set()
+            self.core.proc = None
+            self.core.stop_log.set()
             self.set_status("отключен", "red")
             self.toggle_var.set("Подключить")
             self.btn_tun_on.configure(state="normal")
             self.btn_tun_off.configure(state="disabled")
             self.toggle_btn.configure(state="normal")
             self.ip_var.set("IP: -")
+            self._stop_traffic()
             return
 
         self.append_log("\n=== Отключение... ===\n")
@@ -1391,63 +1924,72 @@ class VlfGui(tk.Tk):
 
     def _disconnect_worker(self):
         try:
-            if self.proc and self.proc.poll() is None:
-                try:
-                    self.proc.terminate()
-                except Exception:
-                    pass
-
-                try:
-                    self.proc.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    self.append_log(
-                        "sing-box не завершился, принудительное завершение...\n"
-                    )
-                    try:
-                        self.proc.kill()
-                    except Exception:
-                        pass
-
-            self.stop_log.set()
+            self.core.stop()
         finally:
             self.after(0, self._on_disconnected_manual)
 
     def _on_disconnected_manual(self):
-        self.proc = None
+        self.core.proc = None
         self.set_status("отключен", "red")
         self.toggle_var.set("Подключить")
         self.toggle_btn.configure(state="normal")
         self.btn_tun_on.configure(state="normal")
         self.btn_tun_off.configure(state="disabled")
         self.ip_var.set("IP: -")
+        self._stop_traffic()
         self.append_log("Туннель остановлен.\n")
 
+    # ---------- горячее применение исключений ----------
+
+    def _exclusions_changed(self):
+        self._save_config()
+        self._refresh_exclusions_ui()
+        self._schedule_hot_apply()
+
+    def _schedule_hot_apply(self):
+        """Правки исключений/RU-режима на работающем туннеле — с задержкой, пачкой."""
+        if not self.config_data.get("hot_apply", True):
+            return
+        if not (self.core.running and self.core.running_ctx):
+            return
+        if self._hot_apply_job is not None:
+            self.after_cancel(self._hot_apply_job)
+        self._hot_apply_job = self.after(HOT_APPLY_DELAY_MS, self._start_hot_apply)
+
+    def _start_hot_apply(self):
+        self._hot_apply_job = None
+        threading.Thread(target=self._hot_apply_worker, daemon=True).start()
+
+    def _hot_apply_worker(self):
+        if not self.core.hot_apply():
+            self.after(0, self._schedule_hot_apply)   # идёт замена — повторим после
+
     # ---------- закрытие окна ----------
 
     def on_close(self):
-        if self.proc and self.proc.poll() is not None:
+        if self.core.running:
             try:
                 self.append_log(
                     "\n=== Закрытие приложения, отключаю VPN... ===\n"
                 )
             except Exception:
                 pass
-            try:
-                self.proc.terminate()
-                self.proc.wait(timeout=3)
-            except Exception:
-                try:
-                    self.proc.kill()
-                except Exception:
-                    pass
+        self.core.stop(timeout=3)
 
-        self.stop_log.set()
+        self._stop_traffic()
+        self.core.close()
+        if self.log_sink is not None:
+            self.log_sink.close()
+        self.config_writer.close()
         self.destroy()
 
 
 def main():
-    app = VlfGui()
+    report = "--startup-report" in sys.argv[1:]
+    app = VlfGui(startup_report=report)
     app.mainloop()
+    if report:
+        sys.exit(1 if app.startup.over_budget() else 0)
 
 
 if __name__ == "__main__":